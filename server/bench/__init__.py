@@ -0,0 +1,3 @@
+"""
+离线基准测试工具：本地模拟 LLM 服务、合成 PDF 语料与流水线吞吐测量
+"""
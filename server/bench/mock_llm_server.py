@@ -0,0 +1,312 @@
+"""
+本地 OpenAI 兼容模拟服务
+实现 /v1/chat/completions（含流式 SSE），可配置延迟分布、错误率、429 比例、输出速度与固定答案，
+用于在不调用真实大模型的情况下测量流水线吞吐
+
+单独运行：
+    python -m bench.mock_llm_server --port 9000 --latency-median 0.8 --rate-limit-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+@dataclass
+class MockOptions:
+    """模拟服务参数"""
+    latency_median: float = 0.5     # 首 token 延迟中位数（秒），对数正态分布
+    latency_sigma: float = 0.3      # 对数正态分布的 sigma，0 表示固定延迟
+    tokens_per_sec: float = 200.0   # 输出速度（token/秒），0 表示不模拟生成耗时
+    error_rate: float = 0.0         # 返回 500 的比例
+    rate_limit_rate: float = 0.0    # 返回 429 的比例
+    answers: Dict[str, str] = field(default_factory=dict)  # 字段 -> 固定答案
+    prompt_cache: bool = True       # 模拟服务商前缀缓存：与之前的请求相同的最长前缀计为缓存命中
+    prompt_cache_min_tokens: int = 1024   # 前缀缓存的最小长度（token），短于此长度的前缀不缓存
+    prompt_cache_block_tokens: int = 128  # 缓存命中长度的粒度（token）
+    seed: Optional[int] = None
+
+
+class MockStats:
+    """请求统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+            }
+
+
+def approx_tokens(text: str) -> int:
+    """近似 token 数（与流水线的备用估算一致）"""
+    return max(1, len(text) // 2)
+
+
+def requested_fields(body: Dict) -> List[str]:
+    """从请求中推断需要返回的字段：优先 JSON Schema，其次 prompt 中的字段列表，最后合并请求中的 JSON 键"""
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema") or {}
+    if schema.get("properties"):
+        return list(schema["properties"])
+
+    text = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+    match = re.search(r"提取字段：([^\n]+)", text)
+    if match:
+        return [name.strip() for name in match.group(1).split(",") if name.strip()]
+
+    match = re.search(r"\[\s*\{.*\}\s*\]", text, re.S)
+    if match:
+        try:
+            keys: List[str] = []
+            for item in json.loads(match.group(0)):
+                keys += [key for key in item if key not in keys]
+            return keys
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    return []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):  # noqa: A002 - 覆盖基类签名
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        options: MockOptions = self.server.options
+        stats: MockStats = self.server.stats
+        rng: random.Random = self.server.rng
+
+        prompt_text = "".join(str(message.get("content", "")) for message in body.get("messages", []))
+        stats.add(requests=1, prompt_tokens=approx_tokens(prompt_text))
+
+        with self.server.rng_lock:
+            roll = rng.random()
+            latency = options.latency_median * (rng.lognormvariate(0, options.latency_sigma) if options.latency_sigma > 0 else 1.0)
+
+        if roll < options.rate_limit_rate:
+            stats.add(rate_limited=1)
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}, {"retry-after-ms": "50"})
+            return
+        if roll < options.rate_limit_rate + options.error_rate:
+            stats.add(errors=1)
+            self._send_json(500, {"error": {"message": "Internal server error", "type": "server_error"}})
+            return
+
+        cached_tokens = self._cached_prefix_tokens(prompt_text) if options.prompt_cache else 0
+        fields = requested_fields(body)
+        content = json.dumps({name: options.answers.get(name, f"{name} of the paper") for name in fields}, ensure_ascii=False)
+        completion_tokens = approx_tokens(content)
+        stats.add(completion_tokens=completion_tokens, cached_tokens=cached_tokens)
+        usage = {
+            "prompt_tokens": approx_tokens(prompt_text),
+            "completion_tokens": completion_tokens,
+            "total_tokens": approx_tokens(prompt_text) + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+        time.sleep(latency)
+        if body.get("stream"):
+            self._send_stream(body, content, usage)
+            return
+
+        if options.tokens_per_sec > 0:
+            time.sleep(completion_tokens / options.tokens_per_sec)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _cached_prefix_tokens(self, prompt_text: str) -> int:
+        """
+        前缀缓存（按服务商规则简化）：prompt 至少 prompt_cache_min_tokens 才缓存，
+        命中长度为与之前请求相同的最长前缀，按 prompt_cache_block_tokens 向下取整
+        """
+        options: MockOptions = self.server.options
+        # approx_tokens 按 2 字符 / token 估算
+        block_chars = max(1, options.prompt_cache_block_tokens) * 2
+        min_chars = max(block_chars, options.prompt_cache_min_tokens * 2)
+        if len(prompt_text) < min_chars:
+            return 0
+        # 逐块累加哈希，只保存各前缀的摘要
+        digest = hashlib.sha1(prompt_text[:min_chars - block_chars].encode("utf-8"))
+        prefixes = []
+        for end in range(min_chars, len(prompt_text) + 1, block_chars):
+            digest.update(prompt_text[end - block_chars:end].encode("utf-8"))
+            prefixes.append((end, digest.copy().hexdigest()))
+        cached = 0
+        with self.server.rng_lock:
+            for end, key in prefixes:
+                if key not in self.server.prefixes:
+                    break
+                cached = end
+            self.server.prefixes.update(key for _, key in prefixes)
+        return cached // 2
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body: Dict, content: str, usage: Dict) -> None:
+        """按输出速度分片发送 SSE"""
+        options: MockOptions = self.server.options
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: Dict, finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            piece_size = 4
+            for i in range(0, len(content), piece_size):
+                if options.tokens_per_sec > 0:
+                    time.sleep(approx_tokens(content[i:i + piece_size]) / options.tokens_per_sec)
+                event({"content": content[i:i + piece_size]})
+            event({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                               "model": body.get("model", "mock"), "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束读取（如增量解析已拿到完整 JSON）
+            pass
+
+
+class MockLLMServer:
+    """
+    模拟服务（后台线程运行）
+
+    用法：
+        server = MockLLMServer(MockOptions(latency_median=0.2))
+        base_url = server.start()      # http://127.0.0.1:<port>/v1
+        ...
+        server.stop()
+    """
+
+    def __init__(self, options: Optional[MockOptions] = None, host: str = "127.0.0.1", port: int = 0):
+        self.options = options or MockOptions()
+        self.stats = MockStats()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.options = self.options
+        self._httpd.stats = self.stats
+        self._httpd.rng = random.Random(self.options.seed)
+        self._httpd.rng_lock = threading.Lock()
+        self._httpd.prefixes = set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """注册模拟服务相关的命令行参数（基准测试脚本复用）"""
+    parser.add_argument("--latency-median", type=float, default=0.5, help="首 token 延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="延迟对数正态分布 sigma")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="输出速度（token/秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--answers", default="", help="固定答案 JSON 文件（字段 -> 值）")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="不模拟服务商前缀缓存")
+    parser.add_argument("--prompt-cache-min-tokens", type=int, default=1024, help="前缀缓存的最小长度（token）")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def options_from_args(args: argparse.Namespace) -> MockOptions:
+    answers = {}
+    if args.answers:
+        with open(args.answers, "r", encoding="utf-8") as f:
+            answers = json.load(f)
+    return MockOptions(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        answers=answers,
+        prompt_cache=not args.no_prompt_cache,
+        prompt_cache_min_tokens=args.prompt_cache_min_tokens,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(options_from_args(args), host=args.host, port=args.port)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,159 @@
+"""
+PDF 后端基准测试
+在同一批 PDF 上分别运行每个已安装的提取后端，输出页/秒与文本质量指标（JSON），
+并给出推荐的默认后端（质量达标的后端中速度最快的），通过 PAPER_EXTRACT_PDF_BACKEND 设置
+
+文本质量（无标注语料时的近似指标）：
+    word_ratio   由字母 / 汉字组成的词占全部词的比例（乱码、粘连字符会降低该值）
+    garbage_ratio 控制字符与替换字符（U+FFFD）占全部字符的比例
+    agreement    与其他后端提取结果的词频重合度（多数后端一致的文本更可信）
+
+用法（在 server 目录下）：
+    python -m bench.pdf_backends_bench --papers 10 --sizes small,medium
+    python -m bench.pdf_backends_bench --corpus ./my_pdfs --repeat 3 --output backends.json
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from bench.synthetic_pdf import SIZES, generate_corpus  # noqa: E402
+from services import pdf_backends  # noqa: E402
+
+
+# 推荐默认后端时要求的最低质量
+MIN_WORD_RATIO = 0.8
+MIN_AGREEMENT = 0.8
+
+_WORD = re.compile(r"^[A-Za-z][A-Za-z\-']*[.,;:)]?$|^[一-鿿]+[，。；：]?$")
+_GARBAGE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f�]")
+
+
+def text_quality(text: str) -> Dict:
+    """单个后端输出的质量指标"""
+    words = text.split()
+    return {
+        "chars": len(text),
+        "words": len(words),
+        "word_ratio": round(sum(1 for word in words if _WORD.match(word)) / len(words), 4) if words else 0.0,
+        "garbage_ratio": round(len(_GARBAGE.findall(text)) / len(text), 6) if text else 0.0,
+    }
+
+
+def agreement(a: Counter, b: Counter) -> float:
+    """两份文本的词频重合度（交集 / 并集）"""
+    union = sum((a | b).values())
+    return sum((a & b).values()) / union if union else 0.0
+
+
+def run(file_paths: List[str], backends: List[str], repeat: int) -> Dict:
+    per_backend: Dict[str, Dict] = {}
+    # 后端 -> 文件 -> 词频（用于计算后端之间的一致性）
+    words: Dict[str, Dict[str, Counter]] = {}
+    for name in backends:
+        extract = pdf_backends.get_extractor(name)
+        pages_total = 0
+        seconds = 0.0
+        failures = []
+        texts: Dict[str, str] = {}
+        for path in file_paths:
+            try:
+                # 取多次运行中最快的一次，减少磁盘缓存和调度抖动的影响
+                best = None
+                for _ in range(max(1, repeat)):
+                    begin = time.perf_counter()
+                    pages = extract(path)
+                    elapsed = time.perf_counter() - begin
+                    best = elapsed if best is None else min(best, elapsed)
+                seconds += best
+                pages_total += len(pages)
+                texts[path] = "\n".join(pages)
+            except Exception as e:
+                failures.append({"file": path, "error": str(e)})
+
+        combined = "\n".join(texts.values())
+        per_backend[name] = {
+            "files": len(texts),
+            "failed": failures,
+            "pages": pages_total,
+            "seconds": round(seconds, 4),
+            "pages_per_sec": round(pages_total / seconds, 2) if seconds > 0 else 0.0,
+            "empty_files": sum(1 for text in texts.values() if not text.strip()),
+            **text_quality(combined),
+        }
+        words[name] = {path: Counter(text.split()) for path, text in texts.items()}
+
+    # 与其他后端的平均一致性
+    for name in backends:
+        scores = [
+            agreement(words[name][path], words[other][path])
+            for other in backends if other != name
+            for path in words[name] if path in words[other]
+        ]
+        per_backend[name]["agreement"] = round(sum(scores) / len(scores), 4) if scores else None
+
+    qualified = [
+        name for name in backends
+        if not per_backend[name]["failed"] and not per_backend[name]["empty_files"]
+        and per_backend[name]["word_ratio"] >= MIN_WORD_RATIO
+        and (per_backend[name]["agreement"] is None or per_backend[name]["agreement"] >= MIN_AGREEMENT)
+    ]
+    recommended = max(qualified, key=lambda name: per_backend[name]["pages_per_sec"], default=None)
+    return {
+        "files": len(file_paths),
+        "repeat": repeat,
+        "default_backend": pdf_backends.get_default_backend(),
+        "recommended": recommended,
+        "backends": per_backend,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="PDF 提取后端基准测试：速度（页/秒）与文本质量")
+    parser.add_argument("--papers", type=int, default=10, help="合成论文数量")
+    parser.add_argument("--sizes", default="small,medium,large", help=f"语料规模，逗号分隔（{', '.join(SIZES)}）")
+    parser.add_argument("--corpus", default="", help="使用已有 PDF 目录代替合成语料")
+    parser.add_argument("--backends", default="", help="参与测试的后端，逗号分隔，默认所有已安装的后端")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文件重复解析次数（取最快一次）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="结果输出文件，默认打印到标准输出")
+    args = parser.parse_args()
+
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()] or pdf_backends.available_backends()
+    missing = [name for name in backends if name not in pdf_backends.BACKENDS or not pdf_backends.is_available(name)]
+    if missing:
+        print(f"[bench] 后端不可用: {', '.join(missing)}（已安装: {', '.join(pdf_backends.available_backends())}）", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="paper-extract-pdf-bench-") as data_dir:
+        if args.corpus:
+            file_paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))[:args.papers or None]
+        else:
+            sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+            file_paths = generate_corpus(os.path.join(data_dir, "corpus"), args.papers, sizes, seed=args.seed)
+        report = run(file_paths, backends, args.repeat)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[bench] 结果已保存到: {args.output}")
+    else:
+        print(text)
+    if report["recommended"]:
+        print(f"[bench] 推荐默认后端: {report['recommended']}（设置环境变量 PAPER_EXTRACT_PDF_BACKEND={report['recommended']}）", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+离线基准测试
+启动本地模拟服务 + 生成合成 PDF 语料，跑完整的 run_pipeline，
+输出吞吐、单篇延迟、LLM 调用次数、发送 token 数以及各阶段耗时与峰值内存（JSON），便于跨提交对比
+
+用法（在 server 目录下）：
+    python -m bench.run_benchmark --papers 20 --sizes small,medium,large
+    python -m bench.run_benchmark --papers 50 --latency-median 1.0 --rate-limit-rate 0.05 --output bench.json
+    python -m bench.run_benchmark --corpus ./my_pdfs --stream
+"""
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from bench.mock_llm_server import MockLLMServer, add_mock_arguments, options_from_args  # noqa: E402
+from bench.synthetic_pdf import SIZES, generate_corpus  # noqa: E402
+
+
+DEFAULT_FIELDS = ["标题", "作者", "摘要", "研究方法", "数据集", "结论"]
+
+# 计时的流水线阶段：PDF 解析、分块、Map 提取、Reduce 合并
+STAGES = ["parse", "normalize", "chunk", "map", "reduce"]
+
+
+def read_rss() -> Optional[int]:
+    """读取当前进程常驻内存（字节）：psutil -> /proc/self/statm -> resource（峰值）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+class StageRecorder:
+    """
+    阶段计时与内存采样
+    记录每个阶段的调用次数与累计耗时（并发阶段为各线程耗时之和），
+    后台线程定期采样 RSS，并计入当前活跃的所有阶段的峰值
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        self.stats = {stage: {"calls": 0, "seconds": 0.0, "peak_rss": 0} for stage in STAGES}
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._record_rss()
+
+    def _record_rss(self) -> None:
+        rss = read_rss() or 0
+        with self._lock:
+            for stage, count in self._active.items():
+                if count > 0 and rss > self.stats[stage]["peak_rss"]:
+                    self.stats[stage]["peak_rss"] = rss
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        """包装同步函数，记录所属阶段的耗时与内存"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self._active[stage] = self._active.get(stage, 0) + 1
+            self._record_rss()
+            begin = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - begin
+                self._record_rss()
+                with self._lock:
+                    self._active[stage] -= 1
+                    self.stats[stage]["calls"] += 1
+                    self.stats[stage]["seconds"] += elapsed
+        return wrapper
+
+    def report(self) -> Dict:
+        return {
+            stage: {
+                "calls": item["calls"],
+                "seconds": round(item["seconds"], 4),
+                "peak_rss_mb": round(item["peak_rss"] / 1024 / 1024, 1),
+            }
+            for stage, item in self.stats.items()
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args: argparse.Namespace, data_dir: str) -> Dict:
+    # 服务模块在设置好数据目录后再导入
+    from services import config_service, llm_service, pdf_parser, pipeline, text_normalizer
+
+    mock = MockLLMServer(options_from_args(args))
+    base_url = mock.start()
+
+    await config_service.save_config(
+        model_name=args.model, api_key="sk-bench", config_name="bench", provider="openai",
+        base_url=base_url, max_tokens=args.max_tokens, overlap=args.overlap, concurrency=args.concurrency,
+    )
+
+    if args.corpus:
+        file_paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))[:args.papers or None]
+    else:
+        sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+        file_paths = generate_corpus(os.path.join(data_dir, "corpus"), args.papers, sizes, seed=args.seed)
+
+    # 替换流水线中的阶段函数以计时（模块属性在调用时查找）
+    recorder = StageRecorder()
+    originals = {
+        (pdf_parser, "parse_pdf_pages_cached"): pdf_parser.parse_pdf_pages_cached,
+        (text_normalizer, "normalize_pages"): text_normalizer.normalize_pages,
+        (llm_service, "split_by_tokens"): llm_service.split_by_tokens,
+        (llm_service, "extract_from_chunk"): llm_service.extract_from_chunk,
+        (llm_service, "merge_results"): llm_service.merge_results,
+        (llm_service, "extract_fields_advanced"): llm_service.extract_fields_advanced,
+    }
+    use_cache = args.use_cache
+    paper_started: Dict[str, float] = {}
+    paper_latencies: List[float] = []
+
+    def parse_pdf(path: str, select=None):
+        paper_started["current"] = time.perf_counter()
+        if use_cache:
+            return originals[(pdf_parser, "parse_pdf_pages_cached")](path, select)
+        return pdf_parser.parse_pdf_pages(path, select=select)
+
+    async def extract_fields_advanced(*a, **kw):
+        try:
+            return await originals[(llm_service, "extract_fields_advanced")](*a, **kw)
+        finally:
+            paper_latencies.append(time.perf_counter() - paper_started.get("current", time.perf_counter()))
+
+    pdf_parser.parse_pdf_pages_cached = recorder.wrap("parse", parse_pdf)
+    text_normalizer.normalize_pages = recorder.wrap("normalize", originals[(text_normalizer, "normalize_pages")])
+    llm_service.split_by_tokens = recorder.wrap("chunk", originals[(llm_service, "split_by_tokens")])
+    llm_service.extract_from_chunk = recorder.wrap("map", originals[(llm_service, "extract_from_chunk")])
+    llm_service.merge_results = recorder.wrap("reduce", originals[(llm_service, "merge_results")])
+    llm_service.extract_fields_advanced = extract_fields_advanced
+
+    recorder.start()
+    begin = time.perf_counter()
+    try:
+        result = await pipeline.run_pipeline(file_paths, args.fields, stream=args.stream)
+    finally:
+        wall = time.perf_counter() - begin
+        recorder.stop()
+        for (module, name), func in originals.items():
+            setattr(module, name, func)
+        mock.stop()
+
+    server_stats = mock.stats.to_dict()
+    papers_done = len(result.get("results", []))
+    per_paper = max(1, papers_done)
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "papers": len(file_paths),
+            "sizes": args.sizes if not args.corpus else "corpus",
+            "fields": args.fields,
+            "model": args.model,
+            "max_tokens": args.max_tokens,
+            "overlap": args.overlap,
+            "concurrency": args.concurrency,
+            "stream": args.stream,
+            "use_cache": use_cache,
+            "mock": {**vars(options_from_args(args)), "answers": bool(args.answers)},
+        },
+        "error": result.get("error"),
+        "normalize_tokens_saved": result.get("normalization", {}).get("tokens_saved", 0),
+        "papers_done": papers_done,
+        "wall_seconds": round(wall, 3),
+        "papers_per_min": round(papers_done / wall * 60, 2) if wall > 0 else 0.0,
+        "latency": {
+            "p50": round(percentile(paper_latencies, 50), 3),
+            "p95": round(percentile(paper_latencies, 95), 3),
+            "max": round(max(paper_latencies, default=0.0), 3),
+        },
+        "llm": {
+            "calls": server_stats["requests"],
+            "calls_per_paper": round(server_stats["requests"] / per_paper, 2),
+            "errors": server_stats["errors"],
+            "rate_limited": server_stats["rate_limited"],
+            # 模拟服务按 字符数/2 近似计算 token
+            "prompt_tokens": server_stats["prompt_tokens"],
+            "prompt_tokens_per_paper": round(server_stats["prompt_tokens"] / per_paper, 1),
+            "completion_tokens": server_stats["completion_tokens"],
+            # 模拟的前缀缓存命中（system 消息与之前的请求相同）
+            "cached_prompt_tokens": server_stats["cached_tokens"],
+        },
+        "stages": recorder.report(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="离线基准测试：模拟 LLM 服务 + 合成 PDF 跑完整流水线")
+    parser.add_argument("--papers", type=int, default=10, help="论文数量")
+    parser.add_argument("--sizes", default="small,medium,large", help=f"语料规模，逗号分隔（{', '.join(SIZES)}）")
+    parser.add_argument("--corpus", default="", help="使用已有 PDF 目录代替合成语料")
+    parser.add_argument("--fields", type=lambda s: [f.strip() for f in s.split(",") if f.strip()], default=DEFAULT_FIELDS,
+                        help="提取字段，逗号分隔")
+    parser.add_argument("--model", default="gpt-4o-mini", help="配置中的模型名（决定分块大小与结构化输出方式）")
+    parser.add_argument("--max-tokens", type=int, default=10000, help="分块大小上限")
+    parser.add_argument("--overlap", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4, help="单篇论文的分块并发数")
+    parser.add_argument("--stream", action="store_true", help="使用流式响应")
+    parser.add_argument("--use-cache", action="store_true", help="PDF 解析使用文本缓存（默认关闭，测量真实解析耗时）")
+    parser.add_argument("--output", default="", help="结果输出文件，默认打印到标准输出")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="paper-extract-bench-") as data_dir:
+        os.environ["PAPER_EXTRACT_DATA_DIR"] = data_dir
+        report = asyncio.run(run(args, data_dir))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[bench] 结果已保存到: {args.output}")
+    else:
+        print(text)
+    return 0 if not report.get("error") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+合成 PDF 生成
+不依赖第三方库，直接写出最小的文本型 PDF（Helvetica 字体），
+用于基准测试的可复现语料：首页包含标题、作者、摘要，正文若干页，末尾为参考文献
+"""
+import os
+import random
+from typing import List
+
+
+WORDS = (
+    "model data neural network graph token method result training inference dataset "
+    "attention transformer baseline evaluation accuracy latency throughput retrieval "
+    "extraction document paper experiment analysis feature embedding encoder decoder"
+).split()
+
+# 预设规模：名称 -> 页数
+SIZES = {"small": 4, "medium": 12, "large": 40}
+
+LINES_PER_PAGE = 55
+WORDS_PER_LINE = 12
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(rng: random.Random, page_index: int, page_count: int, title: str) -> List[str]:
+    """生成单页文本行（含页眉页脚）"""
+    lines = [f"{title} - Preprint", ""]
+    if page_index == 0:
+        lines += [
+            title,
+            "Alice Zhang, Bob Li, Carol Wang",
+            "Department of Computer Science, Example University",
+            "Abstract",
+        ]
+    elif page_index == page_count - 1:
+        lines += ["References"]
+        lines += [f"[{i + 1}] A. Author. A study of {rng.choice(WORDS)} {rng.choice(WORDS)}. 2021." for i in range(20)]
+
+    while len(lines) < LINES_PER_PAGE:
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)))
+    lines.append(f"{page_index + 1}")
+    return lines
+
+
+def make_pdf(path: str, pages: List[List[str]]) -> None:
+    """
+    写出文本型 PDF
+
+    Args:
+        path: 输出路径
+        pages: 每页的文本行列表
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_refs = []
+    for lines in pages:
+        text = " ".join(f"({_escape(line)}) '" for line in lines)
+        stream = f"BT /F1 9 Tf 40 780 Td 13 TL {text} ET".encode("latin-1", "replace")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_refs.append((add(b""), content_id))
+
+    pages_id = add(b"")
+    for page_id, content_id in page_refs:
+        objects[page_id - 1] = (
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        )
+    kids = b" ".join(b"%d 0 R" % page_id for page_id, _ in page_refs)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for index, body in enumerate(objects):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % (index + 1) + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def generate_corpus(output_dir: str, papers: int, sizes: List[str], seed: int = 0) -> List[str]:
+    """
+    生成合成论文语料（按 sizes 循环分配规模）
+
+    Args:
+        output_dir: 输出目录
+        papers: 论文数量
+        sizes: 规模列表（small / medium / large）
+        seed: 随机种子，保证多次运行语料一致
+
+    Returns:
+        生成的 PDF 路径列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(papers):
+        size = sizes[index % len(sizes)]
+        page_count = SIZES[size]
+        title = f"Synthetic Study {index} on {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+        pages = [_page_lines(rng, page, page_count, title) for page in range(page_count)]
+        path = os.path.join(output_dir, f"paper_{index:04d}_{size}.pdf")
+        make_pdf(path, pages)
+        paths.append(path)
+    return paths
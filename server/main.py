@@ -2,34 +2,53 @@
 FastAPI 主入口文件
 提供三个 API 端点：/api/analyze, /api/config/save, /api/env/check
 """
-# Windows 下设置 stdout 编码为 UTF-8
-import sys
-import io
-if sys.platform == "win32":
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-
 import time
 start = time.time()
-# print("========== FastAPI start ==========")
-# print("测试中文输出是否正常")
-# print("start import module...")
-
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi import WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
-from typing import List, Optional
+
+# 启动耗时统计（需最先导入）；pandas / langchain / tiktoken 等重量级依赖改为首次使用时导入，
+# 并在端口绑定后由后台线程预热
+from services import startup
+from services.logger import get_logger, setup_logging
+
+# 分级日志：队列异步写控制台和数据目录 logs/server.log（Windows 下控制台编码在此设置为 UTF-8）
+setup_logging()
+logger = get_logger("main")
+
+with startup.timed("fastapi"):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import PlainTextResponse
+    from fastapi import WebSocket, WebSocketDisconnect
+    from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import asyncio
 import json
 import os
 from datetime import datetime
-import pandas as pd
 
-from services import pipeline, config_service, env_service
-from services.log_service import manager, push_log, push_progress
+with startup.timed("services"):
+    from services import pipeline, config_service, env_service, model_registry, metrics
+    from services.log_service import manager, push_log, push_progress
+    from services.discovery import DiscoveryFilter
+    from services.text_normalizer import NormalizeOptions
+    from services.retrieval import RetrievalOptions
+    from services import page_scope, prompt_templates
+    from services.hedging import HedgePolicy
+    from services.field_groups import plan_field_groups
+    from services import watcher, result_store
+
 
-#print(f"import module finish, use time: {time.time() - start:.2f}s")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台预热线程；退出时停止文件夹监视"""
+    startup.start_warmup()
+    yield
+    await watcher.stop_watch()
+    result_store.close()
 
-app = FastAPI(title="论文提取 API")
+
+app = FastAPI(title="论文提取 API", lifespan=lifespan)
 
 # CORS 配置
 app.add_middleware(
@@ -43,8 +62,17 @@ app.add_middleware(
 
 # 数据模型
 class AnalyzeRequest(BaseModel):
-    file_paths: List[str]
+    file_paths: List[str] = []
     fields: List[str]
+    # 目录 / glob 模式（如 D:/papers、D:/papers/**/*.pdf）：服务端流式发现文件，边发现边解析
+    sources: List[str] = []
+    # 文件发现过滤条件（0 / 空表示不限制）；修改时间为 ISO 格式，如 2024-01-01 或 2024-01-01T08:00:00
+    min_size_kb: int = 0
+    max_size_mb: float = 0
+    modified_after: Optional[str] = None
+    modified_before: Optional[str] = None
+    max_files: int = 0
+    recursive: bool = True
     save_path: Optional[str] = None
     save_format: Optional[str] = "json"
     # 配置信息（使用当前页面配置）
@@ -56,6 +84,56 @@ class AnalyzeRequest(BaseModel):
     temperature: float = 0.1
     max_tokens: int = 10000
     overlap: int = 500
+    # 端点池模式：列出多个配置名称，请求在这些端点之间分发并自动故障切换
+    pool_profiles: List[str] = []
+    pool_strategy: str = "round_robin"
+    # 流式响应：边接收边解析 JSON，截断时立即重试
+    stream: bool = False
+    # 近似重复检测：内容哈希不同但解析出的文本相同的文件只提取一次
+    near_duplicates: bool = False
+    # 提取模式：map_reduce（所有分块都发送给模型）/ retrieval（按字段检索 top-k 相关段落，长文档调用次数更少）
+    extraction_mode: str = "map_reduce"
+    retrieval_top_k: int = 3
+    # 字段说明（可选），检索模式下与字段名一起作为检索词，如 {"数据集": "实验使用的公开数据集名称"}
+    field_descriptions: Dict[str, str] = {}
+    # 页面范围：字段 -> all / first:N / last:N / A-B，如 {"标题": "first:2", "参考文献数量": "last:3"}；
+    # auto_page_scopes 为 true 时标题、作者、摘要等首页字段默认只看前两页。只解码并发送需要的页面
+    field_scopes: Dict[str, str] = {}
+    auto_page_scopes: bool = False
+    # 字段分组：字段较多时每个分块按组拆成多个并发的短请求；field_groups 指定分组，其余字段每组最多 max_fields_per_group 个（0 为默认 8）
+    field_groups: List[List[str]] = []
+    max_fields_per_group: int = 0
+    # prompt 模板版本（v1 单消息布局 / v2 固定前缀布局 / 自定义版本），为空时取 PAPER_EXTRACT_PROMPT_VERSION（默认 v2）
+    prompt_version: str = ""
+    # 对冲请求：Map 调用超过最近延迟的 hedge_percentile 分位数（不低于 hedge_min_delay 秒）仍未返回时再发送一个相同的请求，
+    # 先返回的胜出；hedge_profile 指定对冲请求使用的配置（为空时使用原端点）
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_delay: float = 2.0
+    hedge_profile: str = ""
+    # 文本规范化：去除页眉页脚 / 页码、合并断行连字符、压缩空白；可选删除参考文献和附录以进一步减少 token
+    normalize: bool = True
+    drop_references: bool = False
+    drop_appendix: bool = False
+    # 性能剖析：记录本次运行的 CPU 剖析与内存分配快照，结果保存在数据目录 profiles/ 下
+    profile: bool = False
+
+
+class EstimateRequest(BaseModel):
+    file_paths: List[str]
+    fields: List[str]
+    # 以下选项与 AnalyzeRequest 含义相同，按提取时相同的规划预估
+    extraction_mode: str = "map_reduce"
+    retrieval_top_k: int = 3
+    field_descriptions: Dict[str, str] = {}
+    field_scopes: Dict[str, str] = {}
+    auto_page_scopes: bool = False
+    field_groups: List[List[str]] = []
+    max_fields_per_group: int = 0
+    prompt_version: str = ""
+    normalize: bool = True
+    drop_references: bool = False
+    drop_appendix: bool = False
 
 
 class ConfigRequest(BaseModel):
@@ -67,11 +145,46 @@ class ConfigRequest(BaseModel):
     temperature: float = 0.1
     max_tokens: int = 10000
     overlap: int = 500
+    concurrency: int = 4
+    weight: int = 1
 
 
 class AnalyzeResponse(BaseModel):
     success: bool
     message: str
+    # 解析结果（run_id、逐文件结果、用量、文本规范化报告等）
+    data: Optional[dict] = None
+    profile: Optional[dict] = None
+
+class WatchRequest(BaseModel):
+    folders: List[str]
+    fields: List[str]
+    interval: float = 10.0
+    debounce: float = 5.0
+    recursive: bool = True
+    # 结果追加写入的 JSONL 文件，默认数据目录 watch/results.jsonl
+    export_path: str = ""
+    pool_profiles: List[str] = []
+    stream: bool = False
+
+
+class WatchResponse(BaseModel):
+    success: bool
+    message: str
+    data: Optional[dict] = None
+
+
+class ResultsExportRequest(BaseModel):
+    run_id: int
+    save_path: str
+    save_format: Optional[str] = "json"
+
+
+class ResultsResponse(BaseModel):
+    success: bool
+    message: str
+    data: Optional[dict] = None
+
 
 class ConfigResponse(BaseModel):
     success: bool
@@ -84,6 +197,12 @@ class EnvCheckResponse(BaseModel):
     data: Optional[dict] = None
 
 
+class EstimateResponse(BaseModel):
+    success: bool
+    message: str
+    data: Optional[dict] = None
+
+
 class TestConnectionResponse(BaseModel):
     success: bool
     message: str
@@ -93,25 +212,149 @@ class TestConnectionResponse(BaseModel):
 @app.get("/")
 async def root():
     """根路径健康检查"""
+    startup.mark_ready()
     return {"status": "ok", "message": "论文提取 API 服务运行中"}
 
 
 @app.head("/")
 async def root_head():
     """根路径健康检查（HEAD 方法，用于 wait-on 检测）"""
+    startup.mark_ready()
     return {"status": "ok"}
 
 
+@app.get("/api/startup")
+async def startup_report():
+    """启动耗时报告：各 import 耗时、首次健康检查耗时、后台预热耗时"""
+    return {
+        "success": True,
+        "data": startup.report()
+    }
+
+
 @app.post("/api/analyze", response_model=AnalyzeResponse)
 async def analyze(request: AnalyzeRequest):
     """
     文章解析接口
-    调用 pipeline.run_pipeline() 执行完整的解析流水线
+    调用 pipeline.run_pipeline() 执行完整的解析流水线；profile=true 时附带性能剖析结果路径
     """
+    if not request.profile:
+        return await run_analyze(request)
+
+    from services.profiler import RunProfiler
+    first_source = (request.file_paths or request.sources or [""])[0]
+    label = os.path.splitext(os.path.basename(first_source.rstrip("/\\")))[0]
+    profiler = RunProfiler(label)
+    if not profiler.start():
+        response = await run_analyze(request)
+        response.message += "（已有剖析任务在运行，本次未剖析）"
+        return response
+
+    artifacts = None
     try:
+        response = await run_analyze(request)
+    finally:
+        # 剖析失败不影响解析结果
+        try:
+            artifacts = profiler.stop()
+        except Exception as e:
+            logger.warning("保存性能剖析结果失败: %s", e)
+    if artifacts is None:
+        response.message += "（性能剖析结果保存失败）"
+        return response
+    await push_log("analyze", f"性能剖析结果已保存到: {artifacts['dir']}（包含剖析期间服务处理的所有请求）")
+    response.profile = artifacts
+    return response
+
+
+def write_export(result: dict, save_path: str, save_format: str = "json") -> str:
+    """
+    把解析结果保存为 JSON / Excel 文件
+
+    Returns:
+        保存的文件路径
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    with metrics.span("export", format=save_format):
+        if save_format == "excel":
+            import pandas as pd
+
+            # 保存为 Excel 文件
+            file_name = f"extract_result_{timestamp}.xlsx"
+            full_path = os.path.join(save_path, file_name)
+
+            # 转换为 DataFrame
+            rows = []
+            for item in result.get("results", []):
+                row = {"文件名": os.path.basename(item.get("file", ""))}
+                for field in result.get("fields", []):
+                    row[field] = item.get("extracted", {}).get(field, "")
+                rows.append(row)
+
+            df = pd.DataFrame(rows)
+            df.to_excel(full_path, index=False, engine='openpyxl')
+        else:
+            # 保存为 JSON 文件
+            file_name = f"extract_result_{timestamp}.json"
+            full_path = os.path.join(save_path, file_name)
+
+            with open(full_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+    return full_path
+
+
+async def run_analyze(request: AnalyzeRequest) -> AnalyzeResponse:
+    """执行解析流水线并按需保存结果"""
+    if not request.file_paths and not request.sources:
+        return AnalyzeResponse(success=False, message="解析失败: 请提供 file_paths 或 sources")
+    if request.extraction_mode not in ("map_reduce", "retrieval"):
+        return AnalyzeResponse(success=False, message=f"解析失败: 不支持的提取模式 {request.extraction_mode}")
+    try:
+        scope_plan = page_scope.plan_scopes(request.fields, request.field_scopes, request.auto_page_scopes)
+        prompt_templates.get_template(request.prompt_version)
+    except ValueError as e:
+        return AnalyzeResponse(success=False, message=f"解析失败: {str(e)}")
+
+    # 本次任务的阶段耗时、LLM 调用、缓存命中等指标，结束时汇总写入解析日志
+    job = metrics.start_job(len(request.file_paths))
+    job_status = "error"
+    try:
+        discovery_filter = DiscoveryFilter(
+            min_size=request.min_size_kb * 1024,
+            max_size=int(request.max_size_mb * 1024 * 1024),
+            modified_after=datetime.fromisoformat(request.modified_after).timestamp() if request.modified_after else None,
+            modified_before=datetime.fromisoformat(request.modified_before).timestamp() if request.modified_before else None,
+            max_files=request.max_files,
+            recursive=request.recursive,
+        )
         result = await pipeline.run_pipeline(
             file_paths=request.file_paths,
-            fields=request.fields
+            fields=request.fields,
+            pool_profiles=request.pool_profiles,
+            pool_strategy=request.pool_strategy,
+            stream=request.stream,
+            near_duplicates=request.near_duplicates,
+            sources=request.sources,
+            discovery_filter=discovery_filter,
+            normalize_options=NormalizeOptions(
+                enabled=request.normalize,
+                drop_references=request.drop_references,
+                drop_appendix=request.drop_appendix,
+            ),
+            retrieval_options=RetrievalOptions(
+                top_k=max(1, request.retrieval_top_k),
+                descriptions=request.field_descriptions,
+            ) if request.extraction_mode == "retrieval" else None,
+            scope_plan=scope_plan,
+            field_group_plan=plan_field_groups(request.fields, request.field_groups, request.max_fields_per_group),
+            prompt_version=request.prompt_version,
+            hedge_policy=HedgePolicy(
+                enabled=request.hedge,
+                percentile=request.hedge_percentile,
+                min_delay=request.hedge_min_delay,
+                profile=request.hedge_profile,
+            ) if request.hedge else None
         )
 
         # 检查是否有错误
@@ -124,31 +367,8 @@ async def analyze(request: AnalyzeRequest):
 
         # 如果指定了保存路径，保存文件
         if request.save_path and result:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            save_format = request.save_format or "json"
-
-            if save_format == "excel":
-                # 保存为 Excel 文件
-                file_name = f"extract_result_{timestamp}.xlsx"
-                full_path = os.path.join(request.save_path, file_name)
-
-                # 转换为 DataFrame
-                rows = []
-                for item in result.get("results", []):
-                    row = {"文件名": os.path.basename(item.get("file", ""))}
-                    for field in result.get("fields", []):
-                        row[field] = item.get("extracted", {}).get(field, "")
-                    rows.append(row)
-
-                df = pd.DataFrame(rows)
-                df.to_excel(full_path, index=False, engine='openpyxl')
-            else:
-                # 保存为 JSON 文件
-                file_name = f"extract_result_{timestamp}.json"
-                full_path = os.path.join(request.save_path, file_name)
-
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
+            full_path = write_export(result, request.save_path, request.save_format or "json")
+            job_status = "success"
 
             return AnalyzeResponse(
                 success=True,
@@ -156,6 +376,7 @@ async def analyze(request: AnalyzeRequest):
                 data=result
             )
 
+        job_status = "success"
         return AnalyzeResponse(
             success=True,
             message="解析完成",
@@ -166,6 +387,157 @@ async def analyze(request: AnalyzeRequest):
             success=False,
             message=f"解析失败: {str(e)}"
         )
+    finally:
+        metrics.finish_job(job, job_status)
+        await push_log("analyze", f"[metrics] {job.summary_text()}")
+
+
+@app.post("/api/watch/start", response_model=WatchResponse)
+async def start_watch(request: WatchRequest):
+    """
+    开始监视文件夹
+    定期检查文件夹中新增或变化的 PDF（写入稳定后），只提取未处理过的文件，结果追加到 JSONL 文件
+    """
+    missing = [folder for folder in request.folders if not os.path.isdir(folder)]
+    if not request.folders or missing:
+        return WatchResponse(success=False, message=f"文件夹不存在: {', '.join(missing) or '未指定'}")
+    if not request.fields:
+        return WatchResponse(success=False, message="请指定需要提取的字段")
+
+    status = await watcher.start_watch(watcher.WatchConfig(
+        folders=request.folders,
+        fields=request.fields,
+        interval=max(1.0, request.interval),
+        debounce=max(0.0, request.debounce),
+        recursive=request.recursive,
+        export_path=request.export_path,
+        pool_profiles=request.pool_profiles,
+        stream=request.stream,
+    ))
+    return WatchResponse(success=True, message="已开始监视", data=status)
+
+
+@app.post("/api/watch/stop", response_model=WatchResponse)
+async def stop_watch():
+    """停止监视文件夹"""
+    stopped = await watcher.stop_watch()
+    return WatchResponse(success=True, message="已停止监视" if stopped else "没有正在运行的监视任务", data=watcher.watch_status())
+
+
+@app.get("/api/watch/status", response_model=WatchResponse)
+async def get_watch_status():
+    """监视状态：监视的文件夹、待处理（防抖中）文件数、已处理 / 跳过数量、最近错误"""
+    return WatchResponse(success=True, message="ok", data=watcher.watch_status())
+
+
+@app.get("/api/results", response_model=ResultsResponse)
+async def query_results(q: str = "", field: str = "", value: str = "", run_id: Optional[int] = None, path: str = "", include_raw: bool = False, limit: int = 50, offset: int = 0):
+    """
+    跨任务查询已保存的提取结果
+    q 为全文检索（可用 field 限定字段），field + value 为精确匹配，run_id / path 过滤，limit / offset 分页
+    """
+    try:
+        data = await asyncio.to_thread(
+            result_store.query_results, q=q, field=field, value=value, run_id=run_id, path=path,
+            include_raw=include_raw, limit=limit, offset=offset,
+        )
+        return ResultsResponse(success=True, message="ok", data=data)
+    except Exception as e:
+        return ResultsResponse(success=False, message=f"查询失败: {str(e)}")
+
+
+@app.get("/api/results/runs", response_model=ResultsResponse)
+async def list_result_runs(limit: int = 50, offset: int = 0):
+    """分页列出解析任务（最新在前）"""
+    try:
+        data = await asyncio.to_thread(result_store.list_runs, limit, offset)
+        return ResultsResponse(success=True, message="ok", data=data)
+    except Exception as e:
+        return ResultsResponse(success=False, message=f"查询失败: {str(e)}")
+
+
+@app.post("/api/results/export", response_model=ResultsResponse)
+async def export_results(request: ResultsExportRequest):
+    """从结果存储导出指定任务的结果（JSON / Excel），无需重新解析"""
+    try:
+        result = await asyncio.to_thread(result_store.run_export, request.run_id)
+        if result is None:
+            return ResultsResponse(success=False, message=f"任务不存在: {request.run_id}")
+        full_path = await asyncio.to_thread(write_export, result, request.save_path, request.save_format or "json")
+        return ResultsResponse(success=True, message=f"已导出至: {full_path}", data={"path": full_path, "count": len(result["results"])})
+    except Exception as e:
+        return ResultsResponse(success=False, message=f"导出失败: {str(e)}")
+
+
+@app.get("/api/usage", response_model=ResultsResponse)
+async def get_usage(run_id: Optional[int] = None, limit: int = 50, offset: int = 0):
+    """
+    服务商返回的实际用量与费用：指定 run_id 时返回该任务每个文档（含各分块）的明细，
+    否则分页返回各任务的合计与每篇论文的平均费用
+    """
+    try:
+        data = await asyncio.to_thread(result_store.usage_report, run_id, limit, offset)
+        return ResultsResponse(success=True, message="ok", data=data)
+    except Exception as e:
+        return ResultsResponse(success=False, message=f"查询失败: {str(e)}")
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    运行指标接口（Prometheus 文本格式）
+    包含各阶段耗时直方图、LLM 请求耗时/重试/token、缓存命中、Map 排队深度等
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/api/analyze/estimate", response_model=EstimateResponse)
+async def estimate(request: EstimateRequest):
+    """
+    批量预估接口（dry-run）
+    调用 pipeline.estimate_batch() 解析整批文件并预估 token、请求数、费用和耗时，不调用大模型
+    """
+    if request.extraction_mode not in ("map_reduce", "retrieval"):
+        return EstimateResponse(success=False, message=f"预估失败: 不支持的提取模式 {request.extraction_mode}")
+    try:
+        result = await pipeline.estimate_batch(
+            file_paths=request.file_paths,
+            fields=request.fields,
+            normalize_options=NormalizeOptions(
+                enabled=request.normalize,
+                drop_references=request.drop_references,
+                drop_appendix=request.drop_appendix,
+            ),
+            field_group_plan=plan_field_groups(request.fields, request.field_groups, request.max_fields_per_group),
+            scope_plan=page_scope.plan_scopes(request.fields, request.field_scopes, request.auto_page_scopes),
+            retrieval_options=RetrievalOptions(
+                top_k=max(1, request.retrieval_top_k),
+                descriptions=request.field_descriptions,
+            ) if request.extraction_mode == "retrieval" else None,
+            prompt_version=request.prompt_version,
+        )
+        return EstimateResponse(
+            success=True,
+            message="预估完成",
+            data=result
+        )
+    except Exception as e:
+        return EstimateResponse(
+            success=False,
+            message=f"预估失败: {str(e)}"
+        )
+
+
+@app.get("/api/models")
+async def list_models():
+    """
+    模型能力表接口
+    返回已登记模型的上下文窗口、最大输出与价格（可在数据目录 models.json 中扩展）
+    """
+    return {
+        "success": True,
+        "data": model_registry.list_models()
+    }
 
 
 @app.post("/api/config/save", response_model=ConfigResponse)
@@ -183,7 +555,9 @@ async def save_config(request: ConfigRequest):
             base_url=request.base_url,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            overlap=request.overlap
+            overlap=request.overlap,
+            concurrency=request.concurrency,
+            weight=request.weight
         )
         if success:
             return ConfigResponse(
@@ -368,7 +742,8 @@ async def websocket_logs(websocket: WebSocket):
 
 
 if __name__ == "__main__":
-    print(f"========== FastAPI start finish, use time: {time.time() - start:.2f}s ==========")
+    logger.info("FastAPI 导入完成，耗时 %.2fs", time.time() - start)
+    logger.info("导入耗时: %s", startup.report()["imports"])
     
     #FastAPI 负责“写接口逻辑”，FastAPI 本身 不是服务器。
     #Uvicorn 负责“把接口变成可访问的 HTTP 服务”。
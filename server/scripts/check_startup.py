@@ -0,0 +1,88 @@
+"""
+启动耗时预算检查
+启动后端进程，轮询 HEAD / 直到返回 200，统计进程启动到首次健康检查成功的耗时；
+超过预算时以非零状态码退出（用于 CI 防止冷启动耗时回退）
+
+用法：
+    python scripts/check_startup.py                       # 检查 python run.py
+    python scripts/check_startup.py --budget 3.0
+    python scripts/check_startup.py --cmd ../dist/server/server.exe   # 检查打包产物
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = float(os.environ.get("STARTUP_BUDGET_SECONDS", "3.0"))
+
+
+def wait_for_head(url: str, timeout: float) -> bool:
+    """轮询 HEAD 请求，直到返回 200 或超时"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            request = urllib.request.Request(url, method="HEAD")
+            with urllib.request.urlopen(request, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def fetch_report(url: str) -> dict:
+    """读取服务端的启动耗时报告"""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return json.loads(response.read().decode("utf-8")).get("data", {})
+    except Exception:
+        return {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查后端冷启动耗时（进程启动到首次 HEAD / 成功）")
+    parser.add_argument("--cmd", default="", help="后端启动命令，默认 python run.py")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="耗时预算（秒）")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--timeout", type=float, default=60.0, help="等待服务就绪的最长时间（秒）")
+    args = parser.parse_args()
+
+    command = args.cmd.split() if args.cmd else [sys.executable, os.path.join(SERVER_DIR, "run.py")]
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    begin = time.perf_counter()
+    process = subprocess.Popen(command, cwd=SERVER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = wait_for_head(f"{base_url}/", args.timeout)
+        elapsed = time.perf_counter() - begin
+        report = fetch_report(f"{base_url}/api/startup") if ready else {}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    if not ready:
+        print(f"[check_startup] 服务在 {args.timeout:.0f}s 内未就绪")
+        return 1
+
+    print(f"[check_startup] 首次 HEAD / 成功耗时: {elapsed:.2f}s（预算 {args.budget:.2f}s）")
+    for item in report.get("imports", []):
+        print(f"  - import {item['name']}: {item['seconds']:.3f}s")
+
+    if elapsed > args.budget:
+        print("[check_startup] 超出启动耗时预算")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
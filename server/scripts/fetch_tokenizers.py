@@ -0,0 +1,90 @@
+"""
+下载 tiktoken 编码文件到 server/tokenizers（打包时随程序分发，离线机器无需联网）
+已存在且校验通过的文件不会重复下载
+
+本脚本只下载 tiktoken 编码，不下载 HuggingFace tokenizer。模型注册表中 qwen / deepseek 模型映射到 hf:qwen / hf:deepseek，
+但这些映射只有在手动放置 tokenizers/<名称>/tokenizer.json（如 tokenizers/qwen/tokenizer.json）并安装 tokenizers 后才生效，
+否则按 cl100k_base 计数；脚本结束时会列出缺少的文件
+
+下载失败（如离线构建）时只输出警告并以 0 退出，不中断打包：运行时缺少的编码会回退到 tiktoken 自身的缓存 / 下载，
+仍不可用时按近似计数。需要确保编码随程序分发时使用 --strict（缺少编码时以 1 退出）
+
+用法：
+    python scripts/fetch_tokenizers.py
+    python scripts/fetch_tokenizers.py --dir /path/to/tokenizers
+    python scripts/fetch_tokenizers.py --strict
+"""
+import argparse
+import hashlib
+import os
+import sys
+import urllib.request
+
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = "https://openaipublic.blob.core.windows.net/encodings/"
+
+# 编码名 -> SHA-256（与 tiktoken_ext.openai_public 一致）
+ENCODINGS = {
+    "cl100k_base": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+    "o200k_base": "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+}
+
+
+# 模型注册表中 hf:<名称> 引用、需要手动放置的 tokenizer.json
+HF_TOKENIZERS = ["qwen", "deepseek"]
+
+
+def sha256_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def fetch(name: str, expected_hash: str, target_dir: str, timeout: float) -> bool:
+    """下载单个编码文件，返回是否可用"""
+    path = os.path.join(target_dir, f"{name}.tiktoken")
+    if os.path.exists(path) and sha256_file(path) == expected_hash:
+        print(f"[fetch_tokenizers] {name}: 已存在")
+        return True
+
+    try:
+        with urllib.request.urlopen(f"{BASE_URL}{name}.tiktoken", timeout=timeout) as response:
+            contents = response.read()
+    except Exception as e:
+        print(f"[fetch_tokenizers] {name}: 下载失败 ({e})")
+        return False
+    if hashlib.sha256(contents).hexdigest() != expected_hash:
+        print(f"[fetch_tokenizers] {name}: 校验失败")
+        return False
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+    print(f"[fetch_tokenizers] {name}: {len(contents) / 1024 / 1024:.1f} MB")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="下载 tiktoken 编码文件（随程序打包，离线使用）")
+    parser.add_argument("--dir", default=os.path.join(SERVER_DIR, "tokenizers"), help="保存目录，默认 server/tokenizers")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个文件的下载超时（秒）")
+    parser.add_argument("--strict", action="store_true", help="有编码文件不可用时以 1 退出（默认只警告）")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    results = {name: fetch(name, expected_hash, args.dir, args.timeout) for name, expected_hash in ENCODINGS.items()}
+
+    for name in HF_TOKENIZERS:
+        if not os.path.exists(os.path.join(args.dir, name, "tokenizer.json")):
+            print(f"[fetch_tokenizers] hf:{name}: 未找到 {name}/tokenizer.json（不会自动下载），该映射不生效，按 cl100k_base 计数")
+
+    missing = [name for name, ok in results.items() if not ok]
+    if missing:
+        print(f"[fetch_tokenizers] 警告: {', '.join(missing)} 未打包，运行时回退到 tiktoken 缓存 / 下载，仍不可用时按近似计数")
+        return 1 if args.strict else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,10 @@ try:
 except:
     tiktoken_ext_datas = []
 
+# 随程序打包的 tokenizer 编码文件（python scripts/fetch_tokenizers.py 下载），离线机器无需联网下载
+tokenizers_dir = os.path.join(server_dir, 'tokenizers')
+tokenizer_datas = [(tokenizers_dir, 'tokenizers')] if os.path.isdir(tokenizers_dir) else []
+
 # 收集 pypdf 的数据（用于 PDF 解析）
 try:
     pypdf_datas = collect_data_files('pypdf')
@@ -59,6 +63,7 @@ datas = collect_data_files('dotenv') + \
     collect_data_files('pypdf') + \
     tiktoken_datas + \
     tiktoken_ext_datas + \
+    tokenizer_datas + \
     pypdf_datas
 
 a = Analysis(
@@ -0,0 +1,298 @@
+"""
+自适应并发控制（AIMD）
+按端点（base_url + 模型）限制同时进行的 LLM 请求数，并根据观测结果自动调整上限：
+上限被用满时调用健康则加性增长（每个往返约 +1），遇到 429 / 5xx、超时或延迟突增时乘性减小。
+启用时限制器是 LLM 调用唯一的并发上限，调用方只按 task_limit() 限制任务扇出
+延迟基线（EWMA）吸收每个成功调用，延迟整体上移后基线随之调整，不会持续判定为突增；
+Reduce 等输出很长的调用不参与突增判断（耗时主要取决于输出长度）
+
+初始上限取配置的 concurrency（seed()），未设置时使用 PAPER_EXTRACT_ADAPTIVE_INITIAL
+
+429 / 5xx 通过 HTTP 客户端的响应钩子记录，OpenAI SDK 内部自动重试的限流响应同样会被观测到
+
+环境变量：
+    PAPER_EXTRACT_ADAPTIVE_CONCURRENCY   是否启用（1 / 0），默认启用
+    PAPER_EXTRACT_ADAPTIVE_INITIAL       初始并发上限，默认 4
+    PAPER_EXTRACT_ADAPTIVE_MAX           并发上限的最大值，默认 32
+"""
+#print(">>> import adaptive_limiter...")
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from . import metrics
+from .logger import get_logger
+
+logger = get_logger("adaptive_limiter")
+
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MAX_LIMIT = 32
+MIN_LIMIT = 1
+# 乘性减小的系数
+DECREASE_FACTOR = 0.5
+# 延迟超过基线的倍数视为突增
+LATENCY_SPIKE_RATIO = 2.5
+# 基线延迟（EWMA）的平滑系数，以及判断突增前需要的最少样本数
+BASELINE_ALPHA = 0.2
+MIN_SAMPLES = 5
+# 输出 token 数超过基线的倍数时视为长输出调用，不参与突增判断
+LONG_OUTPUT_RATIO = 2.0
+
+# 调用结果
+OUTCOME_OK = "ok"
+OUTCOME_THROTTLED = "throttled"
+OUTCOME_ERROR = "error"
+# 与限流无关的失败（鉴权、参数错误等），不调整上限
+OUTCOME_IGNORED = "ignored"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(MIN_LIMIT, int(os.environ.get(name, "") or default))
+    except ValueError:
+        return default
+
+
+# 当前调用是否参与延迟突增判断（Reduce 等长输出调用关闭）
+_spike_detection: contextvars.ContextVar[bool] = contextvars.ContextVar("spike_detection", default=True)
+
+
+def is_enabled() -> bool:
+    return os.environ.get("PAPER_EXTRACT_ADAPTIVE_CONCURRENCY", "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+def classify_error(error: BaseException) -> str:
+    """按异常判断调用结果：429 为限流，5xx / 超时 / 连接错误为服务端异常，其余不参与调整"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return OUTCOME_THROTTLED
+    if isinstance(status, int) and status >= 500:
+        return OUTCOME_ERROR
+    name = type(error).__name__
+    if "Timeout" in name or "Connection" in name or isinstance(error, TimeoutError):
+        return OUTCOME_ERROR
+    return OUTCOME_IGNORED
+
+
+class AdaptiveLimiter:
+    """
+    单个端点的 AIMD 并发限制（线程安全，LLM 调用在工作线程中执行）
+
+    Args:
+        name: 端点名称（日志与指标标签）
+        initial: 初始并发上限
+        max_limit: 并发上限的最大值
+    """
+
+    def __init__(self, name: str, initial: int = DEFAULT_INITIAL_LIMIT, max_limit: int = DEFAULT_MAX_LIMIT):
+        self.name = name
+        self.max_limit = max(MIN_LIMIT, max_limit)
+        self.limit = float(min(max(MIN_LIMIT, initial), self.max_limit))
+        self.in_flight = 0
+        self.baseline: Optional[float] = None   # 健康调用的延迟基线（EWMA，秒）
+        self.output_baseline: Optional[float] = None   # 输出 token 数基线（EWMA）
+        self.samples = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        metrics.LLM_CONCURRENCY_LIMIT.set(int(self.limit), endpoint=name)
+
+    def acquire(self) -> None:
+        """等待并占用一个并发名额"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def seed(self, initial: int) -> None:
+        """按配置的并发数提高初始上限（已经因限流减小过时保留学习到的上限）"""
+        with self._cond:
+            if self.decreases or initial <= int(self.limit):
+                return
+            self.limit = float(min(initial, self.max_limit))
+            metrics.LLM_CONCURRENCY_LIMIT.set(int(self.limit), endpoint=self.name)
+            self._cond.notify_all()
+
+    def release(self, seconds: float, outcome: str, output_tokens: Optional[int] = None, spike_detection: bool = True) -> None:
+        """
+        释放名额并按本次结果调整上限
+
+        Args:
+            seconds: 调用耗时
+            outcome: 调用结果（OUTCOME_*）
+            output_tokens: 输出 token 数（未知时为 None）
+            spike_detection: 是否参与延迟突增判断；为 False 时不更新延迟基线
+        """
+        with self._cond:
+            # 本次调用时上限是否被用满：未用满时增长上限没有经过验证，不增长
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if outcome == OUTCOME_OK:
+                if output_tokens is not None and spike_detection:
+                    long_output = self.output_baseline is not None and output_tokens > self.output_baseline * LONG_OUTPUT_RATIO
+                    self.output_baseline = float(output_tokens) if self.output_baseline is None else self.output_baseline + BASELINE_ALPHA * (output_tokens - self.output_baseline)
+                    spike_detection = not long_output
+                spike = spike_detection and self.samples >= MIN_SAMPLES and self.baseline is not None and seconds > self.baseline * LATENCY_SPIKE_RATIO
+                if spike:
+                    self._decrease(f"延迟 {seconds:.1f}s 超过基线 {self.baseline:.1f}s 的 {LATENCY_SPIKE_RATIO} 倍", "latency")
+                elif saturated:
+                    self._increase()
+                if spike_detection:
+                    # 突增的样本同样计入基线：延迟整体上移后基线随之调整，不会持续减小上限
+                    self.baseline = seconds if self.baseline is None else self.baseline + BASELINE_ALPHA * (seconds - self.baseline)
+                    self.samples += 1
+            elif outcome in (OUTCOME_THROTTLED, OUTCOME_ERROR):
+                self._decrease("限流（429）" if outcome == OUTCOME_THROTTLED else "服务端错误 / 超时", outcome)
+            self._cond.notify_all()
+
+    def on_response(self, status: int) -> None:
+        """HTTP 响应钩子：限流与服务端错误立即减小上限（包括 SDK 内部重试的请求）"""
+        if status == 429 or status >= 500:
+            with self._cond:
+                self._decrease("限流（429）" if status == 429 else f"服务端错误（{status}）", OUTCOME_THROTTLED if status == 429 else OUTCOME_ERROR)
+
+    def _increase(self) -> None:
+        # 加性增长：每个成功调用 +1/limit，约等于每个往返 +1
+        before = int(self.limit)
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        if int(self.limit) != before:
+            metrics.LLM_CONCURRENCY_LIMIT.set(int(self.limit), endpoint=self.name)
+            logger.debug("端点 %s 并发上限 %d -> %d", self.name, before, int(self.limit))
+
+    def _decrease(self, reason: str, label: str) -> None:
+        # 乘性减小；同一个往返内的多个失败只减小一次，避免上限在一次限流中直接降到最小
+        now = time.monotonic()
+        if now - self._last_decrease < (self.baseline or 1.0):
+            return
+        self._last_decrease = now
+        before = int(self.limit)
+        self.limit = max(float(MIN_LIMIT), self.limit * DECREASE_FACTOR)
+        self.decreases += 1
+        metrics.LLM_CONCURRENCY_LIMIT.set(int(self.limit), endpoint=self.name)
+        metrics.LLM_LIMIT_DECREASES.inc(endpoint=self.name, reason=label)
+        logger.info("端点 %s %s，并发上限 %d -> %d", self.name, reason, before, int(self.limit))
+
+    @contextmanager
+    def slot(self) -> Iterator["CallInfo"]:
+        """占用一个名额执行调用，结束时按耗时与异常类型调整上限（调用方可在 CallInfo 中填写输出 token 数）"""
+        self.acquire()
+        begin = time.perf_counter()
+        outcome = OUTCOME_OK
+        call = CallInfo()
+        try:
+            yield call
+        except BaseException as e:
+            outcome = classify_error(e)
+            raise
+        finally:
+            self.release(time.perf_counter() - begin, outcome, call.output_tokens, _spike_detection.get())
+
+    def to_dict(self) -> Dict:
+        with self._cond:
+            return {
+                "endpoint": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "baseline_seconds": round(self.baseline, 3) if self.baseline is not None else None,
+                "decreases": self.decreases,
+            }
+
+
+class CallInfo:
+    """一次调用的补充信息（调用结束前由调用方填写）"""
+
+    def __init__(self):
+        self.output_tokens: Optional[int] = None
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_http_clients: Dict[Tuple[str, str], Any] = {}
+_lock = threading.Lock()
+
+
+def get_limiter(model_name: str, base_url: str = "") -> AdaptiveLimiter:
+    """获取端点（base_url + 模型）对应的限制器，进程内共享"""
+    key = (base_url or "", model_name or "")
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            host = urlparse(base_url).netloc or "default"
+            limiter = AdaptiveLimiter(
+                f"{host}/{model_name}",
+                initial=_env_int("PAPER_EXTRACT_ADAPTIVE_INITIAL", DEFAULT_INITIAL_LIMIT),
+                max_limit=_env_int("PAPER_EXTRACT_ADAPTIVE_MAX", DEFAULT_MAX_LIMIT),
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def task_limit(concurrency: int, endpoints: int = 1) -> int:
+    """
+    调用方同时提交的 LLM 任务数上限
+
+    启用时为 PAPER_EXTRACT_ADAPTIVE_MAX × 端点数，只限制任务扇出，实际并发由各端点的限制器决定；
+    未启用时为配置的并发数
+    """
+    if not is_enabled():
+        return max(MIN_LIMIT, int(concurrency or MIN_LIMIT))
+    return _env_int("PAPER_EXTRACT_ADAPTIVE_MAX", DEFAULT_MAX_LIMIT) * max(1, endpoints)
+
+
+def seed(model_name: str, base_url: str, concurrency: int) -> None:
+    """用配置的并发数作为端点的初始上限（不超过 PAPER_EXTRACT_ADAPTIVE_MAX）"""
+    if is_enabled() and concurrency:
+        get_limiter(model_name, base_url).seed(int(concurrency))
+
+
+@contextmanager
+def slot(model_name: str, base_url: str = "") -> Iterator[CallInfo]:
+    """在端点的并发限制内执行一次调用（未启用时直接执行）"""
+    if not is_enabled():
+        yield CallInfo()
+        return
+    with get_limiter(model_name, base_url).slot() as call:
+        yield call
+
+
+@contextmanager
+def without_spike_detection() -> Iterator[None]:
+    """范围内的调用不参与延迟突增判断（如 Reduce：耗时主要取决于输出长度）"""
+    token = _spike_detection.set(False)
+    try:
+        yield
+    finally:
+        _spike_detection.reset(token)
+
+
+def http_client(model_name: str, base_url: str = "") -> Optional[Any]:
+    """
+    带响应钩子的 HTTP 客户端（按端点缓存，保持连接复用），把每个 429 / 5xx 响应报告给限制器
+
+    未启用时返回 None（使用 SDK 默认客户端）
+    """
+    if not is_enabled():
+        return None
+    key = (base_url or "", model_name or "")
+    with _lock:
+        client = _http_clients.get(key)
+    if client is not None:
+        return client
+
+    from openai import DefaultHttpxClient
+
+    limiter = get_limiter(model_name, base_url)
+    client = DefaultHttpxClient(event_hooks={"response": [lambda response: limiter.on_response(response.status_code)]})
+    with _lock:
+        return _http_clients.setdefault(key, client)
+
+
+def status() -> List[Dict]:
+    """各端点当前的并发上限"""
+    with _lock:
+        limiters = list(_limiters.values())
+    return [limiter.to_dict() for limiter in limiters]
@@ -9,13 +9,19 @@ import sys
 from datetime import datetime
 from typing import Dict, List
 from .log_service import push_log
+from .logger import get_logger, register_secret
+
+logger = get_logger("config_service")
 
 
 # 获取配置文件的完整路径
 def get_config_file_path():
     """获取配置文件路径（使用用户数据目录，确保持久化保存）"""
+    # 环境变量 PAPER_EXTRACT_DATA_DIR 可指定独立的数据目录（基准测试、便携部署）
+    if os.environ.get('PAPER_EXTRACT_DATA_DIR'):
+        config_dir = os.environ['PAPER_EXTRACT_DATA_DIR']
     # 优先使用用户数据目录
-    if sys.platform == 'win32':
+    elif sys.platform == 'win32':
         # Windows: 使用 AppData/Local 目录
         config_dir = os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'paper-extract-app', 'configs')
     elif sys.platform == 'darwin':
@@ -45,7 +51,11 @@ def get_all_configs_from_file() -> List[Dict]:
     if os.path.exists(config_file):
         with open(config_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            return data.get('configs', [])
+            configs = data.get('configs', [])
+            # 已保存的 API Key 在日志中一律脱敏
+            for config in configs:
+                register_secret(config.get('api_key', ''))
+            return configs
     return []
 
 
@@ -58,10 +68,24 @@ def save_all_configs_to_file(configs: List[Dict]) -> bool:
             json.dump(data, f, ensure_ascii=False, indent=2)
         return True
     except Exception as e:
-        print(f"保存配置失败: {e}")
+        logger.error("保存配置失败: %s", e)
         return False
 
 
+def get_configs_by_names(config_names: List[str]) -> List[Dict]:
+    """
+    按名称批量读取配置（保持传入顺序，忽略不存在的名称）
+
+    Args:
+        config_names: 配置名称列表
+
+    Returns:
+        匹配到的配置列表
+    """
+    configs = {cfg.get('config_name'): cfg for cfg in get_all_configs_from_file()}
+    return [configs[name] for name in config_names if name in configs]
+
+
 async def save_config(
     model_name: str,
     api_key: str,
@@ -70,7 +94,9 @@ async def save_config(
     base_url: str = "",
     temperature: float = 0.1,
     max_tokens: int = 10000,
-    overlap: int = 500
+    overlap: int = 500,
+    concurrency: int = 4,
+    weight: int = 1
 ) -> bool:
     """
     保存配置到文件
@@ -84,10 +110,13 @@ async def save_config(
         temperature: 温度参数
         max_tokens: 分块最大 Token 数
         overlap: 分块重叠 Token 数
+        concurrency: 单个文件 Map 阶段的最大并发请求数
+        weight: 作为端点池成员时的权重（加权轮询）
 
     Returns:
         是否保存成功
     """
+    register_secret(api_key)
     try:
         configs = get_all_configs_from_file()
 
@@ -107,6 +136,8 @@ async def save_config(
             "temperature": temperature,
             "max_tokens": max_tokens,
             "overlap": overlap,
+            "concurrency": concurrency,
+            "weight": weight,
             "updated_at": datetime.now().isoformat()
         }
 
@@ -128,7 +159,9 @@ async def save_config(
 - API Key: {masked_key}
 - Temperature: {temperature}
 - Max Tokens: {max_tokens}
-- Overlap: {overlap}"""
+- Overlap: {overlap}
+- Concurrency: {concurrency}
+- Weight: {weight}"""
             await push_log("config", log_msg)
             return True
         return False
@@ -0,0 +1,91 @@
+"""
+批量去重服务
+按文件内容哈希（流式读取、多线程并行）找出同一批次中的重复 PDF，每份文档只提取一次；
+可选按解析后文本的指纹识别近似重复（如 arXiv v1/v2 重新生成的 PDF）
+"""
+#print(">>> import dedup...")
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .logger import get_logger
+
+logger = get_logger("dedup")
+
+
+# 流式读取的块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+# 并行哈希的线程数（hashlib 处理大块数据时释放 GIL）
+HASH_WORKERS = 8
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def hash_file(file_path: str) -> Optional[str]:
+    """
+    计算文件内容的 SHA-256（分块读取，不一次性载入内存）
+
+    Returns:
+        十六进制摘要；文件无法读取时返回 None
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    except OSError as e:
+        logger.warning("计算文件哈希失败: %s (%s)", file_path, e)
+        return None
+    return digest.hexdigest()
+
+
+def hash_files(file_paths: List[str], workers: int = HASH_WORKERS) -> Dict[str, Optional[str]]:
+    """并行计算多个文件的内容哈希"""
+    if not file_paths:
+        return {}
+    workers = max(1, min(workers, len(file_paths)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(file_paths, executor.map(hash_file, file_paths)))
+
+
+class DuplicateTracker:
+    """增量去重：按到达顺序记录每个内容哈希第一次出现的路径（适用于边发现边处理的文件流）"""
+
+    def __init__(self):
+        self._first_by_hash: Dict[str, str] = {}
+
+    def check(self, file_path: str, digest: Optional[str]) -> Optional[str]:
+        """
+        登记文件哈希
+
+        Returns:
+            与之重复的第一个文件路径；首次出现（或哈希为 None，即无法读取）时返回 None
+        """
+        if digest is None:
+            return None
+        if digest in self._first_by_hash:
+            return self._first_by_hash[digest]
+        self._first_by_hash[digest] = file_path
+        return None
+
+
+def text_fingerprint(text: str) -> str:
+    """
+    文本指纹（近似重复检测）：忽略大小写、标点和空白差异后的 SHA-1
+
+    同一论文重新导出的 PDF 字节不同，但抽取出的文本通常只在空白、换行和元数据上有差异
+    """
+    normalized = _NON_WORD.sub(" ", text.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def dedup_report(total: int, unique: int) -> Dict:
+    """去重统计"""
+    duplicates = total - unique
+    return {
+        "files": total,
+        "unique": unique,
+        "duplicates": duplicates,
+        "ratio": round(duplicates / total, 4) if total else 0.0,
+    }
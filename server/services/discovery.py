@@ -0,0 +1,173 @@
+"""
+文件发现服务
+把目录 / glob 模式展开为 PDF 文件流：后台线程遍历文件系统，边发现边交给解析阶段，
+支持按大小、修改时间过滤和单任务文件数上限，避免请求中携带上万个路径
+"""
+#print(">>> import discovery...")
+import asyncio
+import glob
+import os
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger("discovery")
+
+
+PDF_SUFFIX = ".pdf"
+# 含有这些字符的来源按 glob 模式展开（支持 ** 递归）
+GLOB_CHARS = "*?["
+# 发现队列的缓冲上限：解析阶段跟不上时遍历线程暂停
+DISCOVERY_BUFFER = 256
+
+
+@dataclass
+class DiscoveryFilter:
+    """文件过滤条件（0 / None 表示不限制）"""
+    min_size: int = 0                       # 最小文件大小（字节）
+    max_size: int = 0                       # 最大文件大小（字节）
+    modified_after: Optional[float] = None  # 修改时间下限（时间戳）
+    modified_before: Optional[float] = None # 修改时间上限（时间戳）
+    max_files: int = 0                      # 单个任务最多处理的文件数
+    recursive: bool = True                  # 目录是否递归遍历（glob 模式中的 ** 是否匹配多层目录）
+
+    def accepts(self, stat: os.stat_result) -> bool:
+        if self.min_size and stat.st_size < self.min_size:
+            return False
+        if self.max_size and stat.st_size > self.max_size:
+            return False
+        if self.modified_after is not None and stat.st_mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and stat.st_mtime > self.modified_before:
+            return False
+        return True
+
+
+def _is_pdf(name: str) -> bool:
+    return name.lower().endswith(PDF_SUFFIX)
+
+
+def _walk_directory(directory: str, recursive: bool) -> Iterator[Tuple[str, Optional[os.stat_result]]]:
+    """按名称顺序遍历目录（scandir 复用目录项的 stat 信息）"""
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning("无法读取目录 %s: %s", current, e)
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        subdirs.append(entry.path)
+                elif entry.is_file() and _is_pdf(entry.name):
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+        # 逆序入栈，保证按名称顺序深度优先
+        pending.extend(reversed(subdirs))
+
+
+def _expand(source: str, recursive: bool) -> Iterator[Tuple[str, Optional[os.stat_result]]]:
+    """展开单个来源：glob 模式 / 目录 / 单个文件"""
+    if any(c in source for c in GLOB_CHARS):
+        # 不递归时 ** 与 * 相同，只匹配一层目录
+        for path in glob.iglob(os.path.expanduser(source), recursive=recursive):
+            if _is_pdf(path) and os.path.isfile(path):
+                yield path, None
+    elif os.path.isdir(source):
+        yield from _walk_directory(source, recursive)
+    elif os.path.isfile(source):
+        yield source, None
+    else:
+        logger.warning("来源不存在: %s", source)
+
+
+def iter_files(sources: Iterable[str], flt: Optional[DiscoveryFilter] = None) -> Iterator[str]:
+    """
+    同步展开来源列表（按过滤条件与数量上限，重复路径只返回一次）
+
+    Args:
+        sources: 目录、glob 模式或文件路径
+        flt: 过滤条件
+
+    Yields:
+        PDF 文件路径
+    """
+    flt = flt or DiscoveryFilter()
+    seen = set()
+    count = 0
+    for source in sources:
+        for path, stat in _expand(source, flt.recursive):
+            key = os.path.normcase(os.path.abspath(path))
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                if not flt.accepts(stat or os.stat(path)):
+                    continue
+            except OSError:
+                continue
+            yield path
+            count += 1
+            if flt.max_files and count >= flt.max_files:
+                logger.info("已达到单任务文件数上限 %d，停止发现", flt.max_files)
+                return
+
+
+async def discover(sources: List[str], flt: Optional[DiscoveryFilter] = None, buffer: int = DISCOVERY_BUFFER) -> AsyncIterator[str]:
+    """
+    异步发现文件：后台线程遍历文件系统，通过有界队列逐个交给调用方
+
+    调用方提前结束迭代（break / 异常）时遍历线程随之停止
+
+    Yields:
+        PDF 文件路径
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(buffer)
+    stop = threading.Event()
+    done = object()
+
+    def produce() -> None:
+        try:
+            for path in iter_files(sources, flt):
+                # 缓冲区已满时等待消费，同时响应停止信号
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, path)
+        except Exception as e:
+            logger.error("文件发现失败: %s", e)
+        finally:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except RuntimeError:
+                # 事件循环已关闭（调用方已结束）
+                pass
+
+    threading.Thread(target=produce, name="discovery", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+
+
+async def iterate(file_paths: List[str]) -> AsyncIterator[str]:
+    """把显式给出的路径列表包装为与 discover() 相同的异步迭代器"""
+    for path in file_paths:
+        yield path
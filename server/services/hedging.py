@@ -0,0 +1,284 @@
+"""
+对冲请求服务
+Map 调用超过历史延迟的分位数阈值仍未返回时，再发送一个相同的请求（可指定另一个配置的端点），
+先返回合法结果的请求胜出，另一个请求被取消（流式请求立即停止接收；非流式请求无法中断，结果丢弃）。
+用少量额外 token 换取更低的尾延迟：单个卡住的分块不再拖住整篇论文的 Reduce
+
+对冲等待时间从原请求实际开始（拿到并发名额、发出 LLM 请求）时算起，线程池排队与等待并发名额的时间
+不会触发对冲，也不计入延迟样本。
+
+对冲请求的次数与费用计入指标（paper_extract_llm_hedges_total）和用量统计（hedged_calls / hedge_cost）。
+落败请求的用量在取消时按本地估算记录（start_request 登记的回调），此时分块 / 文件的用量范围尚未结束；
+请求之后才返回的实际用量不再重复记录（finish_request）
+"""
+#print(">>> import hedging...")
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from . import metrics
+from .logger import get_logger
+
+logger = get_logger("hedging")
+
+T = TypeVar("T")
+
+# 计算分位数前需要的最少样本数（不足时使用 initial_delay）
+MIN_SAMPLES = 10
+# 每个模型保留的最近延迟样本数
+WINDOW_SIZE = 200
+# 等待原请求实际开始时检查其是否已结束的间隔（秒）
+START_POLL_INTERVAL = 0.05
+
+
+@dataclass
+class HedgePolicy:
+    """对冲策略"""
+    enabled: bool = False
+    percentile: float = 95.0      # 超过该分位数的延迟时发送对冲请求
+    min_delay: float = 2.0        # 对冲等待的最短时间（秒），避免对很快的请求也发送对冲
+    initial_delay: float = 20.0   # 样本不足时的等待时间（秒）
+    profile: str = ""             # 对冲请求使用的配置名称，为空时使用原端点（端点池模式下由端点池重新选择）
+    # profile 解析后的端点 (model_name, api_key, base_url)，由 resolve_profile() 填充
+    endpoint: Optional[Tuple[str, str, str]] = None
+
+
+class HedgeCancelled(Exception):
+    """对冲中落败的请求被取消"""
+
+
+class LatencyTracker:
+    """按模型记录最近的 Map 调用延迟（线程安全）"""
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model_name, deque(maxlen=self._window)).append(seconds)
+
+    def delay(self, model_name: str, policy: HedgePolicy) -> float:
+        """对冲前的等待时间：最近延迟的分位数（不低于 min_delay）"""
+        with self._lock:
+            samples = sorted(self._samples.get(model_name, ()))
+        if len(samples) < MIN_SAMPLES:
+            return max(policy.min_delay, policy.initial_delay)
+        index = min(len(samples) - 1, int(len(samples) * policy.percentile / 100))
+        return max(policy.min_delay, samples[index])
+
+
+tracker = LatencyTracker()
+
+class _HedgedCall:
+    """对冲中的一个请求（原请求或对冲请求）"""
+
+    def __init__(self, hedge: bool):
+        self.hedge = hedge
+        self.cancel = threading.Event()
+        self.lock = threading.Lock()
+        # 进行中的 LLM 请求被取消时记录用量的回调（参数为是否对冲请求）
+        self.on_cancel: Optional[Callable[[bool], None]] = None
+        # 第一次实际发出 LLM 请求（或开始等待合并的请求）的时间
+        self.started = threading.Event()
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    def mark_started(self) -> None:
+        if not self.started.is_set():
+            self.started_at = time.perf_counter()
+            self.started.set()
+
+    def elapsed(self) -> float:
+        """从实际开始到结束的耗时（未开始时为 0）"""
+        return self.finished_at - self.started_at if self.started.is_set() else 0.0
+
+    def cancel_now(self) -> None:
+        """取消请求；有进行中的 LLM 请求时立即按估算记录它的用量"""
+        with self.lock:
+            self.cancel.set()
+            on_cancel, self.on_cancel = self.on_cancel, None
+        if on_cancel is not None:
+            try:
+                on_cancel(self.hedge)
+            except Exception as e:
+                logger.warning("记录落败请求的用量失败: %s", e)
+
+
+# 当前工作线程所属的对冲请求（通过 contextvars 读取）
+_current_call: contextvars.ContextVar[Optional[_HedgedCall]] = contextvars.ContextVar("hedged_call", default=None)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+        return _executor
+
+
+def cancelled() -> bool:
+    """当前请求是否已在对冲中落败（流式读取时检查，尽早停止）"""
+    call = _current_call.get()
+    return call is not None and call.cancel.is_set()
+
+
+def is_hedge() -> bool:
+    """当前调用是否为对冲请求（用于用量统计）"""
+    call = _current_call.get()
+    return call is not None and call.hedge
+
+
+def start_request(on_cancel: Callable[[bool], None]) -> None:
+    """
+    登记一次 LLM 请求开始（不在对冲中时不做任何事）
+
+    Args:
+        on_cancel: 请求在对冲中落败时记录估算用量的回调，在取消方的线程中调用
+
+    Raises:
+        HedgeCancelled: 请求已落败，不再发送
+    """
+    call = _current_call.get()
+    if call is None:
+        return
+    with call.lock:
+        if call.cancel.is_set():
+            raise HedgeCancelled()
+        call.on_cancel = on_cancel
+        call.mark_started()
+
+
+def mark_started() -> None:
+    """登记当前请求已实际开始但不发送 LLM 请求（如等待合并的相同请求），对冲计时从此开始"""
+    call = _current_call.get()
+    if call is not None:
+        with call.lock:
+            call.mark_started()
+
+
+def finish_request() -> bool:
+    """
+    登记一次 LLM 请求结束
+
+    Returns:
+        是否需要记录本次用量；请求落败时已在取消时按估算记录，返回 False
+    """
+    call = _current_call.get()
+    if call is None:
+        return True
+    with call.lock:
+        owned = call.on_cancel is not None
+        call.on_cancel = None
+        return owned or not call.cancel.is_set()
+
+
+def resolve_profile(policy: HedgePolicy) -> HedgePolicy:
+    """把 profile 配置名称解析为端点；配置不存在或不完整时对冲请求使用原端点"""
+    if not policy.enabled or not policy.profile:
+        return policy
+    from .config_service import get_configs_by_names
+
+    configs = get_configs_by_names([policy.profile])
+    if not configs or not configs[0].get("api_key"):
+        logger.warning("对冲配置 %s 不存在或缺少 API Key，对冲请求使用原端点", policy.profile)
+        return policy
+    config = configs[0]
+    policy.endpoint = (config.get("model_name", ""), config.get("api_key", ""), config.get("base_url", ""))
+    return policy
+
+
+def _run(hedged: _HedgedCall, call: Callable[[], T]) -> T:
+    _current_call.set(hedged)
+    try:
+        return call()
+    finally:
+        hedged.finished_at = time.perf_counter()
+
+
+def _wait_for_hedge_point(future, hedged: _HedgedCall, delay: float) -> bool:
+    """
+    等待原请求结束或到达对冲时间点（原请求实际开始后 delay 秒）
+
+    Returns:
+        是否需要发送对冲请求
+    """
+    while not future.done():
+        if not hedged.started.is_set():
+            # 原请求还在排队或等待并发名额，不计时
+            hedged.started.wait(START_POLL_INTERVAL)
+            continue
+        remaining = hedged.started_at + delay - time.perf_counter()
+        if remaining <= 0:
+            return True
+        wait([future], timeout=remaining)
+    return False
+
+
+def run_hedged(primary: Callable[[], T], hedge: Callable[[], T], model_name: str, policy: HedgePolicy, valid: Callable[[T], bool]) -> T:
+    """
+    执行一次可对冲的调用（在工作线程中调用，阻塞直到得到结果）
+
+    Args:
+        primary: 原请求
+        hedge: 对冲请求（可使用另一个端点）
+        model_name: 用于统计延迟分位数的模型名称
+        policy: 对冲策略
+        valid: 判断结果是否合法；不合法的结果只在另一个请求也结束时才返回
+
+    Returns:
+        先返回的合法结果
+
+    Raises:
+        两个请求都失败时抛出先出现的异常
+    """
+    executor = _get_executor()
+    delay = tracker.delay(model_name, policy)
+    calls: Dict = {}
+    # 每个请求使用独立的上下文副本（用量统计等 contextvars 在工作线程中同样可见）
+    first_call = _HedgedCall(hedge=False)
+    first = executor.submit(contextvars.copy_context().run, _run, first_call, primary)
+    calls[first] = first_call
+
+    if _wait_for_hedge_point(first, first_call, delay):
+        logger.info("模型 %s 请求 %.1fs 未返回，发送对冲请求", model_name, delay)
+        metrics.LLM_HEDGES.inc(result="launched")
+        second_call = _HedgedCall(hedge=True)
+        second = executor.submit(contextvars.copy_context().run, _run, second_call, hedge)
+        calls[second] = second_call
+
+    pending = set(calls)
+    first_error: Optional[BaseException] = None
+    fallback = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except HedgeCancelled:
+                continue
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if not valid(result) and pending:
+                fallback = (result,)
+                continue
+            for other in pending:
+                calls[other].cancel_now()
+            # 延迟样本只计实际请求耗时；对冲胜出时原请求的耗时至少为 对冲等待 + 对冲请求耗时
+            tracker.record(model_name, first_call.elapsed() if future is first else calls[future].elapsed() + delay)
+            if len(calls) > 1:
+                metrics.LLM_HEDGES.inc(result="hedge_won" if future is not first else "primary_won")
+            return result
+
+    if fallback is not None:
+        return fallback[0]
+    raise first_error
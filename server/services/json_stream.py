@@ -0,0 +1,144 @@
+"""
+增量 JSON 解析
+流式接收 LLM 输出时逐字符解析顶层 JSON 对象，字段值一旦完整立即返回，
+并能在输出结束时判断 JSON 是否被截断
+"""
+#print(">>> import json_stream...")
+import json
+from typing import Any, Dict, List, Tuple
+
+
+class TruncatedResponseError(ValueError):
+    """LLM 输出的 JSON 未闭合（被截断）或格式错误"""
+
+
+class IncrementalJSONParser:
+    """
+    顶层 JSON 对象的增量解析器
+
+    会跳过 JSON 之前的任意文本（如 ```json 代码块标记），
+    顶层对象闭合后 done 为 True，之后的输出不再处理
+
+    用法：
+        parser = IncrementalJSONParser()
+        for piece in stream:
+            for key, value in parser.feed(piece):
+                ...
+            if parser.done:
+                break
+        result = parser.finish()
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        # key / key_string / colon / value / in_value / after_value
+        self.state = "key"
+        self.key_start = 0
+        self.value_start = 0
+        self.current_key = ""
+        self.result: Dict[str, Any] = {}
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        追加一段输出并解析
+
+        Args:
+            text: 新收到的文本片段
+
+        Returns:
+            本次新完成的 (字段名, 值) 列表
+        """
+        self.buffer += text
+        completed = []
+
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.state = "key"
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.state == "key_string":
+                        self.current_key = self._loads(self.buffer[self.key_start:self.pos + 1])
+                        self.state = "colon"
+                    elif self.state == "in_value" and self.depth == 1:
+                        completed.append(self._emit(self.buffer[self.value_start:self.pos + 1]))
+            elif ch == '"':
+                self.in_string = True
+                if self.state == "key":
+                    self.key_start = self.pos
+                    self.state = "key_string"
+                elif self.state == "value":
+                    self.value_start = self.pos
+                    self.state = "in_value"
+            elif ch in "{[":
+                if self.state == "value":
+                    self.value_start = self.pos
+                    self.state = "in_value"
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    # 顶层对象闭合；未结束的值为数字/布尔等标量
+                    if self.state == "in_value":
+                        completed.append(self._emit(self.buffer[self.value_start:self.pos]))
+                    self.done = True
+                elif self.depth == 1 and self.state == "in_value":
+                    completed.append(self._emit(self.buffer[self.value_start:self.pos + 1]))
+            elif self.depth == 1 and ch == ",":
+                if self.state == "in_value":
+                    completed.append(self._emit(self.buffer[self.value_start:self.pos]))
+                self.state = "key"
+            elif self.depth == 1 and ch == ":" and self.state == "colon":
+                self.state = "value"
+            elif self.state == "value" and not ch.isspace():
+                self.value_start = self.pos
+                self.state = "in_value"
+
+            self.pos += 1
+
+        return completed
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        输出结束时调用
+
+        Returns:
+            解析得到的完整对象
+
+        Raises:
+            TruncatedResponseError: 未找到 JSON 对象或对象未闭合
+        """
+        if not self.started:
+            raise TruncatedResponseError("响应中没有 JSON 对象")
+        if not self.done:
+            raise TruncatedResponseError(f"JSON 未闭合（已解析 {len(self.result)} 个字段）")
+        return self.result
+
+    def _emit(self, raw: str) -> Tuple[str, Any]:
+        """记录一个完成的顶层字段"""
+        value = self._loads(raw.strip())
+        self.result[self.current_key] = value
+        self.state = "after_value"
+        return self.current_key, value
+
+    @staticmethod
+    def _loads(raw: str) -> Any:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise TruncatedResponseError(f"JSON 格式错误: {e}") from e
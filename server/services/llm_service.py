@@ -3,15 +3,148 @@ LLM 服务
 负责调用大语言模型进行字段提取
 """
 #print(">>> import llm_service...")
+import asyncio
+import contextvars
+import functools
 import json
 import os
-from typing import List, Dict, Optional
-import tiktoken
-from langchain_openai import ChatOpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple
+from . import adaptive_limiter, field_groups, hedging, metrics, prompt_templates, retrieval, single_flight, tokenizer, usage
+from .json_stream import IncrementalJSONParser, TruncatedResponseError
 from .log_service import push_progress
+from .logger import get_logger, log_payload
+from .model_registry import get_model_info
+from .prompt_templates import Prompt, prompt_text
+from .provider_pool import ProviderPool
+from .response_format import ResponseFormatError, build_response_format, parse_json_response, validate_fields
 
+logger = get_logger("llm_service")
 
-def split_by_tokens(text: str, max_tokens: int = 3000, overlap: int = 300) -> List[str]:
+
+# 每个字段预留的输出 token 数（用于输出预算与费用预估）
+OUTPUT_TOKENS_PER_FIELD = 150
+# 分块安全余量：本地 tokenizer 与模型实际 tokenizer 可能存在差异（未找到模型自己的 tokenizer 时使用 cl100k_base 或近似计数）
+SAFETY_RATIO = 0.1
+# 单块上限：过长的上下文会降低抽取质量并拉长单次调用耗时
+MAX_CHUNK_TOKENS = 100000
+# 流式模式下 JSON 被截断时的重试次数
+STREAM_RETRIES = 2
+# 流式模式下 JSON 闭合后，最多再读取的分片数（等待服务商在末尾返回的用量）
+USAGE_TAIL_PIECES = 8
+# Map / Reduce 调用专用线程池的线程数（等待并发名额的调用阻塞在线程中，不占用默认线程池）
+LLM_WORKERS = 64
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+        return _executor
+
+
+async def _run_in_llm_thread(func: Callable[..., Any], *args: Any) -> Any:
+    """在 LLM 调用专用线程池中执行（与 asyncio.to_thread 一样复制当前上下文）"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), functools.partial(context.run, func, *args))
+
+
+def _create_chat_model(model_name: str, api_key: str, base_url: str, temperature: float):
+    """创建 ChatOpenAI 实例（延迟导入 langchain_openai，加快服务启动）"""
+    from langchain_openai import ChatOpenAI
+
+    # 使用 langchain-openai 兼容各种 OpenAI 兼容 API
+    # 自适应并发开启时使用带响应钩子的 HTTP 客户端，SDK 内部重试的 429 / 5xx 也会报告给限制器
+    http_client = adaptive_limiter.http_client(model_name, base_url)
+    return ChatOpenAI(
+        model=model_name,
+        api_key=api_key,
+        base_url=base_url,
+        temperature=temperature,
+        **({"http_client": http_client} if http_client is not None else {})
+    )
+
+
+def count_tokens(text: str, model_name: str = "") -> int:
+    """统计文本 token 数（按模型选择 tokenizer，见 tokenizer.get_tokenizer）"""
+    return tokenizer.count_tokens(text, model_name)
+
+
+def chunk_token_lengths(total_tokens: int, chunk_size: int, overlap: int) -> List[int]:
+    """
+    计算 split_by_tokens 产生的各分块 token 数（不实际编解码，用于快速预估）
+
+    Args:
+        total_tokens: 文本总 token 数
+        chunk_size: 分块大小
+        overlap: 分块重叠 token 数
+
+    Returns:
+        各分块的 token 数列表
+    """
+    step = chunk_size - overlap
+    return [min(chunk_size, total_tokens - i) for i in range(0, total_tokens, step)]
+
+
+def build_map_prompt(chunk: str, fields: List[str], prompt_version: str = "") -> Prompt:
+    """构建 Map 阶段 prompt（提取与预估共用，保证 token 计数一致）；字段列表在固定前缀中，分块正文在最后"""
+    return prompt_templates.render_map(prompt_templates.get_template(prompt_version), chunk, fields)
+
+
+def build_reduce_prompt(results: List[Dict], prompt_version: str = "") -> Prompt:
+    """构建 Reduce 阶段 prompt"""
+    return prompt_templates.render_reduce(prompt_templates.get_template(prompt_version), results)
+
+
+def build_repair_prompt(output: str, fields: List[str], prompt_version: str = "") -> Prompt:
+    """构建格式修复 prompt（发回无法解析的输出，不包含分块正文）"""
+    return prompt_templates.render_repair(prompt_templates.get_template(prompt_version), output, fields)
+
+
+def estimate_output_tokens(fields: List[str]) -> int:
+    """预估单次提取调用的输出 token 数"""
+    return OUTPUT_TOKENS_PER_FIELD * len(fields) + 50
+
+
+def plan_chunk_size(model_name: str, fields: List[str], max_tokens: int = 0, overlap: int = 500, prompt_version: str = "") -> Tuple[int, int]:
+    """
+    分块规划：根据模型上下文窗口计算最大安全分块大小
+
+    可用输入 = 上下文窗口 - 输出预算 - prompt 固定开销 - 安全余量
+
+    Args:
+        model_name: 模型名称
+        fields: 需要提取的字段列表
+        max_tokens: 用户设置的分块上限（<= 0 表示自动）
+        overlap: 分块重叠 Token 数
+        prompt_version: prompt 模板版本（为空时使用默认版本）
+
+    Returns:
+        (chunk_size, overlap): 分块大小和调整后的重叠 token 数
+    """
+    info = get_model_info(model_name)
+    context_window = info["context_window"]
+
+    output_budget = min(info["max_output"], estimate_output_tokens(fields))
+    prompt_overhead = count_tokens(prompt_text(build_map_prompt("", fields, prompt_version)), model_name)
+    safety_margin = int(context_window * SAFETY_RATIO)
+
+    safe_size = context_window - output_budget - prompt_overhead - safety_margin
+    safe_size = max(500, min(safe_size, MAX_CHUNK_TOKENS))
+
+    chunk_size = min(max_tokens, safe_size) if max_tokens and max_tokens > 0 else safe_size
+    # 重叠不超过分块大小的四分之一，保证步长为正
+    overlap = max(0, min(overlap, chunk_size // 4))
+    return chunk_size, overlap
+
+
+def split_by_tokens(text: str, max_tokens: int = 3000, overlap: int = 300, model_name: str = "") -> List[str]:
     """
     按 token 分块，避免超过模型限制
 
@@ -19,30 +152,36 @@ def split_by_tokens(text: str, max_tokens: int = 3000, overlap: int = 300) -> Li
         text: 待分块的文本
         max_tokens: 每个块的最大 token 数
         overlap: 块之间的重叠 token 数
+        model_name: 模型名称（选择 tokenizer；tokenizer 不可用时按近似 token 数分块）
 
     Returns:
         分块后的文本列表
     """
-    if not text:
-        return []
+    chunks = tokenizer.split_text(text, max_tokens, overlap, model_name)
+    logger.debug("分块数量: %d, 每块 %d tokens, overlap %d", len(chunks), max_tokens, overlap)
+    return chunks
 
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
 
-    # 计算步长（每块token数 - overlap）
-    step = max_tokens - overlap
+def plan_retrieval_tasks(content: str, fields: List[str], chunk_size: int, options: retrieval.RetrievalOptions, model_name: str = "") -> List[Tuple[List[str], str]]:
+    """
+    检索模式的 Map 任务：文档切为小段落建立 BM25 索引，每组字段只取最相关的段落
 
-    chunks = []
-    for i in range(0, len(tokens), step):
-        chunk_tokens = tokens[i:i + max_tokens]
-        chunk_text = enc.decode(chunk_tokens)
-        chunks.append(chunk_text)
+    文档本身不超过一个分块时直接整篇发送（调用次数相同，不损失召回）
 
-    print(f"[split_by_tokens] 文本总 token 数: {len(tokens)}, 分块数量: {len(chunks)}, 每块 {max_tokens} tokens, overlap {overlap}")
-    return chunks
+    Returns:
+        [(字段列表, 发送给模型的正文), ...]
+    """
+    passage_tokens = max(100, min(options.passage_tokens, chunk_size))
+    passages = split_by_tokens(content, max_tokens=passage_tokens, overlap=min(retrieval.PASSAGE_OVERLAP, passage_tokens // 4), model_name=model_name)
+    max_passages = max(1, chunk_size // passage_tokens)
+    if len(passages) <= max_passages:
+        return [(list(fields), content)]
+
+    groups = retrieval.plan_groups(passages, fields, options, max_passages)
+    return [(group_fields, retrieval.build_context(passages, indexes)) for group_fields, indexes in groups]
 
 
-def extract_from_chunk(chunk: str, fields: List[str], model_name: str, api_key: str, base_url: str = "", temperature: float = 0.1) -> Dict:
+def extract_from_chunk(chunk: str, fields: List[str], model_name: str, api_key: str, base_url: str = "", temperature: float = 0.1, pool: Optional[ProviderPool] = None, stream: bool = False, on_field: Optional[Callable[[str, Any], None]] = None, prompt_version: str = "", hedge_policy: Optional[hedging.HedgePolicy] = None) -> Dict:
     """
     Map 阶段：从单个文本块中提取字段
 
@@ -53,39 +192,85 @@ def extract_from_chunk(chunk: str, fields: List[str], model_name: str, api_key:
         api_key: API 密钥
         base_url: API 端点 URL
         temperature: 温度参数
+        pool: 端点池（可选）
+        stream: 是否使用流式响应（JSON 截断时立即重试）
+        on_field: 流式模式下字段值完整时的回调
+        prompt_version: prompt 模板版本
+        hedge_policy: 对冲策略；启用时请求超过延迟分位数仍未返回会再发送一个相同的请求，先返回合法 JSON 的胜出
 
     Returns:
         提取结果字典
     """
+    prompt = build_map_prompt(chunk, fields, prompt_version)
 
-    fields_str = ", ".join(fields)
+    try:
+        if hedge_policy and hedge_policy.enabled:
+            # 对冲请求可发送到另一个配置的端点；未指定时使用原端点（端点池模式下由端点池重新选择）
+            hedge_model, hedge_key, hedge_url = hedge_policy.endpoint or (model_name, api_key, base_url)
+            hedge_pool = None if hedge_policy.endpoint else pool
+            data, raw = hedging.run_hedged(
+                lambda: _request_fields(prompt, fields, model_name, api_key, base_url, temperature, pool, stream, on_field),
+                lambda: _request_fields(prompt, fields, hedge_model, hedge_key, hedge_url, temperature, hedge_pool, stream),
+                model_name, hedge_policy, valid=lambda result: result[0] is not None,
+            )
+        else:
+            data, raw = _request_fields(prompt, fields, model_name, api_key, base_url, temperature, pool, stream, on_field)
+    except Exception:
+        # 调用失败（网络、鉴权等）时返回空值
+        return {field: "" for field in fields}
 
-    prompt = f"""请从以下论文片段中提取字段：{fields_str}
+    # 格式修复：输出不是合法 JSON 时只把原输出发回模型修正格式，不重发分块正文
+    if data is None and raw.strip():
+        logger.info("响应不是合法 JSON，请求修正格式")
+        metrics.record_retry("format_repair")
+        try:
+            data = _request_fields(build_repair_prompt(raw, fields, prompt_version), fields, model_name, api_key, base_url, temperature, pool)[0]
+        except Exception as e:
+            logger.warning("格式修复失败: %s", e)
 
-严格返回 JSON 格式，不要包含任何解释或额外内容。如果某个字段不存在，请返回空字符串。
+    extracted, invalid = validate_fields(data or {}, fields)
 
-片段内容：
-{chunk}
-"""
+    # 定向修复：只针对缺失/不合法的字段再发送一次分块正文，避免整块重跑
+    if invalid:
+        logger.info("字段缺失或不合法，定向修复: %s", invalid)
+        metrics.record_retry("repair")
+        try:
+            repaired = _request_fields(build_map_prompt(chunk, invalid, prompt_version), invalid, model_name, api_key, base_url, temperature, pool)[0]
+            extracted.update(validate_fields(repaired or {}, invalid)[0])
+        except Exception as e:
+            logger.warning("修复失败: %s", e)
 
-    try:
-        raw = call_llm(prompt, model_name, api_key, base_url, temperature)
-        print(f"[extract_from_chunk] 块原始返回: {raw[:500]}...")
+    return {field: extracted.get(field, "") for field in fields}
 
-        # 解析 JSON 响应
-        response = raw.strip()
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
 
-        return json.loads(response.strip())
-    except Exception as e:
-        # 当 LLM 返回的不是有效 JSON 时，直接返回空值（静默处理）
-        return {field: "" for field in fields}
+def _request_fields(prompt: Prompt, fields: List[str], model_name: str, api_key: str, base_url: str, temperature: float, pool: Optional[ProviderPool] = None, stream: bool = False, on_field: Optional[Callable[[str, Any], None]] = None) -> Tuple[Optional[Dict], str]:
+    """
+    发送一次结构化提取请求
+
+    Returns:
+        (data, raw): 解析后的 JSON 对象 和 原始输出；输出不是合法 JSON 时 data 为 None
+        （流式响应多次截断时 raw 为空，调用失败时抛出异常）
+    """
+    if stream:
+        for attempt in range(STREAM_RETRIES + 1):
+            try:
+                data = call_llm_stream(prompt, model_name, api_key, base_url, temperature, pool=pool, on_field=on_field, schema_fields=fields)
+                return data, ""
+            except TruncatedResponseError as e:
+                logger.warning("响应不完整（第 %d 次）: %s", attempt + 1, e)
+                if attempt < STREAM_RETRIES:
+                    metrics.record_retry("truncated")
+        return None, ""
+
+    raw = call_llm(prompt, model_name, api_key, base_url, temperature, pool=pool, schema_fields=fields)
+    try:
+        return parse_json_response(raw), raw
+    except ResponseFormatError as e:
+        logger.warning("响应不是合法 JSON: %s", e)
+        return None, raw or ""
 
 
-def merge_results(results: List[Dict], fields: List[str], model_name: str, api_key: str, base_url: str = "") -> Dict:
+def merge_results(results: List[Dict], fields: List[str], model_name: str, api_key: str, base_url: str = "", pool: Optional[ProviderPool] = None, prompt_version: str = "") -> Dict:
     """
     Reduce 阶段：合并多个文本块的提取结果
 
@@ -95,6 +280,8 @@ def merge_results(results: List[Dict], fields: List[str], model_name: str, api_k
         model_name: 模型名称
         api_key: API 密钥
         base_url: API 端点 URL
+        pool: 端点池（可选）
+        prompt_version: prompt 模板版本
 
     Returns:
         合并后的最终结果
@@ -105,62 +292,50 @@ def merge_results(results: List[Dict], fields: List[str], model_name: str, api_k
     if len(results) == 1:
         return results[0]
 
-    prompt = f"""以下是多个论文片段提取结果：
-
-{json.dumps(results, ensure_ascii=False, indent=2)}
-
-请合并为最终结果。
-规则：
-1. 如果多个片段都有值，选择最完整的（非空）值。
-2. 不要丢失任何信息。
-3. 严格返回 JSON 格式，不要包含任何解释。
-
-输出格式：
-{{
-    "字段名": "合并后的值",
-    ...
-}}
-"""
+    prompt = build_reduce_prompt(results, prompt_version)
 
     try:
-        raw = call_llm(prompt, model_name, api_key, base_url)
-        print(f"[merge_results] 合并原始返回: {raw[:500]}...")
+        # Reduce 的耗时主要取决于输出长度，不参与自适应并发的延迟突增判断
+        with adaptive_limiter.without_spike_detection():
+            raw = call_llm(prompt, model_name, api_key, base_url, pool=pool, schema_fields=fields)
+        merged, invalid = validate_fields(parse_json_response(raw), fields)
+    except Exception as e:
+        logger.warning("合并结果解析失败: %s", e)
+        merged, invalid = {}, list(fields)
 
-        # 解析 JSON 响应
-        response = raw.strip()
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
+    # 回退策略：缺失/不合法的字段取第一个非空的分块结果
+    for field in invalid:
+        merged[field] = next((result[field] for result in results if result.get(field)), "")
 
-        return json.loads(response.strip())
-    except Exception as e:
-        print(f"[merge_results] 解析失败: {e}")
-        # 回退策略：取第一个非空值
-        fallback = {}
-        for field in fields:
-            for result in results:
-                if result.get(field):
-                    fallback[field] = result[field]
-                    break
-            else:
-                fallback[field] = ""
-        return fallback
+    return {field: merged.get(field, "") for field in fields}
 
 
-async def extract_fields_advanced(content: str, fields: List[str], model_name: str, api_key: str, base_url: str, max_tokens: int = 10000, overlap: int = 500, temperature: float = 0.1, file_name: str = "", file_index: int = 0, total_files: int = 1) -> Dict:
+async def extract_fields_advanced(content: str, fields: List[str], model_name: str, api_key: str, base_url: str, max_tokens: int = 10000, overlap: int = 500, temperature: float = 0.1, file_name: str = "", file_index: int = 0, total_files: int = 1, concurrency: int = 1, pool: Optional[ProviderPool] = None, stream: bool = False, retrieval_options: Optional[retrieval.RetrievalOptions] = None, field_group_plan: Optional[List[List[str]]] = None, prompt_version: str = "", hedge_policy: Optional[hedging.HedgePolicy] = None, semaphore: Optional[asyncio.Semaphore] = None) -> Dict:
     """
     高级字段提取：Token-aware 分块 + Map-Reduce
 
+    字段分组（field_group_plan 多于一组）：每个分块按组拆成多个并发的短请求；Reduce 同样按组并发，各组结果拼接为最终结果
+
+    检索模式（retrieval_options 不为空）：不再把每个分块都发送给模型，而是按字段检索最相关的段落，
+    每组字段一次调用；各组字段互不重叠，无需 Reduce
+
     Args:
         content: 完整的文本内容
         fields: 需要提取的字段列表
         model_name: 模型名称
         api_key: API 密钥
         base_url: API 端点 URL
-        max_tokens: 分块最大 Token 数
+        max_tokens: 分块上限 Token 数（<= 0 表示按模型上下文窗口自动规划）
         overlap: 分块重叠 Token 数
         temperature: 温度参数
+        concurrency: Map 阶段最大并发请求数（启用自适应并发时只作为各端点的初始上限）
+        pool: 端点池（可选），指定时请求分发到多个端点
+        stream: 是否使用流式响应（逐字段推送进度）
+        retrieval_options: 检索模式选项（为空时使用 Map-Reduce）
+        field_group_plan: 字段分组（field_groups.plan_field_groups 生成），为空时所有字段一次请求
+        prompt_version: prompt 模板版本（为空时取 PAPER_EXTRACT_PROMPT_VERSION，默认 v2）
+        hedge_policy: Map 调用的对冲策略（为空时不对冲）
+        semaphore: 共享的任务扇出上限（同一文档多个页面范围分组并发提取时共用），为空时按 adaptive_limiter.task_limit() 新建
 
     Returns:
         提取结果字典（包含 parsed 和 raw 字段）
@@ -176,26 +351,79 @@ async def extract_fields_advanced(content: str, fields: List[str], model_name: s
         "totalFiles": total_files,
         "progress": 10.0
     })
-    chunks = split_by_tokens(content, max_tokens=max_tokens, overlap=overlap)
-
-    # 2. Map 阶段：每块提取字段 (10%-90%)
-    partial_results = []
-    chunk_count = len(chunks)
-    for i, chunk in enumerate(chunks):
-
-        # 推送分块进度：10% + 80% * (i+1) / chunk_count
-        extracting_progress = 10.0 + 80.0 * (i) / chunk_count
-        await push_progress({
+    # 分组后单次请求的输出预算按最大的一组计算；端点池模式按上下文窗口最小的成员规划
+    field_plan = field_groups.split_fields(fields, field_group_plan)
+    plan_model = pool.planning_model() if pool else model_name
+    chunk_size, overlap = plan_chunk_size(plan_model, max(field_plan, key=len), max_tokens, overlap, prompt_version)
+    with metrics.span("chunk", file=file_name):
+        if retrieval_options:
+            tasks = plan_retrieval_tasks(content, fields, chunk_size, retrieval_options, plan_model)
+        else:
+            tasks = [(fields, chunk) for chunk in split_by_tokens(content, max_tokens=chunk_size, overlap=overlap, model_name=plan_model)]
+    if retrieval_options:
+        logger.info("检索模式: %s 共 %d 次调用", file_name, len(tasks))
+
+    # 2. Map 阶段：每块提取字段 (10%-90%)，块之间并发执行
+    chunk_count = len(tasks)
+    # 实际并发由各端点的自适应限制器决定，这里只限制任务扇出（未启用自适应并发时即为 concurrency）
+    semaphore = semaphore or asyncio.Semaphore(adaptive_limiter.task_limit(concurrency, len(pool) if pool else 1))
+    loop = asyncio.get_running_loop()
+    # 各分块已完成的字段数（流式模式下逐字段更新）
+    fields_done = [0] * chunk_count
+
+    def extracting_progress() -> Dict:
+        # 10% + 80% * 已完成比例
+        done = sum(min(1.0, n / max(1, len(task_fields))) for n, (task_fields, _) in zip(fields_done, tasks))
+        return {
             "currentFile": file_name,
             "currentStep": "extracting",
             "currentFileIndex": file_index,
             "totalFiles": total_files,
-            "progress": extracting_progress
-        })
-
-        result = extract_from_chunk(chunk, fields, model_name, api_key, base_url, temperature)
+            "progress": 10.0 + 80.0 * done / chunk_count
+        }
 
-        # 检查是否有错误
+    def field_callback(index: int) -> Optional[Callable[[str, Any], None]]:
+        if not stream:
+            return None
+
+        def on_field(key: str, value: Any) -> None:
+            # 在工作线程中调用，进度推送交回事件循环
+            fields_done[index] += 1
+            asyncio.run_coroutine_threadsafe(push_progress(extracting_progress()), loop)
+        return on_field
+
+    async def map_group(index: int, group: List[str], chunk: str) -> Dict:
+        metrics.MAP_QUEUE_DEPTH.inc()
+        async with semaphore:
+            metrics.MAP_QUEUE_DEPTH.dec()
+            with metrics.span("map", file=file_name, chunk=index, fields=len(group)):
+                result = await _run_in_llm_thread(
+                    extract_from_chunk, chunk, group, model_name, api_key, base_url, temperature, pool,
+                    stream, field_callback(index), prompt_version, hedge_policy
+                )
+
+        if not stream:
+            fields_done[index] += len(group)
+            await push_progress(extracting_progress())
+        return result
+
+    async def map_chunk(index: int, task_fields: List[str], chunk: str) -> Dict:
+        # 字段分组：同一分块的各组并发请求，一组失败只影响该组字段
+        groups = field_groups.split_fields(task_fields, field_group_plan)
+        with usage.scope(f"chunk#{index}"):
+            results = await asyncio.gather(*(map_group(index, group, chunk) for group in groups))
+        merged: Dict = {}
+        for result in results:
+            merged.update(result)
+
+        fields_done[index] = len(task_fields)
+        await push_progress(extracting_progress())
+        return {field: merged.get(field, "") for field in task_fields}
+
+    partial_results = await asyncio.gather(*(map_chunk(i, task_fields, chunk) for i, (task_fields, chunk) in enumerate(tasks)))
+
+    # 检查是否有错误
+    for result in partial_results:
         if result.get("error"):
             return {
                 "parsed": {field: "" for field in fields},
@@ -203,8 +431,6 @@ async def extract_fields_advanced(content: str, fields: List[str], model_name: s
                 "error": result.get("error")
             }
 
-        partial_results.append(result)
-
     # 3. Reduce 阶段：合并结果
     await push_progress({
         "currentFile": file_name,
@@ -215,7 +441,26 @@ async def extract_fields_advanced(content: str, fields: List[str], model_name: s
     })   
     
     try:
-        final_result = merge_results(partial_results, fields, model_name, api_key, base_url)
+        if retrieval_options:
+            # 检索模式下每个字段只在一个组中提取，直接合并
+            final_result = {field: "" for field in fields}
+            for result in partial_results:
+                final_result.update(result)
+        else:
+            # 按字段分组并发 Reduce，每组只发送该组字段的分块结果，输出更短
+            async def reduce_group(group: List[str]) -> Dict:
+                group_results = [{field: result.get(field, "") for field in group} for result in partial_results]
+                async with semaphore:
+                    with metrics.span("reduce", file=file_name, fields=len(group)):
+                        return await _run_in_llm_thread(
+                            merge_results, group_results, group, model_name, api_key, base_url, pool, prompt_version
+                        )
+
+            with usage.scope("reduce"):
+                reduced = await asyncio.gather(*(reduce_group(group) for group in field_groups.split_fields(fields, field_group_plan)))
+            final_result = {field: "" for field in fields}
+            for result in reduced:
+                final_result.update(result)
 
         return {
             "parsed": final_result,
@@ -230,39 +475,217 @@ async def extract_fields_advanced(content: str, fields: List[str], model_name: s
         }
 
 
-def call_llm(prompt: str, model_name: str, api_key: str = "", base_url: str = "", temperature: float = 0.1) -> str:
+def call_llm(prompt: Prompt, model_name: str, api_key: str = "", base_url: str = "", temperature: float = 0.1, pool: Optional[ProviderPool] = None, schema_fields: Optional[List[str]] = None) -> str:
     """
     调用 LLM API
 
     Args:
-        prompt: 提示词
+        prompt: 提示词（文本或 [(角色, 内容), ...] 消息列表）
         model_name: 模型名称
         api_key: API 密钥
         base_url: API 端点 URL
         temperature: 温度参数，控制输出随机性
+        pool: 端点池；指定时忽略 model_name/api_key/base_url，由端点池选择端点并在失败时切换
+        schema_fields: 期望返回的 JSON 字段；指定时按模型能力启用 JSON Schema / JSON Mode
+
+    Returns:
+        LLM 返回的文本（相同的请求正在进行时共享它的结果，不重复发送）
+    """
+    def invoke() -> str:
+        if pool is None:
+            return _invoke_llm(prompt, model_name, api_key, base_url, temperature, schema_fields)
+        return _call_with_pool(pool, lambda m, k, u: _invoke_llm(prompt, m, k, u, temperature, schema_fields))
+
+    return single_flight.run("invoke", prompt, model_name, base_url, temperature, schema_fields, invoke, api_key)[0]
+
+
+def call_llm_stream(prompt: Prompt, model_name: str, api_key: str = "", base_url: str = "", temperature: float = 0.1, pool: Optional[ProviderPool] = None, on_field: Optional[Callable[[str, Any], None]] = None, schema_fields: Optional[List[str]] = None) -> Dict:
+    """
+    流式调用 LLM，边接收边增量解析 JSON
+
+    Args:
+        prompt: 提示词
+        model_name: 模型名称
+        api_key: API 密钥
+        base_url: API 端点 URL
+        temperature: 温度参数
+        pool: 端点池（可选）
+        on_field: 某个字段值完整时的回调 (字段名, 值)
+        schema_fields: 期望返回的 JSON 字段；指定时按模型能力启用 JSON Schema / JSON Mode
 
     Returns:
-        LLM 返回的文本
+        解析后的 JSON 对象（相同的请求正在进行时共享它的结果，不重复发送）
+
+    Raises:
+        TruncatedResponseError: 输出的 JSON 被截断或格式错误
     """
+    def invoke() -> Dict:
+        if pool is None:
+            return _stream_llm(prompt, model_name, api_key, base_url, temperature, on_field, schema_fields)
+        return _call_with_pool(pool, lambda m, k, u: _stream_llm(prompt, m, k, u, temperature, on_field, schema_fields))
 
+    data, shared = single_flight.run("stream", prompt, model_name, base_url, temperature, schema_fields, invoke, api_key)
+    if shared and on_field is not None:
+        # 共享的结果没有经过本请求的增量解析，逐个字段补发回调
+        for field, value in data.items():
+            on_field(field, value)
+    return data
+
+
+def _call_with_pool(pool: ProviderPool, invoke: Callable[[str, str, str], Any]) -> Any:
+    """
+    端点池模式：依次尝试不同端点，直到成功或全部失败
+
+    Args:
+        pool: 端点池
+        invoke: 实际调用函数 (model_name, api_key, base_url) -> 结果
+    """
+    tried = []
+    last_error = None
+    for _ in range(len(pool)):
+        endpoint = pool.acquire(exclude=tried)
+        try:
+            result = invoke(endpoint.model_name, endpoint.api_key, endpoint.base_url)
+        except (TruncatedResponseError, hedging.HedgeCancelled):
+            # 输出内容问题或对冲落败被取消，端点本身可用，由调用方决定是否重试
+            pool.release(endpoint, success=True)
+            raise
+        except Exception as e:
+            pool.release(endpoint, success=False)
+            tried.append(endpoint)
+            last_error = e
+            logger.warning("端点 %s 调用失败，切换端点: %s", endpoint.name, e)
+            if len(tried) < len(pool):
+                metrics.record_retry("failover")
+            continue
+        pool.release(endpoint, success=True)
+        return result
+
+    raise last_error
+
+
+def _stream_llm(prompt: Prompt, model_name: str, api_key: str, base_url: str, temperature: float, on_field: Optional[Callable[[str, Any], None]] = None, schema_fields: Optional[List[str]] = None) -> Dict:
+    """向单个端点发送流式请求，顶层 JSON 闭合后立即停止接收"""
+    llm = _create_chat_model(model_name, api_key, base_url, temperature)
+
+    log_payload(logger, "请求 prompt", prompt_text(prompt))
+    parser = IncrementalJSONParser()
+    usage_piece = None
+    tail = 0
+    with adaptive_limiter.slot(model_name, base_url) as call, metrics.llm_request(model_name, base_url):
+        # 耗时不含等待并发名额的时间
+        begin = time.perf_counter()
+        hedging.start_request(lambda hedge: _record_usage(model_name, prompt, parser.buffer, None, time.perf_counter() - begin, hedge))
+        for piece in llm.stream(prompt, stream_usage=True, **_format_kwargs(model_name, schema_fields)):
+            if hedging.cancelled():
+                # 对冲中另一个请求已胜出，停止接收（用量已在取消时按本地估算记录）
+                raise hedging.HedgeCancelled()
+            if getattr(piece, "usage_metadata", None):
+                usage_piece = piece
+            if parser.done:
+                # 顶层 JSON 已闭合：只再等待少量分片读取用量，不等待模型输出多余内容
+                tail += 1
+                if usage_piece is not None or tail > USAGE_TAIL_PIECES:
+                    break
+                continue
+            for key, value in parser.feed(piece.content or ""):
+                if on_field:
+                    on_field(key, value)
+            if parser.done and usage_piece is not None:
+                break
+        call.output_tokens = _record_usage(model_name, prompt, parser.buffer, usage_piece, time.perf_counter() - begin)
+
+    logger.debug("模型 %s 流式响应长度: %d", model_name, len(parser.buffer))
+    return parser.finish()
+
+
+def _format_kwargs(model_name: str, schema_fields: Optional[List[str]]) -> Dict:
+    """按实际调用的模型生成 response_format 参数（端点池中各端点模型可能不同）"""
+    if not schema_fields:
+        return {}
+    response_format = build_response_format(model_name, schema_fields)
+    return {"response_format": response_format} if response_format else {}
+
+
+def _cached_tokens(message: Any) -> int:
+    """
+    响应中命中服务商前缀缓存的输入 token 数（服务商未返回时为 0）
+
+    优先读取 LangChain 的 usage_metadata.input_token_details.cache_read，
+    其次读取 OpenAI 兼容格式的 usage.prompt_tokens_details.cached_tokens
+    """
+    usage_metadata = getattr(message, "usage_metadata", None) or {}
+    cached = (usage_metadata.get("input_token_details") or {}).get("cache_read")
+    if cached is None:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return int(cached or 0)
+
+
+def _provider_usage(message: Any) -> Optional[Tuple[int, int, int]]:
+    """
+    服务商返回的用量 (输入, 输出, 缓存命中)；未返回时为 None
+
+    读取 LangChain 的 usage_metadata，其次读取 OpenAI 兼容格式的 response_metadata.token_usage
+    """
+    usage_metadata = getattr(message, "usage_metadata", None) or {}
+    if usage_metadata.get("input_tokens") or usage_metadata.get("output_tokens"):
+        return usage_metadata.get("input_tokens", 0), usage_metadata.get("output_tokens", 0), _cached_tokens(message)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage.get("prompt_tokens") or token_usage.get("completion_tokens"):
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0), _cached_tokens(message)
+    return None
+
+
+def _record_usage(model_name: str, prompt: Prompt, output: str, message: Any, seconds: float, hedge: Optional[bool] = None) -> int:
+    """
+    记录一次调用的用量：优先使用服务商返回的数值，未返回时按本地 tokenizer 估算
+
+    对冲中落败的请求在取消时已记录估算用量，之后返回的实际用量不再重复记录
+
+    Args:
+        hedge: 是否为对冲请求（为空时从当前上下文读取）
+
+    Returns:
+        输出 token 数（供自适应并发区分长输出调用）
+    """
+    if hedge is None:
+        if not hedging.finish_request():
+            return 0
+        hedge = hedging.is_hedge()
+    reported = _provider_usage(message)
+    if reported:
+        prompt_tokens, completion_tokens, cached_tokens = reported
+    else:
+        prompt_tokens, completion_tokens, cached_tokens = count_tokens(prompt_text(prompt), model_name), count_tokens(output, model_name), 0
+    metrics.record_tokens(model_name, prompt_tokens, completion_tokens)
+    if cached_tokens:
+        metrics.record_cached_tokens(model_name, cached_tokens)
+    item = usage.record(model_name, prompt_tokens, completion_tokens, cached_tokens, seconds, estimated=reported is None, hedge=hedge)
+    metrics.LLM_COST.inc(item.cost, model=model_name)
+    return completion_tokens
+
+
+def _invoke_llm(prompt: Prompt, model_name: str, api_key: str, base_url: str, temperature: float, schema_fields: Optional[List[str]] = None) -> str:
+    """向单个端点发送请求"""
     try:
-        print(f"[call_llm]: 创建大模型对象，模型名称为{model_name}")
-        # 使用 langchain-openai 兼容各种 OpenAI 兼容 API
-        llm = ChatOpenAI(
-            model=model_name,
-            api_key=api_key,
-            base_url=base_url,
-            temperature=temperature
-        )
-
-        response = llm.invoke(prompt)
-        print(f"[call_llm] 响应类型: {type(response)}, content长度: {len(response.content) if response.content else 0}")
-        print(f"[call_llm] 原始响应内容: {response.content}")
+        llm = _create_chat_model(model_name, api_key, base_url, temperature)
+
+        log_payload(logger, "请求 prompt", prompt_text(prompt))
+        with adaptive_limiter.slot(model_name, base_url) as call, metrics.llm_request(model_name, base_url):
+            begin = time.perf_counter()
+            # 非流式请求无法中断：落败时按输入估算记录用量，实际用量返回后不再重复记录
+            hedging.start_request(lambda hedge: _record_usage(model_name, prompt, "", None, time.perf_counter() - begin, hedge))
+            response = llm.invoke(prompt, **_format_kwargs(model_name, schema_fields))
+            call.output_tokens = _record_usage(model_name, prompt, response.content or "", response, time.perf_counter() - begin)
+        logger.debug("模型 %s 响应长度: %d", model_name, len(response.content) if response.content else 0)
+        log_payload(logger, "原始响应内容", response.content)
         return response.content
+    except hedging.HedgeCancelled:
+        raise
     except Exception as e:
-        import traceback
-        print(f"[call_llm] 调用失败: {e}")
-        print(f"[call_llm] 详细堆栈: {traceback.format_exc()}")
+        logger.error("模型 %s 调用失败: %s", model_name, e)
+        logger.debug("调用失败详细堆栈", exc_info=True)
         raise
 
 
@@ -299,7 +722,7 @@ def extract_fields(content: str, fields: List[str], model_name: str = "qwen-max"
 
     # 检查 API Key 是否为空
     if not api_key:
-        print("[ERROR] API Key 为空")
+        logger.error("API Key 为空")
         return {
             "parsed": {field: "" for field in fields},
             "raw": "",
@@ -308,18 +731,12 @@ def extract_fields(content: str, fields: List[str], model_name: str = "qwen-max"
 
     try:
         # 调用 LLM
-        raw_response = call_llm(prompt, model_name, api_key)
-        print(f"[DEBUG] LLM 完整原始响应: {raw_response}")
-
-        # 解析 JSON 响应
-        # 尝试提取 JSON 部分
-        response = raw_response.strip()
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
-
-        parsed_result = json.loads(response.strip())
+        raw_response = call_llm(prompt, model_name, api_key, schema_fields=fields)
+        log_payload(logger, "LLM 完整原始响应", raw_response)
+
+        # 解析并按 Schema 校验，缺失字段补空字符串
+        parsed_result, _ = validate_fields(parse_json_response(raw_response), fields)
+        parsed_result = {field: parsed_result.get(field, "") for field in fields}
 
         # 返回包含解析结果和原始结果
         return {
@@ -6,6 +6,9 @@
 import asyncio
 from fastapi import WebSocket
 from typing import List
+from .logger import get_logger, redact
+
+logger = get_logger("log_service")
 
 
 class ConnectionManager:
@@ -41,10 +44,10 @@ class ConnectionManager:
                     timeout=1.0
                 )
             except asyncio.TimeoutError:
-                print("[log_service] 发送超时，断开连接")
+                logger.warning("发送超时，断开连接")
                 self.disconnect(connection)
             except Exception:
-                print("[log_service] 发送失败，断开连接")
+                logger.warning("发送失败，断开连接")
                 self.disconnect(connection)
 
 
@@ -63,10 +66,10 @@ async def push_log(module: str, message: str) -> None:
     try:
         await manager.broadcast({
             "module": module,
-            "message": message
+            "message": redact(message)
         })
     except Exception as e:
-        print(f"[log_service] push_log 异常: {e}")
+        logger.warning("push_log 异常: %s", e)
 
 
 async def push_progress(data: dict) -> None:
@@ -82,4 +85,4 @@ async def push_progress(data: dict) -> None:
             "data": data
         })
     except Exception as e:
-        print(f"[log_service] push_progress 异常: {e}")
+        logger.warning("push_progress 异常: %s", e)
@@ -0,0 +1,142 @@
+"""
+日志服务（后端进程日志）
+分级日志 + 队列非阻塞输出：业务线程只把日志记录放入队列，由后台线程写控制台和滚动日志文件（数据目录 logs/）；
+输出前脱敏 API Key。请求/响应原文（payload）默认不记录
+
+环境变量：
+    PAPER_EXTRACT_LOG_LEVEL     日志级别（DEBUG / INFO / WARNING / ERROR），默认 INFO
+    PAPER_EXTRACT_LOG_PAYLOADS  设为 1 时记录 LLM 请求与响应原文（DEBUG 级别，仍会脱敏）
+
+注意：WebSocket 推送给前端的解析日志仍由 log_service.push_log 负责
+"""
+#print(">>> import logger...")
+import atexit
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional, Set
+
+
+ROOT_LOGGER = "paper_extract"
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+LOG_FILE_NAME = "server.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+# 常见密钥格式：OpenAI / DashScope 风格的 sk-...、Bearer token、键值对形式的 api_key
+_SECRET_PATTERNS = [
+    re.compile(r"sk-[A-Za-z0-9_\-]{8,}"),
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9_\-\.]{8,}"),
+    re.compile(r"(?i)(api[_-]?key[\"']?\s*[:=]\s*[\"']?)[^\s\"',}]{4,}"),
+]
+REDACTED = "***"
+
+_secrets: Set[str] = set()
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def register_secret(value: str) -> None:
+    """登记需要脱敏的值（如配置中的 API Key），之后的日志中出现时会被替换"""
+    if value and len(value) >= 6:
+        _secrets.add(value)
+
+
+def redact(text: str) -> str:
+    """替换文本中的密钥"""
+    for secret in list(_secrets):
+        if secret in text:
+            text = text.replace(secret, REDACTED)
+    for pattern in _SECRET_PATTERNS:
+        text = pattern.sub(lambda m: (m.group(1) if m.groups() else "") + REDACTED, text)
+    return text
+
+
+class RedactingFormatter(logging.Formatter):
+    """格式化后再脱敏（在日志线程中执行，不占用业务线程）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+def payloads_enabled() -> bool:
+    """是否记录 LLM 请求/响应原文"""
+    return os.environ.get("PAPER_EXTRACT_LOG_PAYLOADS", "").lower() in ("1", "true", "yes")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取模块日志器（paper_extract.<name>）"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_payload(logger: logging.Logger, label: str, text: str) -> None:
+    """记录 LLM 原文，仅在 PAPER_EXTRACT_LOG_PAYLOADS 开启时输出"""
+    if payloads_enabled() and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %s", label, text)
+
+
+def get_log_dir() -> str:
+    """获取日志目录（位于数据目录下）"""
+    # 延迟导入：config_service 读取配置时会调用 register_secret
+    from .config_service import get_data_dir
+    log_dir = os.path.join(get_data_dir(), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    return log_dir
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """
+    初始化日志（可重复调用，只生效一次）
+
+    Args:
+        level: 日志级别，默认读取 PAPER_EXTRACT_LOG_LEVEL，未设置时为 INFO
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        level_name = (level or os.environ.get("PAPER_EXTRACT_LOG_LEVEL") or "INFO").upper()
+        if payloads_enabled():
+            level_name = "DEBUG"
+
+        # Windows 控制台默认编码不是 UTF-8，输出中文会报错
+        if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
+            sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+
+        formatter = RedactingFormatter(LOG_FORMAT)
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(formatter)
+        handlers = [console]
+        try:
+            file_handler = RotatingFileHandler(
+                os.path.join(get_log_dir(), LOG_FILE_NAME),
+                maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8",
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            sys.stderr.write(f"[logger] 无法创建日志文件，仅输出到控制台: {e}\n")
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, level_name, logging.INFO))
+        root.addHandler(QueueHandler(log_queue))
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """停止日志线程并写出队列中剩余的日志"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
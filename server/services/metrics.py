@@ -0,0 +1,315 @@
+"""
+运行指标服务
+轻量级的计数器 / 仪表 / 直方图实现与阶段计时（span），
+以 Prometheus 文本格式导出（/api/metrics），并按解析任务汇总各阶段耗时
+"""
+#print(">>> import metrics...")
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+
+# 秒级直方图默认分桶（覆盖本地解析的毫秒级到 LLM 调用的分钟级）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """指标基类：按标签值组合保存样本"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines += self._render_sample(key, value)
+        return lines
+
+    def _render_sample(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_sample(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(total, 6)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+STAGE_SECONDS = Histogram("paper_extract_stage_seconds", "各阶段耗时（秒）", ["stage"])
+LLM_REQUEST_SECONDS = Histogram("paper_extract_llm_request_seconds", "单次 LLM 请求耗时（秒）", ["model", "host", "status"])
+LLM_RETRIES = Counter("paper_extract_llm_retries_total", "LLM 重试次数（端点切换 / 响应截断 / 格式修复 / 字段修复）", ["reason"])
+LLM_TOKENS = Counter("paper_extract_llm_tokens_total", "LLM 输入/输出 token 数（服务商返回的用量，未返回时本地 tokenizer 估算）", ["direction", "model"])
+LLM_COST = Counter("paper_extract_llm_cost_total", "LLM 调用费用（元，按模型注册表价格计算）", ["model"])
+LLM_IN_FLIGHT = Gauge("paper_extract_llm_in_flight", "正在进行的 LLM 请求数")
+LLM_HEDGES = Counter("paper_extract_llm_hedges_total", "对冲请求次数（launched 发送，primary_won / hedge_won 胜出方）", ["result"])
+LLM_CONCURRENCY_LIMIT = Gauge("paper_extract_llm_concurrency_limit", "自适应并发控制当前的并发上限", ["endpoint"])
+LLM_LIMIT_DECREASES = Counter("paper_extract_llm_limit_decreases_total", "自适应并发控制减小上限的次数", ["endpoint", "reason"])
+CACHE_REQUESTS = Counter("paper_extract_cache_requests_total", "缓存查询次数", ["cache", "result"])
+MAP_QUEUE_DEPTH = Gauge("paper_extract_map_queue_depth", "等待并发槽位的 Map 分块数")
+LLM_CACHED_TOKENS = Counter("paper_extract_llm_cached_tokens_total", "命中服务商前缀缓存的输入 token 数（服务商返回时记录）", ["model"])
+NORMALIZE_TOKENS_SAVED = Counter("paper_extract_normalize_tokens_saved_total", "文本规范化节省的 token 数（本地 tokenizer 估算）")
+FILES = Counter("paper_extract_files_total", "处理的文件数", ["status"])
+JOBS = Counter("paper_extract_jobs_total", "解析任务数", ["status"])
+
+
+class JobMetrics:
+    """单个解析任务的指标汇总（线程安全，Map 阶段在工作线程中记录）"""
+
+    def __init__(self, total_files: int = 0):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.total_files = total_files
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        # stage -> {count, seconds, max, slowest(tags)}
+        self.stages: Dict[str, Dict] = {}
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.llm_seconds = 0.0
+        self.retries = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.tokens_cached = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record_stage(self, stage: str, seconds: float, tags: Dict) -> None:
+        with self._lock:
+            item = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max": 0.0, "slowest": {}})
+            item["count"] += 1
+            item["seconds"] += seconds
+            if seconds >= item["max"]:
+                item["max"] = seconds
+                item["slowest"] = tags
+
+    def set_total_files(self, total_files: int) -> None:
+        """更新文件总数（流式发现时总数随发现的文件增加）"""
+        with self._lock:
+            self.total_files = total_files
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "files": self.total_files,
+                "seconds": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    stage: {
+                        "count": item["count"],
+                        "seconds": round(item["seconds"], 3),
+                        "max": round(item["max"], 3),
+                        "slowest": item["slowest"],
+                    }
+                    for stage, item in self.stages.items()
+                },
+                "llm": {
+                    "calls": self.llm_calls,
+                    "errors": self.llm_errors,
+                    "seconds": round(self.llm_seconds, 3),
+                    "retries": self.retries,
+                    "tokens_in": self.tokens_in,
+                    "tokens_out": self.tokens_out,
+                    "tokens_cached": self.tokens_cached,
+                },
+                "cache": {"hits": self.cache_hits, "misses": self.cache_misses},
+            }
+
+    def summary_text(self) -> str:
+        """一行文本摘要（写入解析日志）"""
+        data = self.summary()
+        stages = ", ".join(
+            f"{stage} {item['seconds']:.2f}s/{item['count']}次" for stage, item in data["stages"].items()
+        )
+        llm = data["llm"]
+        slowest = data["stages"].get("map", {}).get("slowest")
+        if slowest:
+            stages += f"（最慢分块 {slowest.get('file', '')}#{slowest.get('chunk', '')} {data['stages']['map']['max']:.2f}s）"
+        return (
+            f"任务 {data['job_id']} 耗时 {data['seconds']:.2f}s | 阶段: {stages or '无'} | "
+            f"LLM 调用 {llm['calls']} 次（失败 {llm['errors']}，重试 {llm['retries']}，累计 {llm['seconds']:.2f}s），"
+            f"token 输入 {llm['tokens_in']}（缓存命中 {llm['tokens_cached']}）/ 输出 {llm['tokens_out']} | "
+            f"缓存命中 {data['cache']['hits']} / 未命中 {data['cache']['misses']}"
+        )
+
+
+# 当前任务（asyncio.to_thread 会复制上下文，工作线程中同样可见）
+_current_job: contextvars.ContextVar[Optional[JobMetrics]] = contextvars.ContextVar("current_job", default=None)
+
+
+def start_job(total_files: int = 0) -> JobMetrics:
+    """开始一个解析任务，之后在同一上下文中记录的指标都会计入该任务"""
+    job = JobMetrics(total_files)
+    _current_job.set(job)
+    return job
+
+
+def finish_job(job: JobMetrics, status: str = "success") -> None:
+    JOBS.inc(status=status)
+    _current_job.set(None)
+
+
+def current_job() -> Optional[JobMetrics]:
+    return _current_job.get()
+
+
+@contextmanager
+def span(stage: str, **tags):
+    """
+    记录一个阶段的耗时
+
+    Args:
+        stage: 阶段名（parse / tokenize / chunk / map / reduce / export）
+        tags: 附加标签（file / chunk 等），只记录在任务汇总中，不作为 Prometheus 标签
+    """
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - begin
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        job = _current_job.get()
+        if job is not None:
+            job.record_stage(stage, elapsed, {**tags, "job": job.job_id})
+
+
+@contextmanager
+def llm_request(model_name: str, base_url: str = ""):
+    """记录单次 LLM 请求的耗时与成功/失败"""
+    host = urlparse(base_url).netloc or "default"
+    LLM_IN_FLIGHT.inc()
+    begin = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        elapsed = time.perf_counter() - begin
+        LLM_IN_FLIGHT.dec()
+        LLM_REQUEST_SECONDS.observe(elapsed, model=model_name, host=host, status=status)
+        job = _current_job.get()
+        if job is not None:
+            job.add(llm_calls=1, llm_seconds=elapsed, llm_errors=int(status != "ok"))
+
+
+def record_tokens(model_name: str, tokens_in: int, tokens_out: int) -> None:
+    LLM_TOKENS.inc(tokens_in, direction="in", model=model_name)
+    LLM_TOKENS.inc(tokens_out, direction="out", model=model_name)
+    job = _current_job.get()
+    if job is not None:
+        job.add(tokens_in=tokens_in, tokens_out=tokens_out)
+
+
+def record_cached_tokens(model_name: str, tokens: int) -> None:
+    """记录服务商返回的前缀缓存命中 token 数"""
+    LLM_CACHED_TOKENS.inc(tokens, model=model_name)
+    job = _current_job.get()
+    if job is not None:
+        job.add(tokens_cached=tokens)
+
+
+def record_retry(reason: str) -> None:
+    LLM_RETRIES.inc(reason=reason)
+    job = _current_job.get()
+    if job is not None:
+        job.add(retries=1)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    job = _current_job.get()
+    if job is not None:
+        job.add(**({"cache_hits": 1} if hit else {"cache_misses": 1}))
+
+
+def render() -> str:
+    """以 Prometheus 文本格式导出全部指标"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
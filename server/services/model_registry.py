@@ -0,0 +1,139 @@
+"""
+模型能力注册表
+记录各模型的上下文窗口、最大输出 token 数与价格，供分块规划和费用预估使用
+"""
+#print(">>> import model_registry...")
+import json
+import os
+import threading
+from typing import Dict
+
+from .config_service import get_data_dir
+from .logger import get_logger
+
+logger = get_logger("model_registry")
+
+
+# 模型能力表
+# context_window: 上下文窗口（输入 + 输出）token 数
+# max_output: 单次最大输出 token 数
+# input_price / output_price: 单位 元/百万 token
+# cached_input_price: 命中服务商前缀缓存的输入价格（元/百万 token），未填写时按 input_price 计费
+# structured_output: 结构化输出能力（json_schema / json_object / none）
+# tokenizer: 本地计数使用的 tokenizer（tiktoken 编码名，或 hf:<名称> 对应 tokenizers 目录下的 <名称>/tokenizer.json，找不到时使用 cl100k_base）
+# 可在数据目录的 models.json 中追加或覆盖：{"models": {"模型名": {"context_window": ..., ...}}}
+MODEL_REGISTRY: Dict[str, Dict] = {
+    "qwen-max": {"context_window": 32768, "max_output": 8192, "input_price": 2.0, "output_price": 6.0, "cached_input_price": 0.8, "tokenizer": "hf:qwen", "structured_output": "json_object"},
+    "qwen-plus": {"context_window": 131072, "max_output": 8192, "input_price": 1.0, "output_price": 3.0, "cached_input_price": 0.4, "tokenizer": "hf:qwen", "structured_output": "json_object"},
+    "qwen-turbo": {"context_window": 1000000, "max_output": 8192, "input_price": 0.5, "output_price": 1.5, "cached_input_price": 0.2, "tokenizer": "hf:qwen", "structured_output": "json_object"},
+    "qwen-long": {"context_window": 10000000, "max_output": 8192, "input_price": 0.5, "output_price": 2.0, "tokenizer": "hf:qwen", "structured_output": "json_object"},
+    "gpt-4o-mini": {"context_window": 128000, "max_output": 16384, "input_price": 1.1, "output_price": 4.3, "cached_input_price": 0.55, "tokenizer": "o200k_base", "structured_output": "json_schema"},
+    "gpt-4o": {"context_window": 128000, "max_output": 16384, "input_price": 18.0, "output_price": 72.0, "cached_input_price": 9.0, "tokenizer": "o200k_base", "structured_output": "json_schema"},
+    "gpt-4-turbo": {"context_window": 128000, "max_output": 4096, "input_price": 72.0, "output_price": 216.0, "structured_output": "json_object"},
+    "gpt-3.5-turbo": {"context_window": 16385, "max_output": 4096, "input_price": 3.6, "output_price": 10.8, "structured_output": "json_object"},
+    "deepseek-chat": {"context_window": 65536, "max_output": 8192, "input_price": 2.0, "output_price": 8.0, "cached_input_price": 0.5, "tokenizer": "hf:deepseek", "structured_output": "json_object"},
+}
+
+# 未登记模型使用的保守默认值
+# latency_base: 单次请求的固定耗时（秒），output_tps: 输出速度（token/秒），用于预估耗时
+DEFAULT_MODEL_INFO: Dict = {
+    "context_window": 32768,
+    "max_output": 4096,
+    "input_price": 1.0,
+    "output_price": 3.0,
+    "cached_input_price": None,
+    "latency_base": 1.5,
+    "output_tps": 40.0,
+    "structured_output": "none",
+    "tokenizer": "cl100k_base",
+}
+
+_overrides_loaded = False
+_lock = threading.Lock()
+
+
+def get_registry_file_path() -> str:
+    """获取用户自定义模型表路径（与 config.json 同目录）"""
+    return os.path.join(get_data_dir(), "models.json")
+
+
+def _load_overrides() -> None:
+    """首次使用时合并数据目录中的 models.json"""
+    global _overrides_loaded
+    with _lock:
+        if _overrides_loaded:
+            return
+        _overrides_loaded = True
+        registry_file = get_registry_file_path()
+        if not os.path.exists(registry_file):
+            return
+        try:
+            with open(registry_file, "r", encoding="utf-8") as f:
+                models = json.load(f).get("models", {})
+            for name, info in models.items():
+                MODEL_REGISTRY[name.lower()] = {**MODEL_REGISTRY.get(name.lower(), {}), **info}
+        except Exception as e:
+            logger.warning("读取 models.json 失败: %s", e)
+
+
+def register_model(model_name: str, info: Dict) -> None:
+    """
+    注册或更新模型信息（仅当前进程有效，持久化请写入 models.json）
+
+    Args:
+        model_name: 模型名称
+        info: 需要覆盖的字段，如 {"input_price": 1.0}
+    """
+    _load_overrides()
+    name = model_name.lower()
+    MODEL_REGISTRY[name] = {**MODEL_REGISTRY.get(name, {}), **info}
+
+
+def list_models() -> Dict[str, Dict]:
+    """返回全部已登记模型（已合并默认值）"""
+    _load_overrides()
+    return {name: {**DEFAULT_MODEL_INFO, **info} for name, info in MODEL_REGISTRY.items()}
+
+
+def get_model_info(model_name: str) -> Dict:
+    """
+    获取模型能力信息
+
+    先精确匹配，再按最长前缀匹配（如 qwen-max-latest 匹配 qwen-max），都未命中时返回默认值
+
+    Args:
+        model_name: 模型名称
+
+    Returns:
+        包含 context_window, max_output, input_price, output_price, latency_base, output_tps, structured_output, tokenizer 的字典
+    """
+    _load_overrides()
+    name = (model_name or "").lower()
+    if name in MODEL_REGISTRY:
+        return {**DEFAULT_MODEL_INFO, **MODEL_REGISTRY[name]}
+
+    prefixes = [key for key in MODEL_REGISTRY if name.startswith(key)]
+    if prefixes:
+        return {**DEFAULT_MODEL_INFO, **MODEL_REGISTRY[max(prefixes, key=len)]}
+
+    return dict(DEFAULT_MODEL_INFO)
+
+
+def get_call_cost(model_name: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    按模型价格计算一次调用的费用（元）
+
+    Args:
+        model_name: 模型名称
+        prompt_tokens: 输入 token 数（含缓存命中部分）
+        completion_tokens: 输出 token 数
+        cached_tokens: 命中前缀缓存的输入 token 数（按 cached_input_price 计费）
+    """
+    info = get_model_info(model_name)
+    cached_price = info["cached_input_price"] if info.get("cached_input_price") is not None else info["input_price"]
+    cached_tokens = max(0, min(cached_tokens, prompt_tokens))
+    return (
+        (prompt_tokens - cached_tokens) * info["input_price"]
+        + cached_tokens * cached_price
+        + completion_tokens * info["output_price"]
+    ) / 1_000_000
@@ -0,0 +1,124 @@
+"""
+页面范围服务
+为字段指定页面范围（如标题、作者、摘要只在前两页），解析时只解码需要的页面，
+提取时每组字段只发送对应页面的文本
+
+范围写法：
+    all        全文（默认）
+    first:N    前 N 页
+    last:N     最后 N 页
+    A-B        第 A 到 B 页（从 1 开始，含两端）
+    A          单独第 A 页
+"""
+#print(">>> import page_scope...")
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger("page_scope")
+
+
+_FIRST_LAST = re.compile(r"^(first|last)\s*[:=\s]\s*(\d+)$")
+_RANGE = re.compile(r"^(\d+)(?:\s*-\s*(\d+))?$")
+
+# 常见的首页元数据字段：开启 auto 时默认只看前两页
+FRONT_MATTER_PAGES = 2
+FRONT_MATTER_FIELDS = ("标题", "题目", "作者", "机构", "单位", "摘要", "关键词", "期刊", "会议", "doi", "通讯")
+
+
+@dataclass(frozen=True)
+class PageScope:
+    """页面范围（start / end 为从 1 开始的页码，count 用于 first / last）"""
+    kind: str = "all"
+    count: int = 0
+    start: int = 0
+    end: int = 0
+
+    def indexes(self, page_count: int) -> List[int]:
+        """在 page_count 页的文档中选中的页面下标（从 0 开始）"""
+        if self.kind == "first":
+            return list(range(min(self.count, page_count)))
+        if self.kind == "last":
+            return list(range(max(0, page_count - self.count), page_count))
+        if self.kind == "range":
+            return list(range(max(0, self.start - 1), min(self.end, page_count)))
+        return list(range(page_count))
+
+    @property
+    def label(self) -> str:
+        if self.kind in ("first", "last"):
+            return f"{self.kind}:{self.count}"
+        if self.kind == "range":
+            return f"{self.start}-{self.end}" if self.end != self.start else str(self.start)
+        return "all"
+
+
+ALL_PAGES = PageScope()
+
+
+def parse_scope(spec: str) -> PageScope:
+    """
+    解析页面范围写法
+
+    Raises:
+        ValueError: 写法不合法
+    """
+    text = (spec or "").strip().lower()
+    if text in ("", "all"):
+        return ALL_PAGES
+    match = _FIRST_LAST.match(text)
+    if match and int(match.group(2)) > 0:
+        return PageScope(kind=match.group(1), count=int(match.group(2)))
+    match = _RANGE.match(text)
+    if match:
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        if 0 < start <= end:
+            return PageScope(kind="range", start=start, end=end)
+    raise ValueError(f"页面范围写法不正确: {spec}（可用 all、first:N、last:N、A-B）")
+
+
+def plan_scopes(fields: List[str], field_scopes: Optional[Dict[str, str]] = None, auto: bool = False) -> List[Tuple[PageScope, List[str]]]:
+    """
+    按页面范围为字段分组
+
+    Args:
+        fields: 需要提取的字段列表
+        field_scopes: 字段 -> 范围写法；未指定的字段为全文
+        auto: 是否为常见首页元数据字段（标题、作者、摘要等）自动使用 first:2
+
+    Returns:
+        [(范围, 字段列表), ...]，保持字段的原有顺序
+
+    Raises:
+        ValueError: 范围写法不合法
+    """
+    field_scopes = field_scopes or {}
+    groups: Dict[PageScope, List[str]] = {}
+    for name in fields:
+        if name in field_scopes:
+            scope = parse_scope(field_scopes[name])
+        elif auto and any(key in name.lower() for key in FRONT_MATTER_FIELDS):
+            scope = PageScope(kind="first", count=FRONT_MATTER_PAGES)
+        else:
+            scope = ALL_PAGES
+        groups.setdefault(scope, []).append(name)
+    return list(groups.items())
+
+
+def page_selector(plan: List[Tuple[PageScope, List[str]]]) -> Optional[Callable[[int], List[int]]]:
+    """
+    解析时需要解码的页面（各范围的并集）
+
+    Returns:
+        页数 -> 页面下标列表 的函数；包含全文范围时返回 None（解析全部页面）
+    """
+    scopes = [scope for scope, _ in plan]
+    if not scopes or ALL_PAGES in scopes:
+        return None
+
+    def select(page_count: int) -> List[int]:
+        return sorted({i for scope in scopes for i in scope.indexes(page_count)})
+    return select
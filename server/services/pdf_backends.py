@@ -0,0 +1,177 @@
+"""
+PDF 文本提取后端
+统一的后端接口（文件路径 -> 分页文本），按顺序尝试：默认后端失败或提取不到文本时自动换下一个。
+pypdf 为必需依赖；pypdfium2、pdfminer.six 安装后自动可用
+
+后端可只解码部分页面：select(页数) 返回需要的页面下标，未选中的页面返回空字符串（保持页码对应）
+
+环境变量：
+    PAPER_EXTRACT_PDF_BACKEND   默认后端（pypdf / pypdfium2 / pdfminer / langchain），默认 pypdf
+"""
+#print(">>> import pdf_backends...")
+import importlib.util
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger("pdf_backends")
+
+
+DEFAULT_BACKEND = "pypdf"
+# 自动回退的顺序（默认后端排在最前）；langchain 底层同为 pypdf，回退无意义，只在显式指定时使用
+FALLBACK_ORDER = ["pypdf", "pypdfium2", "pdfminer"]
+
+
+class EmptyTextError(Exception):
+    """后端没有提取到任何文本（可能是扫描件，也可能是该后端不支持的编码）"""
+
+
+# 页数 -> 需要解码的页面下标
+PageSelector = Callable[[int], List[int]]
+
+
+def _selected(page_count: int, select: Optional[PageSelector]) -> set:
+    return set(range(page_count)) if select is None else set(select(page_count))
+
+
+def _extract_pypdf(file_path: str, select: Optional[PageSelector] = None) -> List[str]:
+    """直接使用 pypdf（不经过 LangChain Document 包装）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    wanted = _selected(len(reader.pages), select)
+    return [(page.extract_text() or "") if i in wanted else "" for i, page in enumerate(reader.pages)]
+
+
+def _extract_pypdfium2(file_path: str, select: Optional[PageSelector] = None) -> List[str]:
+    """pypdfium2（PDFium 的 C 实现，速度快）"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        wanted = _selected(len(pdf), select)
+        pages = []
+        for i in range(len(pdf)):
+            if i not in wanted:
+                pages.append("")
+                continue
+            page = pdf[i]
+            text_page = page.get_textpage()
+            pages.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+def _extract_pdfminer(file_path: str, select: Optional[PageSelector] = None) -> List[str]:
+    """pdfminer.six（纯 Python，版面分析更细，速度较慢）"""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+    from pdfminer.pdfpage import PDFPage
+
+    page_numbers = None
+    page_count = 0
+    if select is not None:
+        with open(file_path, "rb") as f:
+            page_count = sum(1 for _ in PDFPage.get_pages(f))
+        page_numbers = _selected(page_count, select)
+
+    texts = {
+        # extract_pages 只返回选中的页面，按顺序对应 page_numbers
+        i: "".join(element.get_text() for element in page_layout if isinstance(element, LTTextContainer))
+        for i, page_layout in zip(sorted(page_numbers) if page_numbers is not None else range(10 ** 9),
+                                  extract_pages(file_path, page_numbers=page_numbers))
+    }
+    return [texts.get(i, "") for i in range(page_count or len(texts))]
+
+
+def _extract_langchain(file_path: str, select: Optional[PageSelector] = None) -> List[str]:
+    """LangChain PyPDFLoader（原有实现，保留用于对比；不支持只解码部分页面）"""
+    from langchain_community.document_loaders import PyPDFLoader
+
+    pages = [doc.page_content for doc in PyPDFLoader(file_path).load()]
+    wanted = _selected(len(pages), select)
+    return [text if i in wanted else "" for i, text in enumerate(pages)]
+
+
+# 后端名称 -> (提取函数, 依赖的模块名)
+BACKENDS: Dict[str, Tuple[Callable[..., List[str]], str]] = {
+    "pypdf": (_extract_pypdf, "pypdf"),
+    "pypdfium2": (_extract_pypdfium2, "pypdfium2"),
+    "pdfminer": (_extract_pdfminer, "pdfminer"),
+    "langchain": (_extract_langchain, "langchain_community"),
+}
+
+_available: Dict[str, bool] = {}
+
+
+def is_available(name: str) -> bool:
+    """后端依赖是否已安装（只检查模块是否存在，不导入）"""
+    if name not in _available:
+        module = BACKENDS[name][1] if name in BACKENDS else None
+        _available[name] = bool(module) and importlib.util.find_spec(module) is not None
+    return _available[name]
+
+
+def available_backends() -> List[str]:
+    """已安装的后端列表"""
+    return [name for name in BACKENDS if is_available(name)]
+
+
+def get_default_backend() -> str:
+    """默认后端（PAPER_EXTRACT_PDF_BACKEND，未设置或未安装时为 pypdf）"""
+    name = os.environ.get("PAPER_EXTRACT_PDF_BACKEND", "").strip().lower() or DEFAULT_BACKEND
+    if name not in BACKENDS or not is_available(name):
+        if name != DEFAULT_BACKEND:
+            logger.warning("PDF 后端 %s 不可用，使用 %s", name, DEFAULT_BACKEND)
+        return DEFAULT_BACKEND
+    return name
+
+
+def backend_order(preferred: Optional[str] = None) -> List[str]:
+    """尝试顺序：指定后端（或默认后端）在前，其余已安装的后端按 FALLBACK_ORDER 排列"""
+    first = preferred if preferred in BACKENDS else get_default_backend()
+    return [first] + [name for name in FALLBACK_ORDER if name != first and is_available(name)]
+
+
+def get_extractor(name: str) -> Callable[..., List[str]]:
+    """按名称获取提取函数"""
+    return BACKENDS[name][0]
+
+
+def extract_pages(file_path: str, preferred: Optional[str] = None, select: Optional[PageSelector] = None) -> Tuple[List[str], str]:
+    """
+    按顺序尝试各后端提取分页文本
+
+    Args:
+        file_path: PDF 文件路径
+        preferred: 优先使用的后端，默认取 get_default_backend()
+        select: 只解码部分页面（页数 -> 页面下标），默认全部页面
+
+    Returns:
+        (pages, backend): 分页文本 和 实际使用的后端名称
+
+    Raises:
+        EmptyTextError: 所有后端都没有提取到文本
+        Exception: 所有后端都失败时，抛出第一个后端的异常
+    """
+    first_error: Optional[Exception] = None
+    empty = False
+    for name in backend_order(preferred):
+        try:
+            pages = get_extractor(name)(file_path, select)
+        except Exception as e:
+            logger.warning("PDF 后端 %s 解析失败，尝试下一个: %s (%s)", name, file_path, e)
+            first_error = first_error or e
+            continue
+        if pages and "".join(pages).strip():
+            return pages, name
+        logger.info("PDF 后端 %s 未提取到文本，尝试下一个: %s", name, file_path)
+        empty = True
+
+    if empty or first_error is None:
+        raise EmptyTextError(file_path)
+    raise first_error
@@ -1,41 +1,121 @@
 """
 PDF 解析服务
-负责解析 PDF 文件并提取文本内容
+负责解析 PDF 文件并提取文本内容（具体提取由 pdf_backends 中的后端完成，失败时自动换用其他后端）
 """
 #print(">>> import pdf_parser...")
-from typing import Tuple
-from langchain_community.document_loaders import PyPDFLoader
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from . import pdf_backends, text_cache
+from .logger import get_logger
 
+logger = get_logger("pdf_parser")
 
-def parse_pdf(file_path: str) -> Tuple[str, str]:
+
+def parse_pdf_pages(file_path: str, backend: Optional[str] = None, select: Optional[pdf_backends.PageSelector] = None) -> Tuple[List[str], str]:
+    """
+    解析 PDF 文件，按页返回文本
+
+    Args:
+        file_path: PDF 文件路径
+        backend: 优先使用的提取后端，默认取 PAPER_EXTRACT_PDF_BACKEND（pypdf）
+        select: 只解码部分页面（页数 -> 页面下标），未选中的页面为空字符串
+
+    Returns:
+        (pages, error_msg): 分页文本列表 和 错误信息（空字符串表示成功）
+    """
+    try:
+        logger.debug("解析 PDF 路径: %s", file_path)
+        pages, used = pdf_backends.extract_pages(file_path, backend, select)
+        logger.debug("解析成功（%s），共 %d 页: %s", used, len(pages), file_path)
+        return pages, ""
+
+    except pdf_backends.EmptyTextError:
+        error_msg = "解析内容为空，可能是图片型PDF（扫描件）"
+        logger.warning("%s: %s", error_msg, file_path)
+        return [], error_msg
+
+    except Exception as e:
+        error_msg = f"PDF 解析失败: {str(e)}"
+        logger.warning("%s: %s", error_msg, file_path)
+        return [], error_msg
+
+
+def parse_pdf(file_path: str, use_cache: bool = True) -> Tuple[str, str]:
     """
     解析 PDF 文件
 
+    Args:
+        file_path: PDF 文件路径
+        use_cache: 是否使用文本缓存（文件未变化时直接返回上次解析结果）
+
     Returns:
         (content, error_msg): 文本内容 和 错误信息（空字符串表示成功）
     """
-    try:
-        print(f"解析 PDF 路径: {file_path}")
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
+    pages, error_msg = parse_pdf_pages_cached(file_path) if use_cache else parse_pdf_pages(file_path)
+    if error_msg:
+        return "", error_msg
 
-        if not documents:
-            error_msg = "loader.load() 返回空文档列表"
-            print(error_msg)
-            return "", error_msg
+    content = "\n".join(pages)
+    logger.debug("解析成功，内容长度: %d 字符", len(content))
+    return content, ""
 
-        content = "\n".join([doc.page_content for doc in documents])
 
-        if not content.strip():
-            error_msg = "解析内容为空，可能是图片型PDF（扫描件）"
-            print(error_msg)
-            return "", error_msg
+def parse_pdf_pages_cached(file_path: str, select: Optional[pdf_backends.PageSelector] = None) -> Tuple[List[str], str]:
+    """
+    带文本缓存的分页解析
+
+    指定 select 时缓存命中直接返回全部页面；未命中时只解码选中的页面，且不写入缓存（缓存只保存完整文档）
+    """
+    pages = text_cache.get_pages(file_path)
+    if pages is not None:
+        return pages, ""
+
+    pages, error_msg = parse_pdf_pages(file_path, select=select)
+    if not error_msg and select is None:
+        text_cache.put_pages(file_path, pages)
+    return pages, error_msg
+
+
+def parse_many(file_paths: List[str], workers: Optional[int] = None) -> Dict[str, Tuple[List[str], str]]:
+    """
+    批量并行解析 PDF（优先读取文本缓存，未命中的文件使用多进程解析）
+
+    Args:
+        file_paths: PDF 文件路径列表
+        workers: 解析进程数，默认取 CPU 核数
 
-        print(f"解析成功，内容长度: {len(content)} 字符")
-        return content, ""
+    Returns:
+        {file_path: (pages, error_msg)}
+    """
+    results: Dict[str, Tuple[List[str], str]] = {}
+
+    # 1. 并行读取缓存（I/O 为主，线程即可）
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        cached = dict(zip(file_paths, executor.map(text_cache.get_pages, file_paths)))
+    missing = []
+    for path, pages in cached.items():
+        if pages is None:
+            missing.append(path)
+        else:
+            results[path] = (pages, "")
+
+    if not missing:
+        return results
 
+    # 2. 未命中的文件多进程解析（pypdf 为纯 Python 实现，受 GIL 限制）
+    workers = max(1, min(workers or os.cpu_count() or 1, len(missing)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(parse_pdf_pages, missing))
     except Exception as e:
-        error_msg = f"PDF 解析失败: {str(e)}"
-        print(error_msg)
-        return "", error_msg
+        logger.warning("多进程解析失败，回退到线程池: %s", e)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(parse_pdf_pages, missing))
+
+    for path, (pages, error_msg) in zip(missing, parsed):
+        if not error_msg:
+            text_cache.put_pages(path, pages)
+        results[path] = (pages, error_msg)
 
+    return results
@@ -3,35 +3,85 @@
 负责整合 PDF 解析、分块、字段提取、结果汇总的完整流程
 """
 #print(">>> import pipeline...")
+import asyncio
 import json
 import os
-from typing import List, Dict
-import tiktoken
-from . import pdf_parser, llm_service, config_service
+from typing import List, Dict, Optional
+from . import pdf_parser, llm_service, config_service, provider_pool, metrics, dedup, discovery, text_normalizer, retrieval, result_store, page_scope, field_groups, prompt_templates, usage, adaptive_limiter, hedging, tokenizer
+from .prompt_templates import prompt_text
+from .model_registry import get_call_cost, get_model_info
 from .log_service import push_log, push_progress
+from .logger import get_logger
+
+logger = get_logger("pipeline")
 
 # Token 预估函数
-def estimate_tokens(text: str) -> int:
+def estimate_tokens(text: str, model_name: str = "") -> int:
     """
-    预估文本的 token 数量
-    使用 tiktoken 库进行精确估算（cl100k_base 编码）
+    预估文本的 token 数量（按模型选择 tokenizer，tokenizer 不可用时近似计数）
 
     Args:
         text: 待预估的文本
+        model_name: 模型名称（为空时使用默认编码 cl100k_base）
 
     Returns:
         预估的 token 数量
     """
-    if not text:
-        return 0
+    return tokenizer.count_tokens(text, model_name)
 
-    try:
-        # 使用 cl100k_base 编码（GPT-4/3.5 使用）
-        enc = tiktoken.get_encoding("cl100k_base")
-        return len(enc.encode(text))
-    except Exception:
-        # 如果 tiktoken 失败，使用备用估算方法
-        return len(text) // 2
+
+def estimate_tokens_batch(texts: List[str], model_name: str = "") -> List[int]:
+    """
+    批量预估 token 数量（tiktoken 多线程批量编码）
+
+    Args:
+        texts: 待预估的文本列表
+        model_name: 模型名称
+
+    Returns:
+        各文本的 token 数量
+    """
+    return tokenizer.count_tokens_batch(texts, model_name)
+
+
+def normalization_report(raw_tokens: int, normalized: text_normalizer.NormalizeResult, tokens: int) -> Dict:
+    """
+    单个文件的规范化报告
+
+    Args:
+        raw_tokens: 规范化前的 token 数
+        normalized: 规范化结果
+        tokens: 规范化后的 token 数
+
+    Returns:
+        节省的字符 / token 数与各步骤统计
+    """
+    saved = raw_tokens - tokens
+    return {
+        "chars_before": normalized.chars_before,
+        "chars_after": normalized.chars_after,
+        "tokens_before": raw_tokens,
+        "tokens_after": tokens,
+        "tokens_saved": saved,
+        "saved_ratio": round(saved / raw_tokens, 4) if raw_tokens else 0.0,
+        **normalized.stats,
+    }
+
+
+def estimate_cost_value(input_tokens: int, output_tokens: int = 1000, model_name: str = "qwen-max") -> float:
+    """
+    预估 API 调用费用（数值，单位：元）
+
+    Args:
+        input_tokens: 输入 token 数量
+        output_tokens: 输出 token 数量
+        model_name: 模型名称
+
+    Returns:
+        费用（元）
+    """
+    # 价格来自模型能力注册表（单位：元/百万 token）
+    return get_call_cost(model_name, input_tokens, output_tokens)
 
 
 def estimate_cost(input_tokens: int, output_tokens: int = 1000, model_name: str = "qwen-max") -> str:
@@ -46,20 +96,201 @@ def estimate_cost(input_tokens: int, output_tokens: int = 1000, model_name: str
     Returns:
         费用估算字符串
     """
-    # 千问模型价格（单位：元/百万 token）
-    # qwen-max: 输入 0.02 元/万 token，输出 0.06 元/万 token
-    prices = {
-        "qwen-max": (2.0, 6.0),  # (输入价格, 输出价格) 单位：元/百万
-        "qwen-plus": (1.0, 3.0),
-        "qwen-turbo": (0.5, 1.5),
+    total_cost = estimate_cost_value(input_tokens, output_tokens, model_name)
+    return f"约 {total_cost:.4f} 元"
+
+
+def estimate_document(token_count: int, fields: List[str], model_name: str, max_tokens: int = 0, overlap: int = 500, concurrency: int = 1, field_group_plan: Optional[List[List[str]]] = None, prompt_version: str = "", content: str = "", retrieval_options: Optional[retrieval.RetrievalOptions] = None) -> Dict:
+    """
+    按与提取相同的分块规划，预估单个文档的请求数、token、费用和耗时（不调用 LLM）
+
+    Args:
+        token_count: 文档正文 token 数
+        fields: 需要提取的字段列表
+        model_name: 模型名称
+        max_tokens: 分块上限 Token 数（<= 0 表示自动）
+        overlap: 分块重叠 Token 数
+        concurrency: Map 阶段并发数
+        field_group_plan: 字段分组，每个分块每组一次调用
+        prompt_version: prompt 模板版本（为空时使用默认版本）
+        content: 文档正文（检索模式按正文检索段落时需要）
+        retrieval_options: 检索模式选项（为空时按 Map-Reduce 预估）
+
+    Returns:
+        预估结果字典
+    """
+    info = get_model_info(model_name)
+    groups = field_groups.split_fields(fields, field_group_plan)
+    chunk_size, overlap = llm_service.plan_chunk_size(model_name, max(groups, key=len), max_tokens, overlap, prompt_version)
+
+    # Map 阶段调用：[(字段组, 正文 token 数), ...]
+    if retrieval_options:
+        # 检索模式：每组字段只发送检索出的段落，按实际检索结果计数
+        tasks = llm_service.plan_retrieval_tasks(content, fields, chunk_size, retrieval_options, model_name)
+        task_lengths = estimate_tokens_batch([text for _, text in tasks], model_name)
+        calls = [(group, length) for (task_fields, _), length in zip(tasks, task_lengths) for group in field_groups.split_fields(task_fields, field_group_plan)]
+        chunk_count = len(tasks)
+    else:
+        chunk_lengths = llm_service.chunk_token_lengths(token_count, chunk_size, overlap)
+        calls = [(group, length) for length in chunk_lengths for group in groups]
+        chunk_count = len(chunk_lengths)
+
+    # 每次调用：prompt 固定开销 + 正文
+    overheads = {tuple(group): estimate_tokens(prompt_text(llm_service.build_map_prompt("", group, prompt_version)), model_name) for group, _ in calls}
+    call_output_tokens = [llm_service.estimate_output_tokens(group) for group, _ in calls]
+    input_tokens = sum(length + overheads[tuple(group)] for group, length in calls)
+    output_tokens = sum(call_output_tokens)
+    requests = len(calls)
+
+    # 耗时：Map 按并发分批执行，每批耗时约等于单次请求耗时（分组后按最长的一组输出计算）
+    request_latency = info["latency_base"] + max(call_output_tokens, default=0) / info["output_tps"]
+    waves = -(-requests // max(1, concurrency))
+    wall_time = waves * request_latency
+
+    # Reduce 阶段：Map-Reduce 模式多于一个分块时，按字段分组并发合并各分块的提取结果
+    if chunk_count > 1 and not retrieval_options:
+        map_output_tokens = llm_service.estimate_output_tokens(fields)
+        reduce_overhead = estimate_tokens(prompt_text(llm_service.build_reduce_prompt([], prompt_version)), model_name)
+        input_tokens += reduce_overhead * len(groups) + map_output_tokens * chunk_count
+        output_tokens += map_output_tokens
+        requests += len(groups)
+        wall_time += info["latency_base"] + max(llm_service.estimate_output_tokens(group) for group in groups) / info["output_tps"]
+
+    return {
+        "tokens": token_count,
+        "chunk_size": chunk_size,
+        "chunks": chunk_count,
+        "requests": requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": estimate_cost_value(input_tokens, output_tokens, model_name),
+        "wall_time": wall_time,
     }
 
-    price = prices.get(model_name, (1.0, 3.0))
-    input_cost = input_tokens / 1_000_000 * price[0]
-    output_cost = output_tokens / 1_000_000 * price[1]
-    total_cost = input_cost + output_cost
 
-    return f"约 {total_cost:.4f} 元"
+def scope_contents(all_pages: List[str], content: str, scope_plan: List[tuple], normalize_options: Optional[text_normalizer.NormalizeOptions] = None) -> List[tuple]:
+    """
+    各页面范围分组发送给模型的正文 [(字段列表, 正文), ...]
+
+    只有一个分组或全文分组时使用已规范化的正文 content，其余分组只取该范围的页面单独规范化
+    """
+    contents = []
+    for scope, scope_fields in scope_plan:
+        if len(scope_plan) == 1 or scope == page_scope.ALL_PAGES:
+            contents.append((scope_fields, content))
+        else:
+            scope_pages = [all_pages[p] for p in scope.indexes(len(all_pages))]
+            contents.append((scope_fields, text_normalizer.normalize_pages(scope_pages, normalize_options).text))
+    return contents
+
+
+def combine_estimates(estimates: List[Dict], model_name: str) -> Dict:
+    """合并同一文档各页面范围分组的预估（各组共享并发上限，耗时按各组之和估算，偏保守）"""
+    if len(estimates) == 1:
+        return estimates[0]
+    combined = {key: sum(estimate[key] for estimate in estimates) for key in ("tokens", "chunks", "requests", "input_tokens", "output_tokens", "wall_time")}
+    combined["chunk_size"] = max(estimate["chunk_size"] for estimate in estimates)
+    combined["cost"] = estimate_cost_value(combined["input_tokens"], combined["output_tokens"], model_name)
+    return combined
+
+
+async def estimate_batch(file_paths: List[str], fields: List[str], config: Optional[Dict] = None, normalize_options: Optional[text_normalizer.NormalizeOptions] = None, field_group_plan: Optional[List[List[str]]] = None, scope_plan: Optional[List[tuple]] = None, retrieval_options: Optional[retrieval.RetrievalOptions] = None, prompt_version: str = "") -> Dict:
+    """
+    批量预估（dry-run）：并行解析并统计整批文件的 token、请求数、费用与耗时，不调用 LLM
+
+    Args:
+        file_paths: PDF 文件路径列表
+        fields: 需要提取的字段列表
+        config: 模型配置，默认使用最近保存的配置
+        normalize_options: 文本规范化选项（与提取时一致），默认 NormalizeOptions()
+        field_group_plan: 字段分组（与提取时一致）
+        scope_plan: 字段的页面范围分组（与提取时一致），为空时所有字段使用全文
+        retrieval_options: 检索模式选项（与提取时一致），为空时按 Map-Reduce 预估
+        prompt_version: prompt 模板版本（与提取时一致）
+
+    Returns:
+        包含 files（逐文件预估）和 total（汇总）的字典
+    """
+    config = config or await config_service.get_latest_config()
+    model_name = config.get("model_name") or "qwen-max"
+    max_tokens = config.get("max_tokens", 10000)
+    overlap = config.get("overlap", 500)
+    concurrency = config.get("concurrency", 4)
+
+    await push_log("analyze", f"开始预估 {len(file_paths)} 个文件（不调用大模型）...")
+
+    # 1. 并行解析（命中文本缓存时直接读取）
+    parsed = await asyncio.to_thread(pdf_parser.parse_many, file_paths)
+
+    # 2. 文本规范化后按页面范围分组取正文，批量 tokenize（与提取时发送给模型的正文一致）
+    scope_plan = scope_plan or [(page_scope.ALL_PAGES, list(fields))]
+    select = page_scope.page_selector(scope_plan)
+    ok_paths = [path for path in file_paths if not parsed[path][1]]
+    contents: Dict[str, List[tuple]] = {}
+    for path in ok_paths:
+        all_pages = parsed[path][0]
+        pages = [all_pages[p] for p in select(len(all_pages))] if select else all_pages
+        contents[path] = scope_contents(all_pages, text_normalizer.normalize_pages(pages, normalize_options).text, scope_plan, normalize_options)
+    counts = iter(await asyncio.to_thread(estimate_tokens_batch, [text for path in ok_paths for _, text in contents[path]], model_name))
+    token_counts = {path: [next(counts) for _ in contents[path]] for path in ok_paths}
+
+    # 3. 按提取时相同的分块规划（页面范围、检索模式、字段分组、prompt 版本）逐文件预估
+    def estimate_file(path: str) -> Dict:
+        return combine_estimates([
+            estimate_document(count, scope_fields, model_name, max_tokens, overlap, concurrency, field_group_plan, prompt_version, text, retrieval_options)
+            for (scope_fields, text), count in zip(contents[path], token_counts[path])
+        ], model_name)
+
+    estimates = dict(zip(ok_paths, await asyncio.to_thread(lambda: [estimate_file(path) for path in ok_paths])))
+    files = []
+    total = {"files": len(file_paths), "failed": 0, "tokens": 0, "requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0, "wall_time": 0.0}
+    for path in file_paths:
+        pages, parse_error = parsed[path]
+        if parse_error:
+            files.append({"file": path, "error": parse_error})
+            total["failed"] += 1
+            continue
+
+        estimate = estimates[path]
+        files.append({"file": path, "pages": len(pages), **estimate})
+        for key in ("tokens", "requests", "input_tokens", "output_tokens", "cost", "wall_time"):
+            total[key] += estimate[key]
+
+    await push_log("analyze", f"预估完成: 请求数 {total['requests']}, 输入 token {total['input_tokens']}, 费用 {estimate_cost(total['input_tokens'], total['output_tokens'], model_name)}, 预计耗时 {total['wall_time']:.0f}s")
+
+    return {
+        "model_name": model_name,
+        "concurrency": concurrency,
+        "fields": fields,
+        "files": files,
+        "total": total,
+    }
+
+
+def merge_scoped_results(scope_plan: List[tuple], results: List[Dict], fields: List[str]) -> Dict:
+    """合并各页面范围分组的提取结果（各组字段互不重叠），字段按原有顺序排列"""
+    if len(results) == 1:
+        return results[0]
+    parsed: Dict = {field: "" for field in fields}
+    raw = []
+    error = ""
+    for (scope, scope_fields), result in zip(scope_plan, results):
+        parsed.update(result.get("parsed", {}))
+        raw.append({"pages": scope.label, "fields": scope_fields, "raw": result.get("raw", "")})
+        error = error or result.get("error", "")
+    merged = {"parsed": parsed, "raw": json.dumps(raw, ensure_ascii=False)}
+    if error:
+        merged["error"] = error
+    return merged
+
+
+async def _store(func, *args, **kwargs):
+    """写入结果存储（后台线程执行）；存储失败只记录日志，不影响解析"""
+    try:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    except Exception as e:
+        logger.warning("写入结果存储失败: %s", e)
+        return None
 
 
 async def validate_and_load_config() -> Dict:
@@ -80,9 +311,10 @@ async def validate_and_load_config() -> Dict:
     temperature = config.get("temperature", 0.1)
     max_tokens = config.get("max_tokens", 10000)
     overlap = config.get("overlap", 500)
+    concurrency = config.get("concurrency", 4)
 
     # 输出配置信息
-    await push_log("analyze", f"配置信息: config_name={config_name}, provider={provider}, model_name={model_name}, api_key={'***' + api_key[-4:] if api_key else ''}, base_url={base_url}, temperature={temperature}, max_tokens={max_tokens}, overlap={overlap}")
+    await push_log("analyze", f"配置信息: config_name={config_name}, provider={provider}, model_name={model_name}, api_key={'***' + api_key[-4:] if api_key else ''}, base_url={base_url}, temperature={temperature}, max_tokens={max_tokens}, overlap={overlap}, concurrency={concurrency}")
 
     # 检查配置完整性
     if not config_name or config_name == "未设置":
@@ -106,87 +338,73 @@ async def validate_and_load_config() -> Dict:
         "temperature": temperature,
         "max_tokens": max_tokens,
         "overlap": overlap,
+        "concurrency": concurrency,
     }
 
 
-async def estimate_and_log_tokens(content: str, fields: List[str], model_name: str = "qwen-max") -> tuple:
+async def estimate_and_log_tokens(contents: List[tuple], model_name: str = "qwen-max", max_tokens: int = 0, overlap: int = 500, field_group_plan: Optional[List[List[str]]] = None, prompt_version: str = "", retrieval_options: Optional[retrieval.RetrievalOptions] = None) -> tuple:
     """
-    预估 token 数量和费用（使用分块模式）
+    预估 token 数量和费用（与提取时相同的分块规划）
 
     Args:
-        content: PDF 文本内容
-        fields: 需要提取的字段列表
+        contents: 各页面范围分组发送给模型的正文 [(字段列表, 正文), ...]（scope_contents() 的返回值）
         model_name: 模型名称
+        max_tokens: 分块上限 Token 数（<= 0 表示自动）
+        overlap: 分块重叠 Token 数
+        field_group_plan: 字段分组
+        prompt_version: prompt 模板版本
+        retrieval_options: 检索模式选项（为空时按 Map-Reduce 预估）
 
     Returns:
         (input_tokens, estimated_cost): token 数量和费用字符串
     """
-    # 使用与 llm_service.extract_fields_advanced 相同的分块逻辑
-    from .llm_service import split_by_tokens
-
-    fields_str = ", ".join(fields)
-    chunks = split_by_tokens(content, max_tokens=3000, overlap=300)
+    # 使用与 llm_service.extract_fields_advanced 相同的分块规划与 prompt，按各分组实际发送的正文预估
+    def estimate() -> Dict:
+        counts = estimate_tokens_batch([text for _, text in contents], model_name)
+        return combine_estimates([
+            estimate_document(count, scope_fields, model_name, max_tokens, overlap, field_group_plan=field_group_plan, prompt_version=prompt_version, content=text, retrieval_options=retrieval_options)
+            for (scope_fields, text), count in zip(contents, counts)
+        ], model_name)
 
-    total_input_tokens = 0
-    chunk_count = len(chunks)
+    result = await asyncio.to_thread(estimate)
+    estimated_cost = estimate_cost(result["input_tokens"], result["output_tokens"], model_name=model_name)
 
-    # 计算每个 chunk 的 prompt token
-    for chunk in chunks:
-        # Map 阶段 prompt
-        map_prompt = f"""请从以下论文片段中提取字段：{fields_str}
+    return result["input_tokens"], estimated_cost
 
-严格返回 JSON 格式，不要包含任何解释或额外内容。如果某个字段不存在，请返回空字符串。
 
-片段内容：
-{chunk}
-"""
-        map_tokens = estimate_tokens(map_prompt)
-        total_input_tokens += map_tokens
-
-    # Reduce 阶段 prompt（汇总所有部分结果）
-    reduce_prompt = f"""以下是多个论文片段提取结果：
-
-[部分结果]
-
-请合并为最终结果。
-规则：
-1. 如果多个片段都有值，选择最完整的（非空）值。
-2. 不要丢失任何信息。
-3. 严格返回 JSON 格式，不要包含任何解释。
-
-输出格式：
-{{
-    "字段名": "合并后的值",
-    ...
-}}
-"""
-    reduce_tokens = estimate_tokens(reduce_prompt)
-    total_input_tokens += reduce_tokens
-
-    estimated_cost = estimate_cost(total_input_tokens, model_name=model_name)
-
-    # print(f"[estimate_and_log_tokens] 分块数量: {chunk_count}, 总输入 token: {total_input_tokens}, 费用: {estimated_cost}")
-
-    return total_input_tokens, estimated_cost
-
-
-async def run_pipeline(file_paths: List[str], fields: List[str]) -> Dict:
+async def run_pipeline(file_paths: List[str], fields: List[str], pool_profiles: Optional[List[str]] = None, pool_strategy: str = provider_pool.STRATEGY_ROUND_ROBIN, stream: bool = False, near_duplicates: bool = False, sources: Optional[List[str]] = None, discovery_filter: Optional[discovery.DiscoveryFilter] = None, normalize_options: Optional[text_normalizer.NormalizeOptions] = None, retrieval_options: Optional[retrieval.RetrievalOptions] = None, run_source: str = "analyze", scope_plan: Optional[List[tuple]] = None, field_group_plan: Optional[List[List[str]]] = None, prompt_version: str = "", hedge_policy: Optional[hedging.HedgePolicy] = None) -> Dict:
     """
     完整的解析流水线：PDF解析 -> 分块 -> 字段提取 -> 结果汇总
 
     Args:
         file_paths: PDF 文件路径列表
         fields: 需要提取的字段列表
+        pool_profiles: 端点池模式下参与调度的配置名称列表（为空则只使用最近配置）
+        pool_strategy: 端点池调度策略（round_robin / least_outstanding）
+        stream: 是否使用流式响应
+        near_duplicates: 是否按解析后的文本识别近似重复（内容哈希不同但文本相同）
+        sources: 目录 / glob 模式；指定时后台流式发现文件，边发现边解析（与 file_paths 合并）
+        discovery_filter: 文件发现的过滤条件（大小、修改时间、文件数上限）
+        normalize_options: 文本规范化选项（页眉页脚、连字符、空白、参考文献 / 附录），默认 NormalizeOptions()
+        retrieval_options: 检索模式选项；指定时每组字段只发送 BM25 检索出的相关段落（为空时 Map-Reduce 全文）
+        run_source: 任务来源（analyze / watch），记录到结果存储
+        scope_plan: 字段的页面范围分组 [(PageScope, 字段列表), ...]（page_scope.plan_scopes 生成）；
+            为空时所有字段使用全文。只解码各范围需要的页面，每组字段只发送对应页面的文本
+        field_group_plan: 字段分组（field_groups.plan_field_groups 生成），每个分块按组并发请求
+        prompt_version: prompt 模板版本（为空时取 PAPER_EXTRACT_PROMPT_VERSION，默认 v2）
+        hedge_policy: Map 调用的对冲策略；启用时慢请求超过延迟分位数后再发送一个相同的请求，先返回的胜出
 
     Returns:
         解析结果字典
 
     Note:
         内部流程：
-        1. 遍历每个 PDF 文件，调用 parse_pdf() 解析
-        2. 调用 split_documents() 对文档进行分块
-        3. 对每个 chunk 调用 extract_fields() 提取字段
-        4. 调用 merge_results() 汇总所有结果
+        0. 按内容哈希去重，重复文件只提取一次，结果复制给所有重复路径
+        1. 遍历每个 PDF 文件，调用 parse_pdf_pages_cached() 解析
+        2. 调用 text_normalizer.normalize_pages() 清理正文，减少发送给模型的 token
+        3. 调用 split_documents() 对文档进行分块
+        4. 对每个 chunk 调用 extract_fields() 提取字段
+        5. 调用 merge_results() 汇总所有结果
     """
 
     # 获取并验证配置
@@ -202,98 +420,257 @@ async def run_pipeline(file_paths: List[str], fields: List[str]) -> Dict:
     temperature = config["temperature"]
     max_tokens = config["max_tokens"]
     overlap = config["overlap"]
-
-    # 记录日志：开始解析
-    await push_log("analyze", f"开始解析 {len(file_paths)} 个文件...")
-    all_results = []
-    all_raw_responses = []
-
-
-    total_files = len(file_paths)
-    for i, file_path in enumerate(file_paths):
-        # Step 1: 解析 PDF
-        await push_progress({
-            "currentFile": os.path.basename(file_path),
-            "currentStep": "parsing",
-            "currentFileIndex": i + 1,
-            "totalFiles": total_files,
-            "progress": 0
-        })
-        content, parse_error = pdf_parser.parse_pdf(file_path)
-
-        # 检查 PDF 解析是否成功
-        if parse_error:
-            await push_log("analyze", f"错误: {parse_error} - {os.path.basename(file_path)}")
-            continue
-
-        # Step 2: 预估 token 和费用 (10-30%)
-        await push_progress({
-            "currentFile": os.path.basename(file_path),
-            "currentStep": "estimating",
-            "currentFileIndex": i + 1,
-            "totalFiles": total_files,
-            "progress": 5
-        })
-
-        input_tokens, estimated_cost = await estimate_and_log_tokens(content, fields, model_name)
-        await push_log("analyze", f"文件{os.path.basename(file_path)}预估输入 token: {input_tokens}")
+    concurrency = config["concurrency"]
+
+    # 端点池模式：请求在多个配置之间分发
+    pool = None
+    if pool_profiles:
+        pool = provider_pool.build_pool(pool_profiles, pool_strategy)
+        if not pool:
+            return {"total_files": 0, "fields": fields, "results": [], "error": "端点池中没有可用的配置（需包含 API Key 与 base_url）"}
+        # 并发数取各成员配置的并发数之和，并按各成员的并发数设置自适应并发的初始上限
+        concurrency = pool.concurrency
+        for endpoint in pool.endpoints:
+            adaptive_limiter.seed(endpoint.model_name, endpoint.base_url, endpoint.concurrency)
+        members = ", ".join(f"{ep['name']}(weight={ep['weight']}, concurrency={ep['concurrency']})" for ep in pool.status())
+        await push_log("analyze", f"端点池模式: strategy={pool_strategy}, 并发 {concurrency}, 端点: {members}")
+    else:
+        # 自适应并发：以配置的并发数作为端点的初始上限
+        adaptive_limiter.seed(model_name, base_url, concurrency)
+
+    # 文件来源：显式路径列表（总数已知，预先并行计算哈希） 或 目录/glob 流式发现（边发现边处理）
+    if sources:
+        await push_log("analyze", f"开始从 {len(sources)} 个来源发现并解析文件...")
+        path_stream = discovery.discover(list(file_paths) + list(sources), discovery_filter)
+        hashes: Dict[str, Optional[str]] = {}
+    else:
+        await push_log("analyze", f"开始解析 {len(file_paths)} 个文件...")
+        path_stream = discovery.iterate(file_paths)
+        hashes = await asyncio.to_thread(dedup.hash_files, file_paths)
+        # 去重后实际需要处理的文件数（用于进度显示）
+        unique_total = len({digest or path for path, digest in hashes.items()})
+
+    # 对冲请求：慢请求超过延迟分位数后再发送一个相同的请求（可发送到另一个配置的端点）
+    if hedge_policy and hedge_policy.enabled:
+        hedge_policy = await asyncio.to_thread(hedging.resolve_profile, hedge_policy)
+        target = hedge_policy.profile if hedge_policy.endpoint else "原端点"
+        await push_log("analyze", f"对冲请求: 超过 p{hedge_policy.percentile:g} 延迟（不低于 {hedge_policy.min_delay:g}s）后发送到 {target}")
+
+    # 页面范围：只解码各分组需要的页面（存在全文分组时解码全部页面）
+    scope_plan = scope_plan or [(page_scope.ALL_PAGES, list(fields))]
+    select = page_scope.page_selector(scope_plan)
+    if len(scope_plan) > 1 or select:
+        await push_log("analyze", "页面范围: " + "; ".join(f"{scope.label} -> {', '.join(names)}" for scope, names in scope_plan))
+
+    # 结果存储：每个文件完成后立即写入，中途失败的任务也保留已完成的结果
+    run_id = await _store(result_store.start_run, fields, model_name, config_name, run_source)
+    # 实际处理的路径（按发现顺序）
+    input_paths: List[str] = []
+    try:
+        all_raw_responses = []
+        # 路径 -> 提取结果；重复文件共用同一份结果，最终按输入顺序输出
+        extracted_by_path: Dict[str, Dict] = {}
+        duplicate_of: Dict[str, str] = {}
+        tracker = dedup.DuplicateTracker()
+        fingerprints: Dict[str, str] = {}
+        # 路径 -> 文本规范化报告（节省的 token 数）
+        normalization: Dict[str, Dict] = {}
+        # 服务商返回的实际用量：路径 -> 单个文件（含各分块），以及整个任务的合计
+        usage_by_path: Dict[str, Dict] = {}
+        run_usage = usage.Usage()
+
+        i = 0
+        async for file_path in path_stream:
+            input_paths.append(file_path)
+            # 流式发现时总数未知，显示已发现的数量
+            total_files = unique_total if not sources else len(input_paths)
+            job = metrics.current_job()
+            if sources and job is not None:
+                job.set_total_files(len(input_paths))
+
+            # Step 0: 按内容哈希去重（重复文件不解析、不提取）
+            digest = hashes[file_path] if file_path in hashes else await asyncio.to_thread(dedup.hash_file, file_path)
+            hashes[file_path] = digest
+            primary = tracker.check(file_path, digest)
+            if primary:
+                duplicate_of[file_path] = primary
+                await push_log("analyze", f"{os.path.basename(file_path)} 与 {os.path.basename(primary)} 内容相同，跳过提取")
+                continue
+            i += 1
+
+            # Step 1: 解析 PDF
+            await push_progress({
+                "currentFile": os.path.basename(file_path),
+                "currentStep": "parsing",
+                "currentFileIndex": i,
+                "totalFiles": total_files,
+                "progress": 0
+            })
+            with metrics.span("parse", file=os.path.basename(file_path)):
+                all_pages, parse_error = await asyncio.to_thread(pdf_parser.parse_pdf_pages_cached, file_path, select)
+
+            # 检查 PDF 解析是否成功
+            if parse_error:
+                metrics.FILES.inc(status="error")
+                await push_log("analyze", f"错误: {parse_error} - {os.path.basename(file_path)}")
+                continue
+
+            # Step 1.5: 文本规范化（页眉页脚、断行连字符、空白等不再发送给模型）
+            pages = [all_pages[p] for p in select(len(all_pages))] if select else all_pages
+            with metrics.span("normalize", file=os.path.basename(file_path)):
+                normalized = text_normalizer.normalize_pages(pages, normalize_options)
+                content = normalized.text
+                raw_tokens, content_tokens = await asyncio.to_thread(estimate_tokens_batch, ["\n".join(pages), content], model_name)
+            report = normalization_report(raw_tokens, normalized, content_tokens)
+            normalization[file_path] = report
+            metrics.NORMALIZE_TOKENS_SAVED.inc(max(0, report["tokens_saved"]))
+            await push_log("analyze", f"文件{os.path.basename(file_path)}文本规范化: token {raw_tokens} -> {content_tokens}（节省 {report['tokens_saved']}，{report['saved_ratio']:.1%}）")
+
+            # 近似重复：文本指纹相同则直接复用已提取的结果
+            if near_duplicates:
+                fingerprint = dedup.text_fingerprint(content)
+                if fingerprint in fingerprints:
+                    duplicate_of[file_path] = fingerprints[fingerprint]
+                    await push_log("analyze", f"{os.path.basename(file_path)} 与 {os.path.basename(fingerprints[fingerprint])} 文本相同，跳过提取")
+                    continue
+                fingerprints[fingerprint] = file_path
+
+            # Step 2: 预估 token 和费用 (10-30%)
+            await push_progress({
+                "currentFile": os.path.basename(file_path),
+                "currentStep": "estimating",
+                "currentFileIndex": i,
+                "totalFiles": total_files,
+                "progress": 5
+            })
+
+            contents = scope_contents(all_pages, content, scope_plan, normalize_options)
+            with metrics.span("tokenize", file=os.path.basename(file_path)):
+                input_tokens, estimated_cost = await estimate_and_log_tokens(contents, pool.planning_model() if pool else model_name, max_tokens, overlap, field_group_plan, prompt_version, retrieval_options)
+            await push_log("analyze", f"文件{os.path.basename(file_path)}预估输入 token: {input_tokens}, 预估费用: {estimated_cost}")
         
-        # Step 3: 字段提取 (map + merge 阶段由 llm_service 推送进度)
-        result = await llm_service.extract_fields_advanced(
-            content, fields, model_name, api_key, base_url, max_tokens, overlap, temperature,
-            file_name=os.path.basename(file_path), file_index=i+1, total_files=len(file_paths)
-        )
-
-        # 检查是否有错误
-        if result.get("error"):
-            await push_log("analyze", f"错误: {result.get('error')}")
-            return {
-                "total_files": 0,
-                "fields": fields,
-                "results": [],
-                "error": result.get("error")
+            # Step 3: 字段提取 (map + merge 阶段由 llm_service 推送进度)；各页面范围分组并发提取
+            # 各页面范围分组共享同一个任务扇出上限；启用自适应并发时实际并发只由各端点的限制器决定
+            semaphore = asyncio.Semaphore(adaptive_limiter.task_limit(concurrency, len(pool) if pool else 1))
+            with usage.scope(os.path.basename(file_path)) as file_usage:
+                scoped_results = await asyncio.gather(*(
+                    llm_service.extract_fields_advanced(
+                        scope_content, scope_fields, model_name, api_key, base_url, max_tokens, overlap, temperature,
+                        file_name=os.path.basename(file_path), file_index=i, total_files=total_files,
+                        concurrency=concurrency, pool=pool, stream=stream, retrieval_options=retrieval_options,
+                        field_group_plan=field_group_plan, prompt_version=prompt_version, hedge_policy=hedge_policy,
+                        semaphore=semaphore
+                    )
+                    for scope_fields, scope_content in contents
+                ))
+            result = merge_scoped_results(scope_plan, scoped_results, fields)
+            file_summary = file_usage.summary()
+            usage_by_path[file_path] = file_summary
+            run_usage.add(file_usage.usage)
+            await push_log("analyze", (
+                f"文件{os.path.basename(file_path)}实际用量: 输入 {file_summary['prompt_tokens']} token"
+                f"（缓存命中 {file_summary['cached_tokens']}）/ 输出 {file_summary['completion_tokens']} token, "
+                f"{file_summary['calls']} 次调用, 费用 ¥{file_summary['cost']:.4f}"
+                + (f"（{file_summary['estimated_calls']} 次调用未返回用量，按本地估算）" if file_summary["estimated_calls"] else "")
+                + (f"，对冲请求 {file_summary['hedged_calls']} 次（¥{file_summary['hedge_cost']:.4f}）" if file_summary["hedged_calls"] else "")
+            ))
+
+            # 检查是否有错误
+            if result.get("error"):
+                metrics.FILES.inc(status="error")
+                await push_log("analyze", f"错误: {result.get('error')}")
+                if run_id:
+                    await _store(result_store.finish_run, run_id, "error", len(input_paths), result.get("error"))
+                return {
+                    "total_files": 0,
+                    "fields": fields,
+                    "results": [],
+                    "error": result.get("error")
+                }
+
+            # Step 4: 完成 (100%)
+            await push_progress({
+                "currentFile": os.path.basename(file_path),
+                "currentStep": "complete",
+                "currentFileIndex": i,
+                "totalFiles": total_files,
+                "progress": 100
+            })
+
+            metrics.FILES.inc(status="success")
+            extracted = result.get("parsed", {})
+            raw_response = result.get("raw", "")
+
+            extracted_by_path[file_path] = extracted
+            if run_id:
+                await _store(result_store.record_result, run_id, file_path, digest, extracted, raw_response, usage=file_summary)
+
+            # 保存原始响应数据
+            all_raw_responses.append({
+                "file": os.path.basename(file_path),
+                "raw": raw_response
+            })
+
+        # 保存原始数据到文件
+        data_dir = config_service.get_data_dir()
+        raw_data_file = os.path.join(data_dir, "raw_data.json")
+        try:
+            with open(raw_data_file, 'w', encoding='utf-8') as f:
+                json.dump(all_raw_responses, f, ensure_ascii=False, indent=2)
+            await push_log("analyze", f"原始数据已保存到: {raw_data_file}")
+        except Exception as e:
+            await push_log("analyze", f"保存原始数据失败: {str(e)}")
+
+        # 按输入顺序汇总结果，重复文件复用首个文件的提取结果
+        all_results = []
+        for file_path in input_paths:
+            primary = duplicate_of.get(file_path, file_path)
+            if primary not in extracted_by_path:
+                continue
+            item = {"file": file_path, "extracted": extracted_by_path[primary]}
+            if primary == file_path and file_path in usage_by_path:
+                item["usage"] = usage_by_path[file_path]
+            if primary != file_path:
+                item["duplicate_of"] = primary
+                if run_id:
+                    await _store(result_store.record_result, run_id, file_path, hashes.get(file_path), item["extracted"], duplicate_of=primary)
+            all_results.append(item)
+
+        dedup_stats = dedup.dedup_report(len(input_paths), len(input_paths) - len(duplicate_of))
+        tokens_before = sum(report["tokens_before"] for report in normalization.values())
+        tokens_saved = sum(report["tokens_saved"] for report in normalization.values())
+        await push_log("analyze", f"解析完成，共处理 {len(all_results)} 个文件（去重节省 {dedup_stats['duplicates']} 次提取，文本规范化节省 {tokens_saved} token），实际费用 ¥{run_usage.cost:.4f}")
+        limits = adaptive_limiter.status()
+        if limits:
+            await push_log("analyze", "自适应并发上限: " + ", ".join(
+                f"{item['endpoint']} {item['limit']}（减小 {item['decreases']} 次）" for item in limits
+            ))
+        if run_id:
+            await _store(result_store.finish_run, run_id, "success", len(input_paths))
+
+        return {
+            "run_id": run_id,
+            "total_files": len(input_paths),
+            "fields": fields,
+            "results": all_results,
+            "dedup": dedup_stats,
+            "prompt_version": prompt_templates.get_template(prompt_version).version,
+            "usage": {
+                **run_usage.to_dict(),
+                "cost_per_file": round(run_usage.cost / len(usage_by_path), 6) if usage_by_path else 0.0,
+            },
+            "normalization": {
+                "tokens_before": tokens_before,
+                "tokens_after": tokens_before - tokens_saved,
+                "tokens_saved": tokens_saved,
+                "files": [{"file": path, **report} for path, report in normalization.items()],
             }
-
-        # Step 4: 完成 (100%)
-        await push_progress({
-            "currentFile": os.path.basename(file_path),
-            "currentStep": "complete",
-            "currentFileIndex": i + 1,
-            "totalFiles": total_files,
-            "progress": 100
-        })
-
-        extracted = result.get("parsed", {})
-        raw_response = result.get("raw", "")
-
-        all_results.append({
-            "file": file_path,
-            "extracted": extracted
-        })
-
-        # 保存原始响应数据
-        all_raw_responses.append({
-            "file": os.path.basename(file_path),
-            "raw": raw_response
-        })
-
-    # 保存原始数据到文件
-    data_dir = config_service.get_data_dir()
-    raw_data_file = os.path.join(data_dir, "raw_data.json")
-    try:
-        with open(raw_data_file, 'w', encoding='utf-8') as f:
-            json.dump(all_raw_responses, f, ensure_ascii=False, indent=2)
-        await push_log("analyze", f"原始数据已保存到: {raw_data_file}")
-    except Exception as e:
-        await push_log("analyze", f"保存原始数据失败: {str(e)}")
-
-    await push_log("analyze", f"解析完成，共处理 {len(all_results)} 个文件")
-
-    return {
-        "total_files": len(file_paths),
-        "fields": fields,
-        "results": all_results
-    }
+        }
+    except BaseException as e:
+        # 异常中断（含任务取消）时把运行记录标记为失败，避免一直停留在 running
+        if run_id:
+            await _store(result_store.finish_run, run_id, "error", len(input_paths), str(e) or type(e).__name__)
+        raise
 
 
 def split_documents(docs: List[str], chunk_size: int = 1000) -> List[str]:
@@ -0,0 +1,176 @@
+"""
+单次解析任务的性能剖析
+按请求开启：事件循环线程上的 cProfile、覆盖全部线程的栈采样（可看到 Map 工作线程中的网络等待）、
+tracemalloc 内存分配快照；结果保存在数据目录 profiles/ 下。未开启时不导入本模块，没有任何开销
+
+注意：cProfile 与 tracemalloc 是进程级的，剖析期间事件循环线程处理的所有请求（其他解析任务、日志推送、
+状态查询等）都会计入结果，并非只有本次解析；需要干净的结果时应在没有其他请求的情况下剖析。结果目录中的 README.txt 同样说明
+"""
+#print(">>> import profiler...")
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from .config_service import get_data_dir
+
+
+# 栈采样间隔（秒）
+SAMPLE_INTERVAL = 0.01
+# tracemalloc 保存的调用栈深度
+TRACEMALLOC_FRAMES = 10
+# 文本报告中列出的条目数
+TOP_N = 40
+
+# 同一时间只允许一个剖析任务（cProfile / tracemalloc 均为进程级状态）
+_active = threading.Lock()
+
+# 写入结果目录的说明
+_README = """本目录是一次 /api/analyze（profile: true）的性能剖析结果。
+
+cpu.prof / cpu_top.txt   事件循环线程上的 cProfile（python -m pstats cpu.prof 或 snakeviz 打开）
+samples.folded           全部线程的栈采样（折叠栈格式，可交给 flamegraph.pl / speedscope）
+alloc.snapshot / alloc_top.txt   tracemalloc 内存分配快照
+
+注意：cProfile 与 tracemalloc 是进程级的，剖析期间服务处理的所有请求都会计入结果，
+包括同时运行的其他解析任务、日志推送和状态查询等，并非只有本次解析。
+"""
+
+
+def get_profile_dir() -> str:
+    """获取剖析结果目录（位于数据目录下）"""
+    profile_dir = os.path.join(get_data_dir(), "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RunProfiler:
+    """
+    单次运行的剖析器
+
+    用法：
+        profiler = RunProfiler("job-label")
+        if profiler.start():
+            ...
+            artifacts = profiler.stop()   # {"dir": ..., "files": {"cpu_profile": 路径, ...}}
+    """
+
+    def __init__(self, label: str = ""):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_label = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)[:60]
+        self.output_dir = os.path.join(get_profile_dir(), f"{timestamp}_{safe_label}" if safe_label else timestamp)
+        self._profile: Optional[cProfile.Profile] = None
+        self._samples: Counter = Counter()
+        self._sample_count = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_at = 0.0
+
+    def start(self) -> bool:
+        """
+        开始剖析
+
+        Returns:
+            是否成功开始；已有其他剖析任务在运行时返回 False
+        """
+        if not _active.acquire(blocking=False):
+            return False
+        self._started_at = time.perf_counter()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    def _sample(self) -> None:
+        """定期采样所有线程的调用栈，按折叠栈格式（flamegraph）计数"""
+        own_ident = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[";".join(reversed(stack))] += 1
+            self._sample_count += 1
+
+    def stop(self) -> Dict:
+        """
+        停止剖析并写出结果文件
+
+        Returns:
+            各结果文件路径与简要统计
+        """
+        try:
+            self._stop.set()
+            self._profile.disable()
+            self._sampler.join()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            _active.release()
+        return self._write(snapshot, current, peak)
+
+    def _write(self, snapshot, current: int, peak: int) -> Dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = {
+            "cpu_profile": os.path.join(self.output_dir, "cpu.prof"),
+            "cpu_report": os.path.join(self.output_dir, "cpu_top.txt"),
+            "stack_samples": os.path.join(self.output_dir, "samples.folded"),
+            "alloc_snapshot": os.path.join(self.output_dir, "alloc.snapshot"),
+            "alloc_report": os.path.join(self.output_dir, "alloc_top.txt"),
+            "readme": os.path.join(self.output_dir, "README.txt"),
+        }
+        with open(paths["readme"], "w", encoding="utf-8") as f:
+            f.write(_README)
+
+        # cProfile：可用 python -m pstats 或 snakeviz 打开
+        self._profile.dump_stats(paths["cpu_profile"])
+        report = io.StringIO()
+        pstats.Stats(self._profile, stream=report).sort_stats("cumulative").print_stats(TOP_N)
+        with open(paths["cpu_report"], "w", encoding="utf-8") as f:
+            f.write("# 包含剖析期间事件循环线程处理的所有请求，并非只有本次解析\n\n")
+            f.write(report.getvalue())
+
+        # 栈采样：每行 "线程;外层帧;...;内层帧 次数"，可直接交给 flamegraph.pl / speedscope
+        with open(paths["stack_samples"], "w", encoding="utf-8") as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # tracemalloc：快照可用 tracemalloc.Snapshot.load() 加载后对比
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        snapshot.dump(paths["alloc_snapshot"])
+        with open(paths["alloc_report"], "w", encoding="utf-8") as f:
+            f.write(f"current: {current / 1024 / 1024:.1f} MB, peak: {peak / 1024 / 1024:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:TOP_N]:
+                f.write(f"{stat}\n")
+
+        return {
+            "dir": self.output_dir,
+            "seconds": round(time.perf_counter() - self._started_at, 3),
+            "samples": self._sample_count,
+            "alloc_peak_mb": round(peak / 1024 / 1024, 1),
+            "note": "进程级剖析：包含剖析期间服务处理的所有请求",
+            "files": paths,
+        }
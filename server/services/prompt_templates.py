@@ -0,0 +1,210 @@
+"""
+Prompt 模板服务
+版本化的提取 / 合并 prompt。v2 起采用"固定前缀 + 可变正文"布局：与字段无关的规则和输出格式在最前，
+其后是本次请求的字段列表，分块正文放在最后的 user 消息中。
+字段列表随字段分组、页面范围分组和检索分组变化，只有规则部分在所有请求间完全一致；
+同一组字段的各分块、各论文共享"规则 + 字段列表"前缀。
+
+服务商（OpenAI、DashScope 等）只缓存达到最小长度（约 1024 token）的前缀：内置模板的固定部分远短于此，
+只有在自定义模板中加入较长的字段说明或示例时前缀缓存才会生效
+
+环境变量：
+    PAPER_EXTRACT_PROMPT_VERSION   默认模板版本（v1 / v2 或自定义版本），默认 v2
+
+自定义模板：在数据目录下放置 prompt_templates.json（版本 -> 各部分文本），未填写的部分沿用默认模板，例如
+    {"v2-en": {"map_system": "Extract fields: {fields}\\nReturn strict JSON ..."}}
+模板中可用的占位符：map_system / map_user 中的 {fields}、{chunk}，reduce_user 中的 {results}，repair_user 中的 {fields}、{output}
+"""
+#print(">>> import prompt_templates...")
+import json
+import os
+from dataclasses import dataclass, fields as dataclass_fields, replace
+from typing import Dict, List, Optional, Tuple, Union
+
+from .logger import get_logger
+
+logger = get_logger("prompt_templates")
+
+
+# 消息列表：[(角色, 内容), ...]，LangChain ChatModel 可直接接收
+Messages = List[Tuple[str, str]]
+# 调用 LLM 时的 prompt：纯文本（单条 user 消息）或消息列表
+Prompt = Union[str, Messages]
+
+DEFAULT_VERSION = "v2"
+CUSTOM_TEMPLATE_FILE = "prompt_templates.json"
+
+# 格式修复：输出不是合法 JSON 时把原输出发回模型，只要求修正格式（不重发分块正文）
+_REPAIR_USER = """以下输出应为一个 JSON 对象，但格式有误，无法解析：
+
+{output}
+
+请修正格式后重新输出。键为：{fields}
+不要修改、补充或删除任何值，只返回 JSON 对象，不要包含任何解释。
+"""
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    一套提取 / 合并 prompt
+
+    system 部分为空时只发送一条 user 消息（v1 的单消息布局）
+    """
+    version: str
+    map_system: str
+    map_user: str
+    reduce_system: str
+    reduce_user: str
+    repair_user: str = _REPAIR_USER
+
+
+# v1：原有布局，指令、字段和正文在同一条 user 消息中（字段列表在正文之前，但每个分块都不同，前缀无法复用）
+_V1 = PromptTemplate(
+    version="v1",
+    map_system="",
+    map_user="""请从以下论文片段中提取字段：{fields}
+
+严格返回 JSON 格式，不要包含任何解释或额外内容。如果某个字段不存在，请返回空字符串。
+
+片段内容：
+{chunk}
+""",
+    reduce_system="",
+    reduce_user="""以下是多个论文片段提取结果：
+
+{results}
+
+请合并为最终结果。
+规则：
+1. 如果多个片段都有值，选择最完整的（非空）值。
+2. 不要丢失任何信息。
+3. 严格返回 JSON 格式，不要包含任何解释。
+
+输出格式：
+{
+    "字段名": "合并后的值",
+    ...
+}
+""",
+)
+
+# v2：与字段无关的规则和输出格式在最前，字段列表在 system 消息末尾，分块正文在 user 消息
+_V2 = PromptTemplate(
+    version="v2",
+    map_system="""你是论文信息提取助手。用户会发送一段论文片段，请按下方列出的字段提取信息。
+
+规则：
+1. 严格返回 JSON 对象，键为需要提取的字段名，不要包含任何解释或额外内容。
+2. 如果某个字段在片段中不存在，请返回空字符串。
+3. 只依据片段内容提取，不要编造。
+
+输出格式：
+{
+    "字段名": "提取的值",
+    ...
+}
+
+本次提取字段：{fields}
+""",
+    map_user="""片段内容：
+{chunk}
+""",
+    reduce_system="""你是论文信息提取助手。用户会发送同一篇论文多个片段的提取结果（JSON 数组），请合并为最终结果。
+
+规则：
+1. 如果多个片段都有值，选择最完整的（非空）值。
+2. 不要丢失任何信息。
+3. 严格返回 JSON 格式，不要包含任何解释。
+
+输出格式：
+{
+    "字段名": "合并后的值",
+    ...
+}
+""",
+    reduce_user="""各片段提取结果：
+
+{results}
+""",
+)
+
+BUILTIN_TEMPLATES: Dict[str, PromptTemplate] = {_V1.version: _V1, _V2.version: _V2}
+
+_custom: Optional[Dict[str, PromptTemplate]] = None
+
+
+def _load_custom() -> Dict[str, PromptTemplate]:
+    """读取数据目录下的自定义模板（只读取一次；文件格式错误时忽略）"""
+    global _custom
+    if _custom is not None:
+        return _custom
+    _custom = {}
+    from .config_service import get_data_dir
+    path = os.path.join(get_data_dir(), CUSTOM_TEMPLATE_FILE)
+    if not os.path.exists(path):
+        return _custom
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        parts = {item.name for item in dataclass_fields(PromptTemplate)} - {"version"}
+        for version, items in data.items():
+            base = BUILTIN_TEMPLATES.get(items.get("base", DEFAULT_VERSION), _V2)
+            _custom[version] = replace(base, version=version, **{k: v for k, v in items.items() if k in parts})
+        logger.info("已加载自定义 prompt 模板: %s", ", ".join(_custom))
+    except Exception as e:
+        logger.warning("自定义 prompt 模板读取失败，已忽略: %s (%s)", path, e)
+    return _custom
+
+
+def available_versions() -> List[str]:
+    """可用的模板版本"""
+    return list(BUILTIN_TEMPLATES) + [v for v in _load_custom() if v not in BUILTIN_TEMPLATES]
+
+
+def get_template(version: str = "") -> PromptTemplate:
+    """
+    按版本获取模板
+
+    Args:
+        version: 模板版本，为空时取 PAPER_EXTRACT_PROMPT_VERSION（默认 v2）
+
+    Raises:
+        ValueError: 版本不存在
+    """
+    name = (version or os.environ.get("PAPER_EXTRACT_PROMPT_VERSION", "") or DEFAULT_VERSION).strip()
+    template = _load_custom().get(name) or BUILTIN_TEMPLATES.get(name)
+    if template is None:
+        raise ValueError(f"未知的 prompt 模板版本: {name}（可用: {', '.join(available_versions())}）")
+    return template
+
+
+def _messages(system: str, user: str) -> Messages:
+    return [("system", system), ("user", user)] if system else [("user", user)]
+
+
+def render_map(template: PromptTemplate, chunk: str, fields: List[str]) -> Messages:
+    """Map 阶段消息：字段列表在 system 消息末尾，分块正文在最后"""
+    fields_str = ", ".join(fields)
+    return _messages(
+        template.map_system.replace("{fields}", fields_str),
+        template.map_user.replace("{fields}", fields_str).replace("{chunk}", chunk),
+    )
+
+
+def render_reduce(template: PromptTemplate, results: List[Dict]) -> Messages:
+    """Reduce 阶段消息"""
+    results_str = json.dumps(results, ensure_ascii=False, indent=2)
+    return _messages(template.reduce_system, template.reduce_user.replace("{results}", results_str))
+
+
+def render_repair(template: PromptTemplate, output: str, fields: List[str]) -> Messages:
+    """格式修复消息：无法解析的原输出与期望的字段名"""
+    return _messages("", template.repair_user.replace("{fields}", ", ".join(fields)).replace("{output}", output))
+
+
+def prompt_text(prompt: Prompt) -> str:
+    """prompt 的全部文本（用于 token 计数和日志）"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(content for _, content in prompt)
@@ -0,0 +1,191 @@
+"""
+端点池服务
+在多个配置（API Key / 端点）之间分发 LLM 请求：
+加权轮询或最少在途请求调度，连续失败后熔断并冷却，调用失败时自动切换到其他端点；
+冷却结束后进入半开状态，只放行一个试探请求，试探成功才关闭熔断
+"""
+#print(">>> import provider_pool...")
+import threading
+import time
+from typing import Dict, List, Optional
+
+from . import config_service
+from .logger import get_logger
+from .model_registry import get_model_info
+
+logger = get_logger("provider_pool")
+
+
+# 调度策略
+STRATEGY_ROUND_ROBIN = "round_robin"
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+
+# 熔断参数：连续失败次数阈值、冷却秒数
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+
+
+class Endpoint:
+    """单个 LLM 端点，对应 config.json 中的一个配置"""
+
+    def __init__(self, config: Dict):
+        self.name = config.get("config_name", "")
+        self.model_name = config.get("model_name", "")
+        self.api_key = config.get("api_key", "")
+        self.base_url = config.get("base_url", "")
+        self.weight = max(1, int(config.get("weight", 1) or 1))
+        self.concurrency = max(1, int(config.get("concurrency", 4) or 4))
+
+        self.outstanding = 0            # 在途请求数
+        self.consecutive_failures = 0   # 连续失败次数
+        self.opened_at = 0.0            # 熔断开启时间（0 表示未熔断）
+        self.probing = False            # 半开状态下的试探请求是否在途
+        self.current_weight = 0         # 平滑加权轮询的当前权重
+
+    def is_available(self, now: float, cooldown: float) -> bool:
+        """未熔断，或已过冷却期且没有在途的试探请求（半开状态只放行一个试探请求）"""
+        if self.opened_at == 0.0:
+            return True
+        return not self.probing and now - self.opened_at >= cooldown
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "model_name": self.model_name,
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "concurrency": self.concurrency,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_open": self.opened_at != 0.0,
+            "probing": self.probing,
+        }
+
+
+class ProviderPool:
+    """
+    端点池（线程安全，call_llm 在工作线程中调用）
+
+    Args:
+        configs: 参与调度的配置列表
+        strategy: 调度策略，round_robin（加权轮询）或 least_outstanding（最少在途请求）
+        failure_threshold: 连续失败多少次后熔断
+        cooldown: 熔断冷却秒数，冷却后进入半开状态
+    """
+
+    def __init__(
+        self,
+        configs: List[Dict],
+        strategy: str = STRATEGY_ROUND_ROBIN,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN
+    ):
+        if not configs:
+            raise ValueError("端点池至少需要一个配置")
+        if strategy not in (STRATEGY_ROUND_ROBIN, STRATEGY_LEAST_OUTSTANDING):
+            raise ValueError(f"不支持的调度策略: {strategy}")
+
+        self.endpoints = [Endpoint(cfg) for cfg in configs]
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def concurrency(self) -> int:
+        """端点池的总并发数（各成员配置的并发数之和）"""
+        return sum(ep.concurrency for ep in self.endpoints)
+
+    def acquire(self, exclude: Optional[List[Endpoint]] = None) -> Endpoint:
+        """
+        选择一个端点并占用一个在途名额
+
+        Args:
+            exclude: 本次请求已经尝试失败的端点
+
+        Returns:
+            选中的端点；若全部熔断，则选择最早熔断（最先结束冷却）的端点进行试探
+        """
+        exclude = exclude or []
+        with self._lock:
+            now = time.monotonic()
+            candidates = [ep for ep in self.endpoints if ep not in exclude] or list(self.endpoints)
+            available = [ep for ep in candidates if ep.is_available(now, self.cooldown)]
+
+            if not available:
+                endpoint = min(candidates, key=lambda ep: ep.opened_at)
+            elif self.strategy == STRATEGY_LEAST_OUTSTANDING:
+                endpoint = min(available, key=lambda ep: ep.outstanding / ep.weight)
+            else:
+                # 平滑加权轮询（nginx 算法）
+                total = sum(ep.weight for ep in available)
+                for ep in available:
+                    ep.current_weight += ep.weight
+                endpoint = max(available, key=lambda ep: ep.current_weight)
+                endpoint.current_weight -= total
+
+            if endpoint.opened_at != 0.0:
+                # 熔断中的端点：本次请求作为试探请求，结果返回前不再放行其他请求
+                endpoint.probing = True
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, success: bool) -> None:
+        """
+        释放在途名额并更新健康状态
+
+        Args:
+            endpoint: acquire() 返回的端点
+            success: 本次调用是否成功
+        """
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            # 熔断前发出的请求可能晚于试探请求返回，在途请求全部返回后才结束试探
+            if endpoint.outstanding == 0:
+                endpoint.probing = False
+            if success:
+                endpoint.consecutive_failures = 0
+                endpoint.opened_at = 0.0
+                return
+
+            endpoint.consecutive_failures += 1
+            # 达到阈值或试探请求失败时（重新）开始冷却
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.opened_at = time.monotonic()
+                logger.warning("端点 %s 连续失败 %d 次，熔断 %.0fs", endpoint.name, endpoint.consecutive_failures, self.cooldown)
+
+    def planning_model(self) -> str:
+        """
+        分块规划使用的模型：上下文窗口最小的成员
+
+        请求可能被分发到任意端点，分块必须放得进每个端点的模型
+        """
+        return min((ep.model_name for ep in self.endpoints), key=lambda name: get_model_info(name)["context_window"])
+
+    def status(self) -> List[Dict]:
+        """返回各端点当前状态（用于日志）"""
+        with self._lock:
+            return [ep.to_dict() for ep in self.endpoints]
+
+
+def build_pool(config_names: List[str], strategy: str = STRATEGY_ROUND_ROBIN) -> Optional[ProviderPool]:
+    """
+    根据配置名称构建端点池
+
+    Args:
+        config_names: 参与调度的配置名称列表
+        strategy: 调度策略
+
+    Returns:
+        端点池；未找到任何有效配置时返回 None
+    """
+    configs = [
+        cfg for cfg in config_service.get_configs_by_names(config_names)
+        if cfg.get("api_key") and cfg.get("base_url")
+    ]
+    if not configs:
+        return None
+    return ProviderPool(configs, strategy=strategy)
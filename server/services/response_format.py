@@ -0,0 +1,127 @@
+"""
+结构化输出服务
+根据模型能力选择 JSON Schema / JSON Mode，按请求字段生成 Schema 并校验 LLM 返回结果
+"""
+#print(">>> import response_format...")
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from .json_stream import IncrementalJSONParser, TruncatedResponseError
+from .model_registry import get_model_info
+
+
+# 结构化输出方式（对应模型能力表中的 structured_output）
+FORMAT_JSON_SCHEMA = "json_schema"   # 按 Schema 约束输出（OpenAI Structured Outputs）
+FORMAT_JSON_OBJECT = "json_object"   # JSON Mode，只保证输出合法 JSON
+FORMAT_NONE = "none"                 # 不支持，仅依靠 prompt 约束
+
+
+class ResponseFormatError(ValueError):
+    """LLM 返回内容中没有可解析的 JSON 对象"""
+
+
+def build_schema(fields: List[str]) -> Dict:
+    """
+    根据请求字段生成 JSON Schema（所有字段必填，值为字符串）
+
+    Args:
+        fields: 需要提取的字段列表
+
+    Returns:
+        JSON Schema 字典
+    """
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+def build_response_format(model_name: str, fields: List[str]) -> Optional[Dict]:
+    """
+    根据模型能力构建 response_format 请求参数
+
+    Args:
+        model_name: 模型名称
+        fields: 需要提取的字段列表
+
+    Returns:
+        response_format 字典；模型不支持结构化输出时返回 None
+    """
+    mode = get_model_info(model_name).get("structured_output", FORMAT_NONE)
+    if mode == FORMAT_JSON_SCHEMA:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "paper_fields", "schema": build_schema(fields), "strict": True},
+        }
+    if mode == FORMAT_JSON_OBJECT:
+        return {"type": "json_object"}
+    return None
+
+
+def parse_json_response(raw: str) -> Dict:
+    """
+    解析 LLM 返回的 JSON 对象（兼容前后带说明文字或 ```json 代码块的输出）
+
+    Args:
+        raw: LLM 原始返回文本
+
+    Returns:
+        解析后的字典
+
+    Raises:
+        ResponseFormatError: 没有完整的 JSON 对象
+    """
+    text = (raw or "").strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    parser = IncrementalJSONParser()
+    try:
+        parser.feed(text)
+        return parser.finish()
+    except TruncatedResponseError as e:
+        raise ResponseFormatError(str(e)) from e
+
+
+def _coerce(value: Any) -> Optional[str]:
+    """把字段值转换为字符串；无法转换（嵌套对象等）时返回 None"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, bool)):
+        return str(value)
+    if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+        return "; ".join(str(v) for v in value)
+    return None
+
+
+def validate_fields(data: Dict, fields: List[str]) -> Tuple[Dict, List[str]]:
+    """
+    按 Schema 校验提取结果
+
+    Args:
+        data: LLM 返回并解析后的字典
+        fields: 需要提取的字段列表
+
+    Returns:
+        (valid, invalid): 合法字段的值（已统一为字符串） 和 缺失/不合法的字段列表
+    """
+    valid = {}
+    invalid = []
+    for field in fields:
+        if field not in data:
+            invalid.append(field)
+            continue
+        value = _coerce(data[field])
+        if value is None:
+            invalid.append(field)
+        else:
+            valid[field] = value
+    return valid, invalid
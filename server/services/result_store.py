@@ -0,0 +1,437 @@
+"""
+结果存储服务
+本地 SQLite（WAL 模式）保存每次解析任务、文档、提取字段和 Map 阶段原始输出，
+提取值建立全文索引（FTS5），可跨任务查询、过滤、分页，导出直接从存储生成而无需重新解析
+
+数据库位于数据目录 results.db：
+    runs        解析任务（字段、模型、来源、状态）
+    documents   文档（路径 + 内容哈希）
+    results     每个任务中每个文档的一条结果（重复文件记录 duplicate_of）
+    field_values 提取的字段值（result_id, name, value）
+    raw_outputs 原始模型输出
+    usage       每个文档提取时服务商返回的用量与费用（含各分块明细）
+    field_fts   字段值全文索引
+"""
+#print(">>> import result_store...")
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .config_service import get_data_dir
+from .logger import get_logger
+
+logger = get_logger("result_store")
+
+
+DB_FILE_NAME = "results.db"
+# 分页上限
+MAX_PAGE_SIZE = 500
+# usage 表中的用量列（与 usage.Usage 字段一致）
+_USAGE_COLUMNS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "seconds", "cost", "estimated_calls", "hedged_calls", "hedge_cost")
+# 旧版本数据库中 usage 表缺少的列：列名 -> 定义
+_USAGE_MIGRATIONS = {
+    "hedged_calls": "INTEGER NOT NULL DEFAULT 0",
+    "hedge_cost": "REAL NOT NULL DEFAULT 0",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    model_name TEXT,
+    config_name TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    total_files INTEGER NOT NULL DEFAULT 0,
+    error TEXT NOT NULL DEFAULT '',
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL DEFAULT '',
+    first_seen TEXT NOT NULL,
+    UNIQUE (path, content_hash)
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    duplicate_of TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id);
+CREATE INDEX IF NOT EXISTS idx_results_document ON results(document_id);
+CREATE TABLE IF NOT EXISTS field_values (
+    result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_field_values_result ON field_values(result_id);
+CREATE INDEX IF NOT EXISTS idx_field_values_name ON field_values(name, value);
+CREATE TABLE IF NOT EXISTS raw_outputs (
+    result_id INTEGER PRIMARY KEY REFERENCES results(id) ON DELETE CASCADE,
+    raw TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    result_id INTEGER PRIMARY KEY REFERENCES results(id) ON DELETE CASCADE,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    estimated_calls INTEGER NOT NULL DEFAULT 0,
+    hedged_calls INTEGER NOT NULL DEFAULT 0,
+    hedge_cost REAL NOT NULL DEFAULT 0,
+    detail TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_usage_run ON usage(run_id);
+"""
+
+# trigram 分词支持中文子串检索（SQLite >= 3.34）；不支持时退回 unicode61
+_FTS_SCHEMAS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS field_fts USING fts5(value, name UNINDEXED, result_id UNINDEXED, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS field_fts USING fts5(value, name UNINDEXED, result_id UNINDEXED)",
+]
+# trigram 分词的最短查询长度，更短的查询改用 LIKE
+MIN_FTS_QUERY = 3
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_db_path: Optional[str] = None
+
+
+def get_db_path() -> str:
+    """获取数据库路径（位于数据目录下）"""
+    return os.path.join(get_data_dir(), DB_FILE_NAME)
+
+
+def _connect() -> sqlite3.Connection:
+    """打开（或复用）数据库连接；数据目录变化时重新打开"""
+    global _conn, _db_path
+    path = get_db_path()
+    if _conn is not None and _db_path == path:
+        return _conn
+    if _conn is not None:
+        _conn.close()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # WAL：读写互不阻塞，查询接口不受正在写入的解析任务影响
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SCHEMA)
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(usage)")}
+    for column, definition in _USAGE_MIGRATIONS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE usage ADD COLUMN {column} {definition}")
+    for schema in _FTS_SCHEMAS:
+        try:
+            conn.execute(schema)
+            break
+        except sqlite3.OperationalError as e:
+            logger.warning("创建全文索引失败（%s），尝试备用分词器", e)
+    conn.commit()
+    _conn, _db_path = conn, path
+    return conn
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _to_text(value: Any) -> str:
+    """字段值转为可检索的文本（列表 / 对象按 JSON 保存）"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _from_text(text: str) -> Any:
+    if text[:1] in ("[", "{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+
+def start_run(fields: List[str], model_name: str = "", config_name: str = "", source: str = "analyze") -> int:
+    """
+    登记一次解析任务
+
+    Returns:
+        任务 ID
+    """
+    with _lock:
+        conn = _connect()
+        cursor = conn.execute(
+            "INSERT INTO runs (source, fields, model_name, config_name, started_at) VALUES (?, ?, ?, ?, ?)",
+            (source, json.dumps(fields, ensure_ascii=False), model_name, config_name, _now()),
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+
+def record_result(run_id: int, file_path: str, content_hash: Optional[str], extracted: Dict, raw: str = "", duplicate_of: Optional[str] = None, usage: Optional[Dict] = None) -> int:
+    """
+    保存一个文档的提取结果（字段值写入全文索引）
+
+    Args:
+        usage: 提取该文档的用量汇总（usage.UsageScope.summary()，children 为各分块明细）；重复文件不产生用量
+
+    Returns:
+        结果 ID
+    """
+    now = _now()
+    with _lock:
+        conn = _connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO documents (path, content_hash, first_seen) VALUES (?, ?, ?)",
+                (file_path, content_hash or "", now),
+            )
+            document_id = conn.execute(
+                "SELECT id FROM documents WHERE path = ? AND content_hash = ?", (file_path, content_hash or "")
+            ).fetchone()["id"]
+            result_id = conn.execute(
+                "INSERT INTO results (run_id, document_id, duplicate_of, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, document_id, duplicate_of, now),
+            ).lastrowid
+            values = [(result_id, name, _to_text(value)) for name, value in extracted.items()]
+            conn.executemany("INSERT INTO field_values (result_id, name, value) VALUES (?, ?, ?)", values)
+            conn.executemany("INSERT INTO field_fts (result_id, name, value) VALUES (?, ?, ?)", [v for v in values if v[2]])
+            if raw:
+                conn.execute("INSERT INTO raw_outputs (result_id, raw) VALUES (?, ?)", (result_id, raw))
+            if usage:
+                conn.execute(
+                    f"INSERT INTO usage (result_id, run_id, {', '.join(_USAGE_COLUMNS)}, detail) "
+                    f"VALUES (?, ?, {', '.join('?' * len(_USAGE_COLUMNS))}, ?)",
+                    [result_id, run_id] + [usage.get(name, 0) for name in _USAGE_COLUMNS]
+                    + [json.dumps(usage.get("children", []), ensure_ascii=False)],
+                )
+        return result_id
+
+
+def finish_run(run_id: int, status: str, total_files: int = 0, error: str = "") -> None:
+    """更新任务状态（success / error）"""
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "UPDATE runs SET status = ?, total_files = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, total_files, error, _now(), run_id),
+        )
+        conn.commit()
+
+
+def _run_row(row: sqlite3.Row) -> Dict:
+    item = dict(row)
+    item["fields"] = json.loads(item["fields"])
+    return item
+
+
+def list_runs(limit: int = 50, offset: int = 0) -> Dict:
+    """分页列出解析任务（最新在前），附带每个任务的结果数"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with _lock:
+        conn = _connect()
+        total = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        rows = conn.execute(
+            "SELECT runs.*, (SELECT COUNT(*) FROM results WHERE results.run_id = runs.id) AS result_count "
+            "FROM runs ORDER BY id DESC LIMIT ? OFFSET ?",
+            (limit, max(0, offset)),
+        ).fetchall()
+    return {"total": total, "items": [_run_row(row) for row in rows]}
+
+
+def get_run(run_id: int) -> Optional[Dict]:
+    """任务详情"""
+    with _lock:
+        row = _connect().execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+    return _run_row(row) if row else None
+
+
+def query_results(q: str = "", field: str = "", value: str = "", run_id: Optional[int] = None, path: str = "", include_raw: bool = False, limit: int = 50, offset: int = 0) -> Dict:
+    """
+    跨任务查询提取结果
+
+    Args:
+        q: 全文检索（在所有字段值中查找，可与 field 组合限定字段）
+        field: 字段名（与 value 一起使用时精确匹配该字段的值）
+        value: 字段值（精确匹配）
+        run_id: 只查询指定任务
+        path: 文件路径包含的子串
+        include_raw: 是否返回 Map 阶段原始输出
+        limit: 每页条数
+        offset: 偏移量
+
+    Returns:
+        {"total": 总条数, "items": [{result_id, run_id, file, content_hash, created_at, duplicate_of, extracted}, ...]}
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conditions = []
+    params: List[Any] = []
+    if run_id is not None:
+        conditions.append("results.run_id = ?")
+        params.append(run_id)
+    if path:
+        conditions.append("documents.path LIKE ?")
+        params.append(f"%{path}%")
+    if field and value:
+        conditions.append("results.id IN (SELECT result_id FROM field_values WHERE name = ? AND value = ?)")
+        params += [field, value]
+    if q:
+        if len(q) >= MIN_FTS_QUERY:
+            # 短语查询：转义双引号
+            match = '"' + q.replace('"', '""') + '"'
+            sub = "SELECT result_id FROM field_fts WHERE field_fts MATCH ?"
+            params.append(match)
+            if field:
+                sub += " AND name = ?"
+                params.append(field)
+        else:
+            sub = "SELECT result_id FROM field_values WHERE value LIKE ?"
+            params.append(f"%{q}%")
+            if field:
+                sub += " AND name = ?"
+                params.append(field)
+        conditions.append(f"results.id IN ({sub})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    base = f"FROM results JOIN documents ON documents.id = results.document_id {where}"
+    with _lock:
+        conn = _connect()
+        total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT results.id AS result_id, results.run_id, documents.path AS file, documents.content_hash, "
+            f"results.created_at, results.duplicate_of {base} ORDER BY results.id DESC LIMIT ? OFFSET ?",
+            params + [limit, max(0, offset)],
+        ).fetchall()
+        items = [dict(row) for row in rows]
+        ids = [item["result_id"] for item in items]
+        values: Dict[int, Dict] = {result_id: {} for result_id in ids}
+        raws: Dict[int, str] = {}
+        if ids:
+            marks = ",".join("?" * len(ids))
+            for row in conn.execute(f"SELECT result_id, name, value FROM field_values WHERE result_id IN ({marks})", ids):
+                values[row["result_id"]][row["name"]] = _from_text(row["value"])
+            if include_raw:
+                raws = {row["result_id"]: row["raw"] for row in conn.execute(f"SELECT result_id, raw FROM raw_outputs WHERE result_id IN ({marks})", ids)}
+
+    for item in items:
+        item["extracted"] = values[item["result_id"]]
+        if include_raw:
+            item["raw"] = raws.get(item["result_id"], "")
+    return {"total": total, "items": items}
+
+
+def _usage_totals(row: sqlite3.Row) -> Dict:
+    item = {name: row[name] or 0 for name in _USAGE_COLUMNS}
+    item["seconds"] = round(item["seconds"], 3)
+    item["cost"] = round(item["cost"], 6)
+    item["hedge_cost"] = round(item["hedge_cost"], 6)
+    return item
+
+
+def usage_report(run_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> Dict:
+    """
+    用量与费用报告
+
+    Args:
+        run_id: 指定时返回该任务的合计与每个文档的明细（含各分块）；为空时分页返回各任务的合计
+        limit: 每页条数
+        offset: 偏移量
+
+    Returns:
+        指定任务: {"run_id", "total", "cost_per_file", "files": [{file, result_id, ...用量, chunks}]}
+        未指定:   {"total": 总合计, "runs": {"total": 任务数, "items": [{run_id, model_name, started_at, files, ...用量}]}}
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    sums = ", ".join(f"SUM(usage.{name}) AS {name}" for name in _USAGE_COLUMNS)
+    with _lock:
+        conn = _connect()
+        if run_id is not None:
+            total = conn.execute(f"SELECT COUNT(*) AS files, {sums} FROM usage WHERE run_id = ?", (run_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT usage.*, documents.path AS file FROM usage "
+                "JOIN results ON results.id = usage.result_id JOIN documents ON documents.id = results.document_id "
+                "WHERE usage.run_id = ? ORDER BY usage.result_id LIMIT ? OFFSET ?",
+                (run_id, limit, max(0, offset)),
+            ).fetchall()
+            return {
+                "run_id": run_id,
+                "total": _usage_totals(total),
+                "cost_per_file": round((total["cost"] or 0) / total["files"], 6) if total["files"] else 0.0,
+                "files": [
+                    {"file": row["file"], "result_id": row["result_id"], **_usage_totals(row), "chunks": json.loads(row["detail"])}
+                    for row in rows
+                ],
+            }
+
+        total = conn.execute(f"SELECT {sums} FROM usage").fetchone()
+        count = conn.execute("SELECT COUNT(DISTINCT run_id) FROM usage").fetchone()[0]
+        rows = conn.execute(
+            f"SELECT usage.run_id, runs.model_name, runs.started_at, COUNT(*) AS files, {sums} "
+            f"FROM usage JOIN runs ON runs.id = usage.run_id GROUP BY usage.run_id ORDER BY usage.run_id DESC LIMIT ? OFFSET ?",
+            (limit, max(0, offset)),
+        ).fetchall()
+    return {
+        "total": _usage_totals(total),
+        "runs": {
+            "total": count,
+            "items": [
+                {"run_id": row["run_id"], "model_name": row["model_name"], "started_at": row["started_at"], "files": row["files"],
+                 **_usage_totals(row), "cost_per_file": round((row["cost"] or 0) / row["files"], 6)}
+                for row in rows
+            ],
+        },
+    }
+
+
+def run_export(run_id: int) -> Optional[Dict]:
+    """
+    按 run_pipeline 返回值的格式重建任务结果（用于从存储生成导出文件）
+
+    Returns:
+        {"total_files", "fields", "results"}；任务不存在时返回 None
+    """
+    run = get_run(run_id)
+    if run is None:
+        return None
+    results = []
+    offset = 0
+    while True:
+        page = query_results(run_id=run_id, limit=MAX_PAGE_SIZE, offset=offset)
+        results.extend(page["items"])
+        offset += MAX_PAGE_SIZE
+        if offset >= page["total"]:
+            break
+    # 查询按最新在前，导出恢复为处理顺序
+    results.sort(key=lambda item: item["result_id"])
+    return {
+        "total_files": run["total_files"],
+        "fields": run["fields"],
+        "results": [
+            {"file": item["file"], "extracted": item["extracted"], **({"duplicate_of": item["duplicate_of"]} if item["duplicate_of"] else {})}
+            for item in results
+        ],
+    }
+
+
+def close() -> None:
+    """关闭数据库连接"""
+    global _conn, _db_path
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn, _db_path = None, None
@@ -0,0 +1,172 @@
+"""
+检索服务
+为单个文档建立本地 BM25 索引（纯 CPU，无需向量模型），按字段名称 / 字段说明为段落打分，
+检索模式下每组字段只把最相关的 top-k 段落发送给模型，长文档的 Map 调用数从“分块数”降为“字段组数”
+"""
+#print(">>> import retrieval...")
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .logger import get_logger
+
+logger = get_logger("retrieval")
+
+
+# 检索段落大小（token），远小于 Map 分块，便于精确选取
+PASSAGE_TOKENS = 800
+PASSAGE_OVERLAP = 100
+# 每个字段选取的段落数
+DEFAULT_TOP_K = 3
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+# 常见字段名的检索扩展词：字段名多为中文，论文正文多为英文
+FIELD_QUERY_TERMS: Dict[str, str] = {
+    "标题": "title",
+    "题目": "title",
+    "作者": "author authors corresponding email",
+    "机构": "university institute department laboratory affiliation",
+    "单位": "university institute department laboratory affiliation",
+    "摘要": "abstract",
+    "关键词": "keywords index terms",
+    "年份": "year published copyright",
+    "发表": "published journal conference proceedings",
+    "期刊": "journal transactions volume",
+    "会议": "conference proceedings symposium workshop",
+    "doi": "doi",
+    "方法": "method approach propose proposed framework model architecture",
+    "模型": "model architecture network",
+    "数据集": "dataset datasets benchmark corpus data",
+    "实验": "experiment experiments evaluation setup results",
+    "结果": "results performance accuracy table outperforms",
+    "指标": "metric metrics accuracy precision recall f1 bleu",
+    "结论": "conclusion conclusions future work",
+    "贡献": "contribution contributions propose we",
+    "局限": "limitation limitations future work",
+    "代码": "code github available implementation",
+    "基线": "baseline baselines compare comparison",
+    "研究问题": "problem challenge address",
+}
+
+
+@dataclass
+class RetrievalOptions:
+    """检索模式选项"""
+    top_k: int = DEFAULT_TOP_K
+    passage_tokens: int = PASSAGE_TOKENS
+    # 字段说明（可选），与字段名一起作为检索词
+    descriptions: Dict[str, str] = field(default_factory=dict)
+    # 是否总是包含第一段（标题、作者、摘要等元数据所在位置）
+    include_lead: bool = True
+
+
+def tokenize(text: str) -> List[str]:
+    """检索分词：英文按单词（小写），中文按相邻两字（bigram）"""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if "一" <= word[0] <= "鿿":
+            terms.extend(word[i:i + 2] for i in range(max(1, len(word) - 1)))
+        else:
+            terms.append(word)
+    return terms
+
+
+def field_query(field_name: str, description: str = "") -> List[str]:
+    """字段的检索词：字段名 + 扩展词 + 字段说明"""
+    expansion = " ".join(terms for key, terms in FIELD_QUERY_TERMS.items() if key in field_name.lower())
+    return tokenize(f"{field_name} {expansion} {description}")
+
+
+class BM25Index:
+    """单个文档的 BM25 段落索引"""
+
+    def __init__(self, passages: List[str]):
+        self.passages = passages
+        self._term_freqs = [Counter(tokenize(passage)) for passage in passages]
+        self._lengths = [sum(freqs.values()) for freqs in self._term_freqs]
+        self._avg_length = sum(self._lengths) / len(passages) if passages else 0.0
+        doc_freqs: Counter = Counter()
+        for freqs in self._term_freqs:
+            doc_freqs.update(freqs.keys())
+        count = len(passages)
+        self._idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        """查询与每个段落的 BM25 得分"""
+        terms = [term for term in set(query) if term in self._idf]
+        results = []
+        for freqs, length in zip(self._term_freqs, self._lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term, 0)
+                if tf:
+                    score += self._idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def top_k(self, query: List[str], k: int) -> List[int]:
+        """得分最高的 k 个段落下标；全部为 0 分时取文档开头的段落"""
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        return [i for i in ranked[:k] if scores[i] > 0] or list(range(min(k, len(scores))))
+
+
+def plan_groups(passages: List[str], fields: List[str], options: RetrievalOptions, max_passages: int) -> List[Tuple[List[str], List[int]]]:
+    """
+    为字段分组并选取段落
+
+    先按字段检索 top-k 段落，再把段落集合相同或合并后不超过 max_passages 的字段合为一组，
+    每组只需一次 Map 调用
+
+    Args:
+        passages: 文档段落
+        fields: 需要提取的字段列表
+        options: 检索选项
+        max_passages: 单次调用最多容纳的段落数（由分块大小决定）
+
+    Returns:
+        [(字段列表, 按文档顺序排列的段落下标), ...]
+    """
+    index = BM25Index(passages)
+    # 开头段落占用一个名额，检索的段落数相应减一（单次只容纳一个段落时不再附加开头段落）
+    include_lead = options.include_lead and bool(passages) and max_passages > 1
+    k = max(1, min(options.top_k, max_passages - (1 if include_lead else 0)))
+    groups: List[Tuple[List[str], Set[int]]] = []
+    for name in fields:
+        selected = set(index.top_k(field_query(name, options.descriptions.get(name, "")), k))
+        if include_lead:
+            selected.add(0)
+        # 优先并入新增段落最少的组
+        best: Optional[Tuple[List[str], Set[int]]] = None
+        for group in groups:
+            union = group[1] | selected
+            if len(union) <= max_passages and (best is None or len(selected - group[1]) < len(selected - best[1])):
+                best = group
+        if best is None:
+            groups.append(([name], selected))
+        else:
+            best[0].append(name)
+            best[1].update(selected)
+
+    plan = [(names, sorted(selected)) for names, selected in groups]
+    logger.debug("检索分组: %d 个段落, %s", len(passages), [(names, ids) for names, ids in plan])
+    return plan
+
+
+def build_context(passages: List[str], indexes: List[int]) -> str:
+    """按文档顺序拼接选中的段落，不相邻的段落之间用省略标记分隔"""
+    parts = []
+    previous = None
+    for i in indexes:
+        if previous is not None and i != previous + 1:
+            parts.append("……")
+        parts.append(passages[i])
+        previous = i
+    return "\n".join(parts)
@@ -0,0 +1,143 @@
+"""
+LLM 请求合并（single-flight）
+相同的 prompt（模型、端点、API Key、温度、prompt 内容与期望字段都相同）同时只发送一次：
+第一个请求（leader）实际调用，期间到达的相同请求（follower）等待并共享它的结果或异常。
+两个用户或两个重叠的批量任务同时提交同一批论文时，重复的 Map / Reduce 调用只计费一次
+
+只合并进行中的请求，结果不做持久缓存；命中计入 paper_extract_cache_requests_total{cache="llm_inflight"}
+
+环境变量：
+    PAPER_EXTRACT_SINGLE_FLIGHT   是否启用（1 / 0），默认启用
+"""
+#print(">>> import single_flight...")
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from . import hedging, metrics
+from .logger import get_logger
+from .prompt_templates import Prompt, prompt_text
+
+logger = get_logger("single_flight")
+
+T = TypeVar("T")
+
+# follower 等待期间检查对冲取消标记的间隔（秒）
+WAIT_INTERVAL = 0.1
+
+
+def is_enabled() -> bool:
+    return os.environ.get("PAPER_EXTRACT_SINGLE_FLIGHT", "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+def prompt_key(kind: str, prompt: Prompt, model_name: str, base_url: str, temperature: float, schema_fields: Optional[List[str]] = None, api_key: str = "") -> str:
+    """
+    请求的合并键（SHA-256）
+
+    Args:
+        kind: 调用方式（普通 / 流式，返回值类型不同，不互相合并）
+        prompt: 提示词
+        model_name: 模型名称（端点池模式下为端点池的模型名称）
+        base_url: API 端点 URL
+        temperature: 温度参数
+        schema_fields: 期望返回的 JSON 字段
+        api_key: API 密钥（只取哈希；不同账号的请求不合并，避免用一个账号的额度 / 权限替另一个账号返回结果）
+    """
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    payload = json.dumps([kind, model_name, base_url or "", key_hash, temperature, prompt_text(prompt), list(schema_fields or [])], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """一次进行中的请求"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    按键合并进行中的调用（线程安全，LLM 调用在工作线程中执行）
+
+    Args:
+        name: 用于指标与日志的名称
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, call: Callable[[], T], retry_on: Tuple[Type[BaseException], ...] = ()) -> Tuple[T, bool]:
+        """
+        执行调用；相同键的调用正在进行时等待它的结果
+
+        Args:
+            key: 合并键
+            call: 实际调用
+            retry_on: leader 抛出这些异常时 follower 不共享异常，而是自己重新发起（如 leader 在对冲中落败被取消）
+
+        Returns:
+            (结果, 是否共享了其他请求的结果)
+        """
+        while True:
+            with self._lock:
+                current = self._calls.get(key)
+                leader = current is None
+                if leader:
+                    current = self._calls[key] = _Call()
+                else:
+                    current.followers += 1
+
+            if leader:
+                metrics.record_cache(self.name, False)
+                try:
+                    current.result = call()
+                    return current.result, False
+                except BaseException as e:
+                    current.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    current.done.set()
+
+            metrics.record_cache(self.name, True)
+            # 等待相同的请求也算作本次请求已开始（对冲计时从此开始）
+            hedging.mark_started()
+            while not current.done.wait(WAIT_INTERVAL):
+                if hedging.cancelled():
+                    # 当前请求在对冲中落败，不再等待
+                    raise hedging.HedgeCancelled()
+            if current.error is None:
+                return current.result, True
+            if not isinstance(current.error, retry_on):
+                raise current.error
+            logger.debug("合并的请求被取消，重新发起: %s", key[:12])
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+llm_calls = SingleFlight("llm_inflight")
+
+
+def run(kind: str, prompt: Prompt, model_name: str, base_url: str, temperature: float, schema_fields: Optional[List[str]], call: Callable[[], T], api_key: str = "") -> Tuple[T, bool]:
+    """
+    合并相同的进行中 LLM 请求
+
+    未启用或当前是对冲请求（需要独立于原请求发送）时直接调用
+
+    Returns:
+        (结果, 是否共享了其他请求的结果)
+    """
+    if not is_enabled() or hedging.is_hedge():
+        return call(), False
+    key = prompt_key(kind, prompt, model_name, base_url, temperature, schema_fields, api_key)
+    return llm_calls.do(key, call, retry_on=(hedging.HedgeCancelled,))
@@ -0,0 +1,108 @@
+"""
+启动耗时统计与后台预热
+记录启动阶段各模块的导入耗时；端口绑定后在后台线程中预加载重量级依赖，
+避免首次解析请求时才导入 PDF 后端（默认 pypdf）/ tiktoken / langchain_openai / pandas
+"""
+#print(">>> import startup...")
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from .logger import get_logger
+
+logger = get_logger("startup")
+
+
+# 进程启动时间（本模块应尽早被导入）
+PROCESS_START = time.perf_counter()
+
+# 预热前等待的秒数，让 uvicorn 先完成端口绑定
+WARMUP_DELAY = 0.5
+
+# 需要后台预热的重量级模块（按首次解析请求的使用顺序）；PDF 后端模块按配置的默认后端在最前面加入
+WARMUP_MODULES = [
+    "tiktoken",
+    "langchain_openai",
+    "pandas",
+]
+
+_import_timings: List[Dict] = []
+_warmup_timings: List[Dict] = []
+_ready_at = None
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed(name: str):
+    """记录一段启动代码（通常是 import）的耗时"""
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        _import_timings.append({"name": name, "seconds": round(time.perf_counter() - begin, 4)})
+
+
+def mark_ready() -> None:
+    """记录服务就绪（端口已可访问）的时间点"""
+    global _ready_at
+    if _ready_at is None:
+        _ready_at = time.perf_counter()
+
+
+def _warmup_modules() -> List[str]:
+    """预热的模块列表：默认 PDF 后端（PAPER_EXTRACT_PDF_BACKEND，默认 pypdf）的模块 + WARMUP_MODULES"""
+    from . import pdf_backends
+
+    backend = pdf_backends.get_default_backend()
+    module = "langchain_community.document_loaders.pdf" if backend == "langchain" else pdf_backends.BACKENDS[backend][1]
+    return [module] + [name for name in WARMUP_MODULES if name != module]
+
+
+def _warm_up() -> None:
+    time.sleep(WARMUP_DELAY)
+    for name in _warmup_modules():
+        begin = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            status = "ok"
+        except Exception as e:
+            status = f"error: {e}"
+        with _lock:
+            _warmup_timings.append({"name": name, "seconds": round(time.perf_counter() - begin, 4), "status": status})
+
+    # tokenizer 编码文件首次加载较慢（进程内只加载一次），一并预热
+    begin = time.perf_counter()
+    try:
+        from . import llm_service
+        llm_service.count_tokens("warm up")
+        status = "ok"
+    except Exception as e:
+        status = f"error: {e}"
+    with _lock:
+        _warmup_timings.append({"name": "tokenizer", "seconds": round(time.perf_counter() - begin, 4), "status": status})
+    logger.info("后台预热完成: %s", report()["warmup"])
+
+
+def start_warmup() -> None:
+    """启动后台预热线程（守护线程，不阻塞退出）"""
+    threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+
+
+def report() -> Dict:
+    """
+    启动耗时报告
+
+    Returns:
+        imports: 启动阶段各 import 耗时
+        ready_seconds: 进程启动到服务就绪的耗时
+        warmup: 后台预热的各模块耗时
+    """
+    with _lock:
+        warmup = list(_warmup_timings)
+    return {
+        "imports": list(_import_timings),
+        "ready_seconds": round(_ready_at - PROCESS_START, 4) if _ready_at else None,
+        "warmup": warmup,
+    }
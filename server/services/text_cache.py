@@ -0,0 +1,80 @@
+"""
+文本缓存服务
+缓存 PDF 解析后的分页文本，避免重复解析同一文件
+每个文件一个 <缓存键>.json（分页文本的 JSON 数组）；旧版本的 .txt 缓存不再读取，文件会重新解析
+"""
+#print(">>> import text_cache...")
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Optional
+
+from . import metrics
+from .config_service import get_data_dir
+from .logger import get_logger
+
+logger = get_logger("text_cache")
+
+
+def get_cache_dir() -> str:
+    """获取文本缓存目录（位于数据目录下）"""
+    cache_dir = os.path.join(get_data_dir(), "text_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _cache_key(file_path: str) -> Optional[str]:
+    """缓存键：绝对路径 + 文件大小 + 修改时间，文件变化后自动失效"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    raw = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def get_pages(file_path: str) -> Optional[List[str]]:
+    """
+    读取缓存的分页文本
+
+    Returns:
+        分页文本列表，未命中时返回 None
+    """
+    key = _cache_key(file_path)
+    if not key:
+        return None
+    cache_file = os.path.join(get_cache_dir(), f"{key}.json")
+    pages = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("缓存文件损坏，重新解析: %s (%s)", cache_file, e)
+        if not isinstance(pages, list):
+            pages = None
+    metrics.record_cache("text", pages is not None)
+    return pages
+
+
+def put_pages(file_path: str, pages: List[str]) -> None:
+    """写入分页文本缓存（在缓存目录中写唯一的临时文件后原子替换，多进程 / 多线程同时写入互不影响）"""
+    key = _cache_key(file_path)
+    if not key:
+        return
+    cache_dir = get_cache_dir()
+    cache_file = os.path.join(cache_dir, f"{key}.json")
+    tmp_file = None
+    try:
+        fd, tmp_file = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=cache_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning("写入缓存失败: %s", e)
+        if tmp_file and os.path.exists(tmp_file):
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
@@ -0,0 +1,206 @@
+"""
+文本规范化服务
+位于 PDF 解析与分块之间：去除跨页重复的页眉页脚和页码、合并断行连字符、压缩空白，
+可选删除参考文献与附录。发送给模型的 token 越少，分块数、调用次数和耗时都越少
+"""
+#print(">>> import text_normalizer...")
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from .logger import get_logger
+
+logger = get_logger("text_normalizer")
+
+
+# 每页开头 / 结尾参与页眉页脚检测的行数
+EDGE_LINES = 3
+# 页数不少于该值时才检测页眉页脚（页数太少无法区分重复内容和正文）
+MIN_PAGES_FOR_HEADERS = 3
+# 同一行（数字归一化后）出现在至少该比例的页面边缘时视为页眉页脚；奇偶页页眉不同，因此阈值低于一半
+HEADER_PAGE_RATIO = 0.3
+# 参考文献 / 附录标题只在正文该比例之后查找，避免误删目录或引言中的同名行
+SECTION_MIN_POSITION = 0.3
+
+_DIGITS = re.compile(r"\d+")
+_ROMAN = re.compile(r"\b[ivx]{1,5}\b", re.IGNORECASE)
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10}
+_PAGE_NUMBER = re.compile(r"^(?:page\s*)?(?:\d{1,4}|[ivx]{1,5})(?:\s*(?:of|/)\s*\d+)?$|^[-–—]\s*\d+\s*[-–—]$|^第\s*\d+\s*页(?:\s*共\s*\d+\s*页)?$", re.IGNORECASE)
+# 行尾连字符 + 换行 + 小写字母开头：英文单词被断行拆开
+_HYPHEN_BREAK = re.compile(r"(\w)-\n[ \t]*([a-z])")
+_INLINE_SPACES = re.compile(r"[ \t 　]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_REFERENCES_HEADING = re.compile(r"^[ \t]*(?:\d+\.?|[IVX]+\.)?[ \t]*(?:references|bibliography|works cited|literature cited|参考文献)[ \t]*:?[ \t]*$", re.IGNORECASE | re.MULTILINE)
+_APPENDIX_HEADING = re.compile(r"^[ \t]*(?:appendix|appendices|supplementary material|附录)\b[^\n]{0,80}$", re.IGNORECASE | re.MULTILINE)
+
+
+@dataclass
+class NormalizeOptions:
+    """规范化选项（默认只做不丢失正文信息的清理）"""
+    enabled: bool = True
+    dehyphenate: bool = True            # 合并行尾连字符断开的单词
+    strip_headers: bool = True          # 去除跨页重复的页眉页脚和页码
+    collapse_whitespace: bool = True    # 压缩连续空白和空行
+    drop_references: bool = False       # 删除参考文献
+    drop_appendix: bool = False         # 删除附录
+
+
+@dataclass
+class NormalizeResult:
+    """规范化结果"""
+    text: str
+    chars_before: int
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def chars_after(self) -> int:
+        return len(self.text)
+
+
+def _line_signature(line: str) -> str:
+    """页眉页脚比较用的行签名：忽略大小写、空白和数字（页码、年份每页不同）"""
+    return _DIGITS.sub("#", " ".join(line.lower().split()))
+
+
+def _roman_value(text: str) -> int:
+    """小写罗马数字（i-xxxix）转整数"""
+    total = 0
+    for current, following in zip(text, text[1:] + " "):
+        value = _ROMAN_VALUES[current]
+        total += -value if _ROMAN_VALUES.get(following, 0) > value else value
+    return total
+
+
+def _page_number_key(line: str, page_index: int) -> Tuple[str, int]:
+    """
+    页码行的序列键：(行的形状, 页码 - 页序号)
+
+    真正的页码随页序号递增，同一文档中各页的键相同；表格单元格、年份等偶然出现在页面边缘的数字键各不相同
+    """
+    digits = _DIGITS.search(line)
+    if digits:
+        value = int(digits.group())
+    else:
+        value = _roman_value(_ROMAN.search(line).group().lower())
+    shape = _ROMAN.sub("#", _line_signature(line))
+    return shape, value - page_index
+
+
+def _edge_indexes(lines: List[str]) -> List[int]:
+    """页面开头和结尾各 EDGE_LINES 个非空行的下标"""
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    head = non_empty[:EDGE_LINES]
+    tail = non_empty[-EDGE_LINES:]
+    return sorted(set(head + tail))
+
+
+def strip_headers_footers(pages: List[str]) -> Tuple[List[str], int]:
+    """
+    去除跨页重复的页眉页脚与单独成行的页码
+
+    页码与页眉页脚一样只在跨页重复时删除：页码形状相同且随页序号递增（页码 - 页序号一致）的页数达到阈值。
+    页数少于 MIN_PAGES_FOR_HEADERS 时不删除任何行
+
+    Returns:
+        (pages, removed_lines): 处理后的分页文本 和 删除的行数
+    """
+    split_pages = [page.split("\n") for page in pages]
+    repeated: Set[str] = set()
+    page_numbers: Set[Tuple[str, int]] = set()
+    if len(pages) >= MIN_PAGES_FOR_HEADERS:
+        counts: Counter = Counter()
+        number_counts: Counter = Counter()
+        for page_index, lines in enumerate(split_pages):
+            edges = [lines[i].strip() for i in _edge_indexes(lines)]
+            counts.update({_line_signature(line) for line in edges})
+            number_counts.update({_page_number_key(line, page_index) for line in edges if _PAGE_NUMBER.match(line)})
+        threshold = max(2, int(len(pages) * HEADER_PAGE_RATIO + 0.5))
+        repeated = {signature for signature, count in counts.items() if count >= threshold and signature.strip("# ")}
+        page_numbers = {key for key, count in number_counts.items() if count >= threshold}
+
+    removed = 0
+    cleaned = []
+    for page_index, lines in enumerate(split_pages):
+        drop = set()
+        for i in _edge_indexes(lines):
+            stripped = lines[i].strip()
+            if _line_signature(stripped) in repeated:
+                drop.add(i)
+            elif _PAGE_NUMBER.match(stripped) and _page_number_key(stripped, page_index) in page_numbers:
+                drop.add(i)
+        removed += len(drop)
+        cleaned.append("\n".join(line for i, line in enumerate(lines) if i not in drop))
+    return cleaned, removed
+
+
+def _find_heading(pattern: re.Pattern, text: str) -> int:
+    """正文后段中最后一个匹配的章节标题位置，未找到返回 -1"""
+    start = int(len(text) * SECTION_MIN_POSITION)
+    positions = [m.start() for m in pattern.finditer(text, start)]
+    return positions[-1] if positions else -1
+
+
+def drop_sections(text: str, references: bool, appendix: bool) -> Tuple[str, Dict[str, int]]:
+    """
+    删除参考文献 / 附录章节
+
+    参考文献之后的附录在只删除参考文献时保留；附录之后的参考文献在只删除附录时保留
+
+    Returns:
+        (text, removed): 处理后的文本 和 各章节删除的字符数
+    """
+    removed = {"references_chars": 0, "appendix_chars": 0}
+    ref_pos = _find_heading(_REFERENCES_HEADING, text)
+    app_pos = _find_heading(_APPENDIX_HEADING, text)
+
+    spans = []
+    if references and ref_pos >= 0:
+        end = app_pos if app_pos > ref_pos else len(text)
+        spans.append((ref_pos, end, "references_chars"))
+    if appendix and app_pos >= 0:
+        end = ref_pos if ref_pos > app_pos else len(text)
+        spans.append((app_pos, end, "appendix_chars"))
+
+    # 从后向前删除，前面的下标保持有效
+    for begin, end, key in sorted(spans, reverse=True):
+        removed[key] += end - begin
+        text = text[:begin] + text[end:]
+    return text, removed
+
+
+def normalize_pages(pages: List[str], options: NormalizeOptions = None) -> NormalizeResult:
+    """
+    规范化分页文本并拼接为正文
+
+    Args:
+        pages: pdf_parser 输出的分页文本
+        options: 规范化选项，默认 NormalizeOptions()
+
+    Returns:
+        NormalizeResult（text 为拼接后的正文，stats 为各步骤的处理统计）
+    """
+    options = options or NormalizeOptions()
+    raw = "\n".join(pages)
+    if not options.enabled:
+        return NormalizeResult(text=raw, chars_before=len(raw))
+
+    stats: Dict[str, int] = {}
+    if options.strip_headers:
+        pages, stats["header_lines"] = strip_headers_footers(pages)
+    text = "\n".join(pages)
+
+    if options.dehyphenate:
+        text, stats["hyphens_joined"] = _HYPHEN_BREAK.subn(r"\1\2", text)
+
+    if options.drop_references or options.drop_appendix:
+        text, removed = drop_sections(text, options.drop_references, options.drop_appendix)
+        stats.update(removed)
+
+    if options.collapse_whitespace:
+        text = _INLINE_SPACES.sub(" ", text)
+        text = "\n".join(line.strip() for line in text.split("\n"))
+        text = _BLANK_LINES.sub("\n\n", text).strip()
+
+    logger.debug("文本规范化: %d -> %d 字符 %s", len(raw), len(text), stats)
+    return NormalizeResult(text=text, chars_before=len(raw), stats=stats)
@@ -0,0 +1,302 @@
+"""
+Tokenizer 注册表
+按模型选择 tokenizer（模型注册表的 tokenizer 字段），每个 tokenizer 在进程内只加载一次：
+    - tiktoken 编码（cl100k_base / o200k_base）：优先从本地目录读取 <编码名>.tiktoken 文件，
+      其次读取 tiktoken 自身的下载缓存，都没有时才联网下载（可关闭）
+    - hf:<名称>：HuggingFace tokenizer.json（<本地目录>/<名称>/tokenizer.json，需要安装 tokenizers），
+      用于 Qwen / DeepSeek 等非 OpenAI 模型。这些文件不会自动下载、也不随程序打包：
+      未手动放置 tokenizer.json 或未安装 tokenizers 时，模型注册表中的 hf:qwen / hf:deepseek 映射不生效，按 cl100k_base 计数
+    - 以上都不可用时使用近似计数（CJK 字符按 1 token、其余按 4 字符 1 token），结果标记为非精确
+
+本地目录依次查找：PAPER_EXTRACT_TOKENIZER_DIR、数据目录下的 tokenizers、随程序打包的 server/tokenizers
+（打包前运行 python scripts/fetch_tokenizers.py 下载编码文件）
+
+环境变量：
+    PAPER_EXTRACT_TOKENIZER_DIR        本地 tokenizer 目录
+    PAPER_EXTRACT_TOKENIZER_DOWNLOAD   本地没有编码文件时是否允许联网下载（1 / 0），默认允许；离线机器设为 0 避免等待超时
+"""
+#print(">>> import tokenizer...")
+import abc
+import base64
+import bisect
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+from .config_service import get_data_dir
+from .logger import get_logger
+from .model_registry import get_model_info
+
+logger = get_logger("tokenizer")
+
+
+DEFAULT_ENCODING = "cl100k_base"
+# 批量编码的线程数（tiktoken 批量编码释放 GIL）
+BATCH_THREADS = 8
+# 近似计数：非 CJK 文本每 token 的平均字符数
+APPROX_CHARS_PER_TOKEN = 4
+# 近似计数中按 1 token 计的字符：U+2E80（CJK 部首）及以后的码位（表意文字、假名、韩文、全角符号、扩展区汉字等）
+_WIDE_CHAR_START = "\u2e80"
+
+_PUBLIC_URL = "https://openaipublic.blob.core.windows.net/encodings/"
+
+# tiktoken 编码的切分规则与特殊 token（与 tiktoken_ext.openai_public 一致，从本地文件构建编码时使用）
+_ENCODING_SPECS: Dict[str, Dict[str, Any]] = {
+    "cl100k_base": {
+        "pat_str": r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        "special_tokens": {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+    },
+    "o200k_base": {
+        "pat_str": "|".join([
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""\p{N}{1,3}""",
+            r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+            r"""\s*[\r\n]+""",
+            r"""\s+(?!\S)""",
+            r"""\s+""",
+        ]),
+        "special_tokens": {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+    },
+}
+
+
+class Tokenizer(abc.ABC):
+    """tokenizer 接口"""
+
+    name = ""
+    exact = True   # 是否为模型实际使用的 tokenizer（近似计数为 False）
+
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        """统计 token 数"""
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+    @abc.abstractmethod
+    def split(self, text: str, max_tokens: int, overlap: int) -> List[str]:
+        """按 token 数分块，相邻块重叠 overlap 个 token"""
+
+
+class TiktokenTokenizer(Tokenizer):
+    """tiktoken 编码"""
+
+    def __init__(self, name: str, encoding: Any):
+        self.name = name
+        self._encoding = encoding
+
+    def count(self, text: str) -> int:
+        # encode_ordinary 不检查特殊 token，论文中出现 <|endoftext|> 之类的文本时不会报错
+        return len(self._encoding.encode_ordinary(text)) if text else 0
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts, num_threads=BATCH_THREADS)]
+
+    def split(self, text: str, max_tokens: int, overlap: int) -> List[str]:
+        tokens = self._encoding.encode_ordinary(text)
+        step = max(1, max_tokens - overlap)
+        # 块边界可能落在多字节字符（如中文）中间，丢弃不完整的字节而不是输出替换字符
+        return [self._encoding.decode_bytes(tokens[i:i + max_tokens]).decode("utf-8", errors="ignore") for i in range(0, len(tokens), step)]
+
+
+class HFTokenizer(Tokenizer):
+    """HuggingFace tokenizers（tokenizer.json）"""
+
+    def __init__(self, name: str, tokenizer: Any):
+        self.name = name
+        self._tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids) if text else 0
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(encoding.ids) for encoding in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+    def split(self, text: str, max_tokens: int, overlap: int) -> List[str]:
+        # 按 token 的字符偏移切原文，避免解码带来的空白差异
+        offsets = self._tokenizer.encode(text, add_special_tokens=False).offsets
+        step = max(1, max_tokens - overlap)
+        chunks = []
+        for i in range(0, len(offsets), step):
+            window = offsets[i:i + max_tokens]
+            chunks.append(text[window[0][0]:window[-1][1]])
+        return chunks
+
+
+def _is_wide(ch: str) -> bool:
+    """近似计数中是否按 1 token 计（count 与 split 共用）"""
+    return ch >= _WIDE_CHAR_START
+
+
+class ApproximateTokenizer(Tokenizer):
+    """近似计数：CJK 字符按 1 token，其余按 APPROX_CHARS_PER_TOKEN 个字符 1 token"""
+
+    exact = False
+
+    def __init__(self, name: str = "approximate"):
+        self.name = name
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        wide = sum(1 for ch in text if _is_wide(ch))
+        return wide + -(-(len(text) - wide) // APPROX_CHARS_PER_TOKEN)
+
+    def split(self, text: str, max_tokens: int, overlap: int) -> List[str]:
+        # 按字符累计近似 token 数，再按累计值二分出每块的起止位置
+        narrow = 1.0 / APPROX_CHARS_PER_TOKEN
+        cumulative = list(accumulate(1.0 if _is_wide(ch) else narrow for ch in text))
+        total = cumulative[-1] if cumulative else 0.0
+        step = max(1, max_tokens - overlap)
+        chunks = []
+        begin_tokens = 0
+        while begin_tokens < total:
+            begin = bisect.bisect_right(cumulative, begin_tokens)
+            end = bisect.bisect_right(cumulative, begin_tokens + max_tokens)
+            chunks.append(text[begin:end])
+            begin_tokens += step
+        return chunks
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+# 可重入：hf: tokenizer 不可用时在加载过程中退回默认编码
+_lock = threading.RLock()
+
+
+def download_enabled() -> bool:
+    return os.environ.get("PAPER_EXTRACT_TOKENIZER_DOWNLOAD", "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+def get_bundled_dir() -> str:
+    """随程序打包的 tokenizer 目录（server/tokenizers，打包后位于资源目录下）"""
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tokenizers")
+
+
+def get_search_dirs() -> List[str]:
+    """本地 tokenizer 目录（按优先级）"""
+    dirs = [os.environ.get("PAPER_EXTRACT_TOKENIZER_DIR", ""), os.path.join(get_data_dir(), "tokenizers"), get_bundled_dir()]
+    return [path for path in dirs if path and os.path.isdir(path)]
+
+
+def _tiktoken_cache_path(name: str) -> str:
+    """tiktoken 下载缓存中的编码文件路径（缓存文件名为下载地址的 SHA-1）"""
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR") or os.environ.get("DATA_GYM_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    return os.path.join(cache_dir, hashlib.sha1(f"{_PUBLIC_URL}{name}.tiktoken".encode()).hexdigest())
+
+
+def _read_bpe(path: str) -> Dict[bytes, int]:
+    """读取 .tiktoken 编码文件（每行：base64 token 与序号）"""
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    return {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in lines if line)}
+
+
+def _load_tiktoken(name: str) -> Optional[Tokenizer]:
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("未安装 tiktoken")
+        return None
+
+    spec = _ENCODING_SPECS.get(name)
+    if spec is not None:
+        candidates = [os.path.join(path, f"{name}.tiktoken") for path in get_search_dirs()] + [_tiktoken_cache_path(name)]
+        for path in candidates:
+            if not os.path.exists(path):
+                continue
+            try:
+                encoding = tiktoken.Encoding(name, pat_str=spec["pat_str"], mergeable_ranks=_read_bpe(path), special_tokens=spec["special_tokens"])
+                logger.debug("从本地文件加载编码 %s: %s", name, path)
+                return TiktokenTokenizer(name, encoding)
+            except Exception as e:
+                logger.warning("本地编码文件 %s 无法读取: %s", path, e)
+
+    if not download_enabled():
+        return None
+    try:
+        return TiktokenTokenizer(name, tiktoken.get_encoding(name))
+    except Exception as e:
+        logger.warning("下载 tiktoken 编码 %s 失败: %s", name, e)
+        return None
+
+
+def _load_hf(name: str) -> Optional[Tokenizer]:
+    for path in get_search_dirs():
+        tokenizer_file = os.path.join(path, name, "tokenizer.json")
+        if not os.path.exists(tokenizer_file):
+            continue
+        try:
+            from tokenizers import Tokenizer as HFTokenizerModel
+        except ImportError:
+            logger.warning("找到 %s，但未安装 tokenizers，无法使用", tokenizer_file)
+            return None
+        try:
+            return HFTokenizer(f"hf:{name}", HFTokenizerModel.from_file(tokenizer_file))
+        except Exception as e:
+            logger.warning("tokenizer 文件 %s 无法读取: %s", tokenizer_file, e)
+    return None
+
+
+def _load(name: str) -> Tokenizer:
+    begin = time.perf_counter()
+    if name.startswith("hf:"):
+        tokenizer = _load_hf(name[3:])
+        if tokenizer is None:
+            # 没有模型自己的 tokenizer 时退回默认编码
+            logger.warning("未找到 tokenizer %s（需要 tokenizers 目录下的 %s/tokenizer.json 并安装 tokenizers），使用 %s 计数", name, name[3:], DEFAULT_ENCODING)
+            return get_tokenizer_by_name(DEFAULT_ENCODING)
+    else:
+        tokenizer = _load_tiktoken(name)
+    if tokenizer is None:
+        logger.warning("tokenizer %s 不可用，使用近似计数（分块与费用预估可能有偏差）", name)
+        return ApproximateTokenizer()
+    logger.info("加载 tokenizer %s，耗时 %.2fs", tokenizer.name, time.perf_counter() - begin)
+    return tokenizer
+
+
+def get_tokenizer_by_name(name: str) -> Tokenizer:
+    """按名称获取 tokenizer（进程内只加载一次；加载失败的结果同样缓存，不会反复尝试下载）"""
+    with _lock:
+        tokenizer = _tokenizers.get(name)
+        if tokenizer is None:
+            tokenizer = _tokenizers[name] = _load(name)
+        return tokenizer
+
+
+def get_tokenizer(model_name: str = "") -> Tokenizer:
+    """获取模型对应的 tokenizer（模型注册表的 tokenizer 字段，未指定模型时使用默认编码）"""
+    name = get_model_info(model_name).get("tokenizer") if model_name else None
+    return get_tokenizer_by_name(name or DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model_name: str = "") -> int:
+    """统计文本 token 数"""
+    if not text:
+        return 0
+    return get_tokenizer(model_name).count(text)
+
+
+def count_tokens_batch(texts: List[str], model_name: str = "") -> List[int]:
+    """批量统计 token 数（tiktoken 多线程批量编码）"""
+    if not texts:
+        return []
+    return get_tokenizer(model_name).count_batch(texts)
+
+
+def split_text(text: str, max_tokens: int, overlap: int = 0, model_name: str = "") -> List[str]:
+    """按 token 数分块，相邻块重叠 overlap 个 token"""
+    if not text:
+        return []
+    return get_tokenizer(model_name).split(text, max_tokens, overlap)
+
@@ -0,0 +1,136 @@
+"""
+用量统计服务
+记录每次 LLM 调用由服务商返回的输入 / 输出 / 缓存命中 token 数与耗时，按模型价格计算费用，
+并按 分块 -> 文件 -> 任务 逐级汇总。服务商没有返回用量时退回本地 tokenizer 估算（计入 estimated_calls）
+
+汇总范围通过 contextvars 传递：在 scope() 中发起的调用（包括 asyncio.to_thread 的工作线程）
+会计入当前所有嵌套范围；内层范围结束时把自己的汇总追加到外层范围的 children
+"""
+#print(">>> import usage...")
+import contextvars
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Tuple
+
+from .logger import get_logger
+from .model_registry import get_call_cost
+
+logger = get_logger("usage")
+
+
+@dataclass
+class Usage:
+    """用量汇总"""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    seconds: float = 0.0
+    cost: float = 0.0
+    # 服务商没有返回用量、按本地 tokenizer 估算的调用数
+    estimated_calls: int = 0
+    # 对冲请求（hedging）的调用数与费用，已包含在 calls / cost 中
+    hedged_calls: int = 0
+    hedge_cost: float = 0.0
+
+    def add(self, other: "Usage") -> None:
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.seconds += other.seconds
+        self.cost += other.cost
+        self.estimated_calls += other.estimated_calls
+        self.hedged_calls += other.hedged_calls
+        self.hedge_cost += other.hedge_cost
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["seconds"] = round(self.seconds, 3)
+        data["cost"] = round(self.cost, 6)
+        data["hedge_cost"] = round(self.hedge_cost, 6)
+        return data
+
+
+class UsageScope:
+    """一个汇总范围（线程安全，Map 阶段在工作线程中记录）"""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.usage = Usage()
+        self.children: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, item: Usage) -> None:
+        with self._lock:
+            self.usage.add(item)
+
+    def add_child(self, summary: Dict) -> None:
+        with self._lock:
+            self.children.append(summary)
+
+    def summary(self, with_children: bool = True) -> Dict:
+        with self._lock:
+            data = {"label": self.label, **self.usage.to_dict()}
+            if with_children and self.children:
+                data["children"] = list(self.children)
+            return data
+
+
+# 当前的嵌套范围（外层在前）
+_scopes: contextvars.ContextVar[Tuple[UsageScope, ...]] = contextvars.ContextVar("usage_scopes", default=())
+
+
+@contextmanager
+def scope(label: str = "") -> Iterator[UsageScope]:
+    """
+    开始一个汇总范围；范围内的 LLM 调用同时计入所有外层范围
+
+    用法：
+        with usage.scope("paper.pdf") as file_usage:
+            ...
+        file_usage.summary()
+    """
+    current = UsageScope(label)
+    parents = _scopes.get()
+    token = _scopes.set(parents + (current,))
+    try:
+        yield current
+    finally:
+        _scopes.reset(token)
+        if parents:
+            parents[-1].add_child(current.summary())
+
+
+def record(model_name: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, seconds: float = 0.0, estimated: bool = False, hedge: bool = False) -> Usage:
+    """
+    记录一次 LLM 调用
+
+    Args:
+        model_name: 实际调用的模型（端点池中各端点可能不同，按各自价格计费）
+        prompt_tokens: 输入 token 数（含缓存命中部分）
+        completion_tokens: 输出 token 数
+        cached_tokens: 命中服务商前缀缓存的输入 token 数
+        seconds: 调用耗时
+        estimated: 用量是否为本地估算（服务商未返回）
+        hedge: 是否为对冲请求
+
+    Returns:
+        本次调用的用量
+    """
+    cost = get_call_cost(model_name, prompt_tokens, completion_tokens, cached_tokens)
+    item = Usage(
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=cached_tokens,
+        seconds=seconds,
+        cost=cost,
+        estimated_calls=int(estimated),
+        hedged_calls=int(hedge),
+        hedge_cost=cost if hedge else 0.0,
+    )
+    for current in _scopes.get():
+        current.add(item)
+    return item
@@ -0,0 +1,271 @@
+"""
+监视文件夹服务
+定期轮询配置的文件夹，文件写入稳定（防抖）后只对新增或内容变化的 PDF 运行解析流水线，
+按内容哈希记录已处理文件，结果追加写入 JSONL 导出文件。把每日全量重跑变为增量处理
+
+状态与结果均保存在数据目录 watch/ 下：
+    state.json      路径 -> {hash, size, mtime, processed_at}
+    results.jsonl   每行一个提取结果（可通过 export_path 指定其他位置）
+"""
+#print(">>> import watcher...")
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from . import dedup, discovery, metrics, pipeline
+from .config_service import get_data_dir
+from .log_service import push_log
+from .logger import get_logger
+
+logger = get_logger("watcher")
+
+
+# 默认轮询间隔（秒）
+DEFAULT_INTERVAL = 10.0
+# 默认防抖时间：文件大小和修改时间在该时长内不变才视为写入完成
+DEFAULT_DEBOUNCE = 5.0
+# 单批最多处理的文件数（避免一次放入大量文件时长时间不更新状态）
+MAX_BATCH = 50
+
+
+@dataclass
+class WatchConfig:
+    """监视配置"""
+    folders: List[str]
+    fields: List[str]
+    interval: float = DEFAULT_INTERVAL
+    debounce: float = DEFAULT_DEBOUNCE
+    recursive: bool = True
+    export_path: str = ""
+    pool_profiles: List[str] = field(default_factory=list)
+    stream: bool = False
+
+
+def get_watch_dir() -> str:
+    """获取监视状态目录（位于数据目录下）"""
+    watch_dir = os.path.join(get_data_dir(), "watch")
+    os.makedirs(watch_dir, exist_ok=True)
+    return watch_dir
+
+
+class WatchState:
+    """已处理文件记录（路径 -> 哈希），写临时文件后原子替换"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning("读取监视状态失败，将重新处理所有文件: %s", e)
+        self.hashes = {item["hash"] for item in self.files.values() if item.get("hash")}
+
+    def is_unchanged(self, path: str, size: int, mtime: float) -> bool:
+        item = self.files.get(path)
+        return bool(item) and item.get("size") == size and item.get("mtime") == mtime
+
+    def record(self, path: str, digest: Optional[str], size: int, mtime: float) -> None:
+        self.files[path] = {"hash": digest, "size": size, "mtime": mtime, "processed_at": datetime.now().isoformat()}
+        if digest:
+            self.hashes.add(digest)
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class FolderWatcher:
+    """轮询式文件夹监视器（在 FastAPI 事件循环中作为后台任务运行）"""
+
+    def __init__(self, config: WatchConfig):
+        self.config = config
+        watch_dir = get_watch_dir()
+        self.state = WatchState(os.path.join(watch_dir, "state.json"))
+        self.export_path = config.export_path or os.path.join(watch_dir, "results.jsonl")
+        # 路径 -> (size, mtime, 首次观察到该状态的时间)，用于防抖
+        self._pending: Dict[str, Tuple[int, float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.started_at: Optional[str] = None
+        self.last_scan: Optional[str] = None
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = ""
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self.started_at = datetime.now().isoformat()
+        self._task = asyncio.create_task(self._run(), name="folder-watcher")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "config": asdict(self.config),
+            "export_path": self.export_path,
+            "started_at": self.started_at,
+            "last_scan": self.last_scan,
+            "pending": len(self._pending),
+            "tracked_files": len(self.state.files),
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self) -> None:
+        await push_log("analyze", f"开始监视文件夹: {', '.join(self.config.folders)}（每 {self.config.interval:.0f}s 检查一次）")
+        while True:
+            try:
+                ready = await asyncio.to_thread(self._scan)
+                self.last_scan = datetime.now().isoformat()
+                if ready:
+                    await self._process(ready)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error("监视任务出错: %s", e)
+            await asyncio.sleep(self.config.interval)
+
+    def _scan(self) -> List[Tuple[str, int, float]]:
+        """
+        扫描文件夹，返回写入已稳定且与记录不同的文件
+
+        Returns:
+            [(路径, 大小, 修改时间), ...]
+        """
+        now = time.time()
+        flt = discovery.DiscoveryFilter(recursive=self.config.recursive)
+        seen = set()
+        ready = []
+        for path in discovery.iter_files(self.config.folders, flt):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            size, mtime = stat.st_size, stat.st_mtime
+            if self.state.is_unchanged(path, size, mtime):
+                self._pending.pop(path, None)
+                continue
+
+            # 防抖：大小或修改时间变化则重新计时
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != (size, mtime):
+                self._pending[path] = (size, mtime, now)
+                continue
+            if now - previous[2] >= self.config.debounce and now - mtime >= self.config.debounce:
+                ready.append((path, size, mtime))
+
+        # 已删除的文件不再等待
+        for path in list(self._pending):
+            if path not in seen:
+                del self._pending[path]
+        return ready[:MAX_BATCH]
+
+    async def _process(self, ready: List[Tuple[str, int, float]]) -> None:
+        """对稳定的文件计算哈希，只提取内容未处理过的文件"""
+        hashes = await asyncio.to_thread(dedup.hash_files, [path for path, _, _ in ready])
+        to_extract = []
+        for path, size, mtime in ready:
+            digest = hashes.get(path)
+            self._pending.pop(path, None)
+            if digest and digest in self.state.hashes:
+                # 内容已处理过（重命名、复制或只改了修改时间）
+                self.state.record(path, digest, size, mtime)
+                self.skipped += 1
+            else:
+                to_extract.append((path, size, mtime))
+
+        if to_extract:
+            await push_log("analyze", f"[监视] 发现 {len(to_extract)} 个新增或变化的文件，开始提取")
+            job = metrics.start_job(len(to_extract))
+            result = {"error": "解析中断"}
+            try:
+                result = await pipeline.run_pipeline(
+                    [path for path, _, _ in to_extract], self.config.fields,
+                    pool_profiles=self.config.pool_profiles or None, stream=self.config.stream,
+                    run_source="watch",
+                )
+            finally:
+                metrics.finish_job(job, "error" if result.get("error") else "success")
+                logger.info("[监视] %s", job.summary_text())
+            if result.get("error"):
+                # 配置错误等：不记录状态，下次扫描重试
+                self.errors += 1
+                self.last_error = result["error"]
+                await push_log("analyze", f"[监视] 提取失败: {result['error']}")
+                return
+
+            extracted = {item["file"]: item for item in result.get("results", [])}
+            self._append_results(to_extract, extracted, hashes)
+            for path, size, mtime in to_extract:
+                # 解析失败的文件同样记录，内容变化后才会重试
+                self.state.record(path, hashes.get(path), size, mtime)
+            self.processed += len(extracted)
+            await push_log("analyze", f"[监视] 完成 {len(extracted)} 个文件，结果已追加到: {self.export_path}")
+
+        await asyncio.to_thread(self.state.save)
+
+    def _append_results(self, files: List[Tuple[str, int, float]], extracted: Dict[str, Dict], hashes: Dict[str, Optional[str]]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.export_path)), exist_ok=True)
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            for path, _, _ in files:
+                item = extracted.get(path)
+                if not item:
+                    continue
+                record = {
+                    "file": path,
+                    "hash": hashes.get(path),
+                    "extracted": item["extracted"],
+                    "processed_at": datetime.now().isoformat(),
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+_watcher: Optional[FolderWatcher] = None
+
+
+async def start_watch(config: WatchConfig) -> Dict:
+    """开始监视（已在运行时先停止旧的监视任务）"""
+    global _watcher
+    await stop_watch()
+    _watcher = FolderWatcher(config)
+    _watcher.start()
+    return _watcher.status()
+
+
+async def stop_watch() -> bool:
+    """停止监视，返回之前是否在运行"""
+    if _watcher is None or not _watcher.running:
+        return False
+    await _watcher.stop()
+    await push_log("analyze", "已停止监视文件夹")
+    return True
+
+
+def watch_status() -> Dict:
+    """当前监视状态"""
+    if _watcher is None:
+        return {"running": False}
+    return _watcher.status()
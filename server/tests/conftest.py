@@ -0,0 +1,9 @@
+"""
+pytest 配置：把 server 目录加入 sys.path，测试按 `from services import ...` 导入（与 main.py 一致）
+"""
+import os
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
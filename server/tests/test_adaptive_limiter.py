@@ -0,0 +1,133 @@
+"""
+自适应并发控制（AIMD）：上限被用满时加性增长、未用满时不增长、限流 / 错误 / 延迟突增时乘性减小
+"""
+import pytest
+
+from services import adaptive_limiter
+from services.adaptive_limiter import OUTCOME_ERROR, OUTCOME_IGNORED, OUTCOME_OK, OUTCOME_THROTTLED, AdaptiveLimiter
+
+
+def _run(limiter: AdaptiveLimiter, concurrent: int, outcome: str = OUTCOME_OK, seconds: float = 1.0) -> None:
+    """模拟 concurrent 个同时进行的调用依次结束"""
+    for _ in range(concurrent):
+        limiter.acquire()
+    for _ in range(concurrent):
+        limiter.release(seconds, outcome)
+
+
+def _fill(limiter: AdaptiveLimiter) -> None:
+    while limiter.in_flight < int(limiter.limit):
+        limiter.acquire()
+
+
+def test_saturated_calls_increase_limit_about_one_per_round_trip():
+    limiter = AdaptiveLimiter("test", initial=4, max_limit=32)
+    _fill(limiter)
+    # 每个调用结束后立即补满：上限始终被用满，每个成功调用 +1/limit，一个往返（4 个调用）约 +1
+    for _ in range(4):
+        limiter.release(1.0, OUTCOME_OK)
+        _fill(limiter)
+    assert 4.9 < limiter.limit < 5.0
+    assert limiter.in_flight == 4
+    limiter.release(1.0, OUTCOME_OK)
+    assert int(limiter.limit) == 5
+
+
+def test_only_the_saturating_call_increases():
+    limiter = AdaptiveLimiter("test", initial=4, max_limit=32)
+    _run(limiter, 4)
+    # 第一个调用结束时上限被用满（+1/4），其余调用结束时已不再用满
+    assert limiter.limit == pytest.approx(4.25)
+
+
+def test_unsaturated_calls_do_not_increase_limit():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32)
+    for _ in range(100):
+        _run(limiter, 2)
+    assert limiter.limit == 8.0
+    assert limiter.in_flight == 0
+
+
+def test_increase_is_capped_at_max_limit():
+    limiter = AdaptiveLimiter("test", initial=3, max_limit=4)
+    for _ in range(100):
+        _run(limiter, int(limiter.limit))
+    assert limiter.limit == 4.0
+
+
+@pytest.mark.parametrize("outcome", [OUTCOME_THROTTLED, OUTCOME_ERROR])
+def test_throttle_and_error_halve_limit(outcome):
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32)
+    _run(limiter, 1, outcome)
+    assert limiter.limit == 4.0
+    assert limiter.decreases == 1
+
+
+def test_failures_in_one_round_trip_decrease_once():
+    limiter = AdaptiveLimiter("test", initial=16, max_limit=32)
+    _run(limiter, 8, OUTCOME_THROTTLED)
+    assert limiter.limit == 8.0
+    assert limiter.decreases == 1
+
+
+def test_decrease_never_goes_below_min_limit():
+    limiter = AdaptiveLimiter("test", initial=1, max_limit=32)
+    limiter.on_response(429)
+    assert limiter.limit == adaptive_limiter.MIN_LIMIT
+
+
+def test_ignored_outcome_does_not_adjust_limit():
+    limiter = AdaptiveLimiter("test", initial=4, max_limit=32)
+    _run(limiter, 4, OUTCOME_IGNORED)
+    assert limiter.limit == 4.0
+    assert limiter.decreases == 0
+
+
+def test_latency_spike_decreases_limit_after_baseline():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32)
+    for _ in range(adaptive_limiter.MIN_SAMPLES):
+        _run(limiter, 1, seconds=1.0)
+    _run(limiter, 1, seconds=1.0 * adaptive_limiter.LATENCY_SPIKE_RATIO + 1)
+    assert limiter.limit == 4.0
+
+
+def test_spike_detection_disabled_for_long_calls():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32)
+    for _ in range(adaptive_limiter.MIN_SAMPLES):
+        _run(limiter, 1, seconds=1.0)
+    limiter.acquire()
+    limiter.release(10.0, OUTCOME_OK, spike_detection=False)
+    assert limiter.limit == 8.0
+    assert limiter.baseline == pytest.approx(1.0)
+
+
+def test_seed_raises_initial_limit_until_first_decrease():
+    limiter = AdaptiveLimiter("test", initial=4, max_limit=16)
+    limiter.seed(32)
+    assert limiter.limit == 16.0
+    limiter.on_response(503)
+    limiter.seed(16)
+    assert limiter.limit == 8.0
+
+
+def test_slot_classifies_exceptions():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32)
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    with pytest.raises(RateLimited):
+        with limiter.slot():
+            raise RateLimited()
+    assert limiter.limit == 4.0
+    assert limiter.in_flight == 0
+
+
+def test_task_limit_only_caps_fan_out_when_enabled(monkeypatch):
+    monkeypatch.setenv("PAPER_EXTRACT_ADAPTIVE_MAX", "20")
+    monkeypatch.setenv("PAPER_EXTRACT_ADAPTIVE_CONCURRENCY", "1")
+    assert adaptive_limiter.task_limit(4) == 20
+    assert adaptive_limiter.task_limit(4, endpoints=3) == 60
+    monkeypatch.setenv("PAPER_EXTRACT_ADAPTIVE_CONCURRENCY", "0")
+    assert adaptive_limiter.task_limit(4, endpoints=3) == 4
+    assert adaptive_limiter.task_limit(0) == adaptive_limiter.MIN_LIMIT
@@ -0,0 +1,61 @@
+"""
+批量去重：内容哈希、按到达顺序的增量去重、近似重复的文本指纹
+"""
+import hashlib
+
+from services import dedup
+
+
+def test_hash_file_streams_blocks(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 100
+    path = tmp_path / "a.pdf"
+    path.write_bytes(data)
+    monkeypatch.setattr(dedup, "HASH_BLOCK_SIZE", 1000)
+    assert dedup.hash_file(str(path)) == hashlib.sha256(data).hexdigest()
+
+
+def test_hash_file_unreadable_returns_none(tmp_path):
+    assert dedup.hash_file(str(tmp_path / "missing.pdf")) is None
+
+
+def test_hash_files_matches_identical_contents(tmp_path):
+    paths = []
+    for name, content in [("a.pdf", b"same"), ("b.pdf", b"same"), ("c.pdf", b"other")]:
+        path = tmp_path / name
+        path.write_bytes(content)
+        paths.append(str(path))
+    hashes = dedup.hash_files(paths, workers=2)
+    assert list(hashes) == paths
+    assert hashes[paths[0]] == hashes[paths[1]] != hashes[paths[2]]
+    assert dedup.hash_files([]) == {}
+
+
+def test_tracker_returns_first_path_for_duplicates():
+    tracker = dedup.DuplicateTracker()
+    assert tracker.check("a.pdf", "h1") is None
+    assert tracker.check("b.pdf", "h2") is None
+    assert tracker.check("c.pdf", "h1") == "a.pdf"
+    assert tracker.check("d.pdf", "h1") == "a.pdf"
+
+
+def test_tracker_never_matches_unreadable_files():
+    tracker = dedup.DuplicateTracker()
+    assert tracker.check("a.pdf", None) is None
+    assert tracker.check("b.pdf", None) is None
+
+
+def test_text_fingerprint_ignores_case_punctuation_and_whitespace():
+    original = "Deep Learning for PDFs.\n\nAbstract: we   propose..."
+    regenerated = "deep learning for pdfs\nabstract - We propose"
+    assert dedup.text_fingerprint(original) == dedup.text_fingerprint(regenerated)
+    assert dedup.text_fingerprint(original) != dedup.text_fingerprint("Deep Learning for PDF files")
+
+
+def test_text_fingerprint_keeps_cjk_text():
+    assert dedup.text_fingerprint("论文标题：深度学习") == dedup.text_fingerprint("论文标题 深度学习")
+    assert dedup.text_fingerprint("论文标题：深度学习") != dedup.text_fingerprint("论文标题：机器学习")
+
+
+def test_dedup_report():
+    assert dedup.dedup_report(10, 8) == {"files": 10, "unique": 8, "duplicates": 2, "ratio": 0.2}
+    assert dedup.dedup_report(0, 0)["ratio"] == 0.0
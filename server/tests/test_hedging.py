@@ -0,0 +1,147 @@
+"""
+对冲请求：对冲时机（从原请求实际开始计时）、落败请求的取消与用量记录、结果选择
+"""
+import itertools
+import threading
+import time
+
+import pytest
+
+from services import hedging
+from services.hedging import HedgePolicy
+
+_models = itertools.count()
+
+
+def _policy(delay: float = 0.05) -> HedgePolicy:
+    return HedgePolicy(enabled=True, min_delay=delay, initial_delay=delay)
+
+
+def _model() -> str:
+    # 延迟样本按模型名称全局记录，每个测试使用独立的名称
+    return f"test-model-{next(_models)}"
+
+
+class _Call:
+    """模拟一次 LLM 请求：登记开始，等待 release 后返回结果，记录取消时的估算用量与结束时是否需要记录用量"""
+
+    def __init__(self, result, wait: float = 0.0, queue_wait: float = 0.0):
+        self.result = result
+        self.wait = wait
+        self.queue_wait = queue_wait
+        self.release = threading.Event()
+        self.done = threading.Event()
+        self.calls = 0
+        self.cancel_usage = []
+        self.record_usage = None
+        self.saw_cancel = False
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.queue_wait)
+        try:
+            hedging.start_request(self.cancel_usage.append)
+            self.release.wait(self.wait)
+            self.saw_cancel = hedging.cancelled()
+            self.record_usage = hedging.finish_request()
+            if isinstance(self.result, Exception):
+                raise self.result
+            return self.result
+        finally:
+            self.done.set()
+
+
+def test_fast_primary_does_not_launch_hedge():
+    primary, hedge = _Call("primary"), _Call("hedge")
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(1.0), bool) == "primary"
+    assert hedge.calls == 0
+    assert primary.record_usage is True
+    assert primary.cancel_usage == []
+
+
+def test_hedge_wins_and_cancels_primary_with_estimated_usage():
+    primary, hedge = _Call("primary", wait=5.0), _Call("hedge")
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(), bool) == "hedge"
+    # 落败的原请求在取消时按估算记录一次用量（回调参数为是否对冲请求）
+    assert primary.cancel_usage == [False]
+    assert hedge.record_usage is True
+
+    primary.release.set()
+    assert primary.done.wait(2)
+    # 原请求之后返回时不再重复记录用量，并能看到取消标记（流式读取据此停止）
+    assert primary.saw_cancel is True
+    assert primary.record_usage is False
+
+
+def test_primary_wins_and_cancels_hedge():
+    primary, hedge = _Call("primary", wait=0.3), _Call("hedge", wait=5.0)
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(), bool) == "primary"
+    assert hedge.calls == 1
+    assert hedge.cancel_usage == [True]
+    hedge.release.set()
+    assert hedge.done.wait(2)
+    assert hedge.record_usage is False
+
+
+def test_queue_wait_before_start_does_not_trigger_hedge():
+    # 原请求在登记开始前等待（线程池排队 / 并发名额）的时间不计入对冲等待
+    primary, hedge = _Call("primary", queue_wait=0.3), _Call("hedge")
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(0.2), bool) == "primary"
+    assert hedge.calls == 0
+
+
+def test_latency_sample_excludes_queue_wait():
+    model = _model()
+    primary, hedge = _Call("primary", queue_wait=0.3), _Call("hedge")
+    hedging.run_hedged(primary, hedge, model, _policy(1.0), bool)
+    assert hedging.tracker._samples[model][-1] < 0.2
+
+
+def test_invalid_result_waits_for_other_request():
+    primary, hedge = _Call("primary", wait=0.3), _Call("")
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(), bool) == "primary"
+
+
+def test_invalid_results_from_both_returns_fallback():
+    primary, hedge = _Call("", wait=0.2), _Call("")
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(), bool) == ""
+
+
+def test_failed_request_loses_to_successful_one():
+    primary, hedge = _Call(RuntimeError("primary failed"), wait=0.2), _Call("hedge", wait=0.4)
+    assert hedging.run_hedged(primary, hedge, _model(), _policy(), bool) == "hedge"
+
+
+def test_both_failing_raises_first_error():
+    primary, hedge = _Call(RuntimeError("primary failed"), wait=0.2), _Call(ValueError("hedge failed"), wait=0.4)
+    with pytest.raises(RuntimeError, match="primary failed"):
+        hedging.run_hedged(primary, hedge, _model(), _policy(), bool)
+
+
+def test_cancelled_call_cannot_start_new_request():
+    call = hedging._HedgedCall(hedge=True)
+    call.cancel_now()
+    token = hedging._current_call.set(call)
+    try:
+        with pytest.raises(hedging.HedgeCancelled):
+            hedging.start_request(lambda hedge: None)
+    finally:
+        hedging._current_call.reset(token)
+
+
+def test_outside_hedging_requests_always_record_usage():
+    hedging.start_request(lambda hedge: None)
+    assert hedging.finish_request() is True
+    assert hedging.cancelled() is False
+    assert hedging.is_hedge() is False
+
+
+def test_delay_uses_percentile_after_enough_samples():
+    tracker = hedging.LatencyTracker()
+    policy = HedgePolicy(enabled=True, percentile=90, min_delay=0.5, initial_delay=20.0)
+    assert tracker.delay("m", policy) == 20.0
+    for seconds in range(1, 11):
+        tracker.record("m", float(seconds))
+    assert tracker.delay("m", policy) == 10.0
+    policy.min_delay = 15.0
+    assert tracker.delay("m", policy) == 15.0
@@ -0,0 +1,78 @@
+"""
+检索模式：分词、BM25 排序、字段分组与段落选取（plan_groups）
+"""
+from services import retrieval
+from services.retrieval import BM25Index, RetrievalOptions
+
+PASSAGES = [
+    "Deep Retrieval for Papers. Alice Smith, Bob Lee. University of Testing. Abstract: we study extraction.",
+    "Introduction. Long documents are expensive to process with language models.",
+    "Method. We propose a sparse retrieval framework and model architecture.",
+    "Datasets. We evaluate on the ArXiv corpus and a PubMed benchmark dataset.",
+    "Results. Our approach outperforms every baseline with higher accuracy in Table 2.",
+    "Conclusion. Future work includes limitations of sparse retrieval.",
+]
+
+
+def _all_fields(plan):
+    return [name for names, _ in plan for name in names]
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert retrieval.tokenize("BM25 Index, v2!") == ["bm25", "index", "v2"]
+    assert retrieval.tokenize("数据集") == ["数据", "据集"]
+    assert retrieval.tokenize("表") == ["表"]
+
+
+def test_field_query_expands_chinese_field_names():
+    query = retrieval.field_query("作者", "包括通讯作者")
+    assert "author" in query and "email" in query
+    assert "通讯" in query
+
+
+def test_bm25_ranks_matching_passage_first():
+    index = BM25Index(PASSAGES)
+    assert index.top_k(retrieval.field_query("数据集"), 1) == [3]
+    assert index.top_k(retrieval.tokenize("baseline accuracy"), 2)[0] == 4
+
+
+def test_bm25_without_matches_falls_back_to_leading_passages():
+    index = BM25Index(PASSAGES)
+    assert index.top_k(["nonexistent"], 2) == [0, 1]
+
+
+def test_plan_groups_assigns_every_field_once_within_budget():
+    fields = ["标题", "作者", "方法", "数据集", "结果", "结论"]
+    plan = retrieval.plan_groups(PASSAGES, fields, RetrievalOptions(top_k=2), max_passages=4)
+    assert sorted(_all_fields(plan)) == sorted(fields)
+    for names, indexes in plan:
+        assert len(indexes) <= 4
+        assert indexes == sorted(set(indexes))
+        # 默认总是包含开头段落（标题、作者、摘要）
+        assert 0 in indexes
+
+
+def test_plan_groups_merges_fields_with_the_same_passages():
+    plan = retrieval.plan_groups(PASSAGES, ["标题", "作者", "摘要"], RetrievalOptions(top_k=1), max_passages=2)
+    assert len(plan) == 1
+    assert plan[0][0] == ["标题", "作者", "摘要"]
+
+
+def test_plan_groups_splits_when_passages_exceed_budget():
+    plan = retrieval.plan_groups(PASSAGES, ["方法", "数据集", "结果"], RetrievalOptions(top_k=1, include_lead=False), max_passages=1)
+    assert [names for names, _ in plan] == [["方法"], ["数据集"], ["结果"]]
+    assert [indexes for _, indexes in plan] == [[2], [3], [4]]
+
+
+def test_plan_groups_single_passage_budget_skips_lead():
+    plan = retrieval.plan_groups(PASSAGES, ["数据集"], RetrievalOptions(top_k=3), max_passages=1)
+    assert plan == [(["数据集"], [3])]
+
+
+def test_plan_groups_uses_field_descriptions():
+    options = RetrievalOptions(top_k=1, include_lead=False, descriptions={"备注": "ArXiv PubMed corpus"})
+    assert retrieval.plan_groups(PASSAGES, ["备注"], options, max_passages=2) == [(["备注"], [3])]
+
+
+def test_build_context_marks_gaps():
+    assert retrieval.build_context(["a", "b", "c", "d"], [0, 1, 3]) == "a\nb\n……\nd"
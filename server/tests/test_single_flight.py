@@ -0,0 +1,142 @@
+"""
+请求合并（single-flight）：follower 共享 leader 的结果与异常，leader 被取消时 follower 重新发起，合并键区分 API Key
+"""
+import threading
+import time
+
+import pytest
+
+from services import hedging, single_flight
+from services.single_flight import SingleFlight
+
+
+def _wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+class _Leader:
+    """阻塞到 release 的 leader 调用"""
+
+    def __init__(self, result=None, error: BaseException = None):
+        self.result = result
+        self.error = error
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(2)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _start_leader(flight: SingleFlight, key: str, leader: _Leader) -> dict:
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = flight.do(key, leader, retry_on=(hedging.HedgeCancelled,))
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    outcome["thread"] = thread
+    _wait_until(lambda: flight.in_flight() == 1)
+    return outcome
+
+
+def _start_follower(flight: SingleFlight, key: str, call) -> dict:
+    outcome = {}
+    followers = flight._calls[key].followers
+
+    def run():
+        try:
+            outcome["value"] = flight.do(key, call, retry_on=(hedging.HedgeCancelled,))
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    outcome["thread"] = thread
+    _wait_until(lambda: key not in flight._calls or flight._calls[key].followers > followers)
+    return outcome
+
+
+def test_follower_shares_leader_result():
+    flight = SingleFlight("test")
+    leader = _Leader(result="answer")
+    first = _start_leader(flight, "k", leader)
+    follower_calls = []
+    second = _start_follower(flight, "k", lambda: follower_calls.append(1))
+    leader.release.set()
+    first["thread"].join(2)
+    second["thread"].join(2)
+
+    assert first["value"] == ("answer", False)
+    assert second["value"] == ("answer", True)
+    assert leader.calls == 1
+    assert follower_calls == []
+    assert flight.in_flight() == 0
+
+
+def test_follower_receives_leader_error():
+    flight = SingleFlight("test")
+    leader = _Leader(error=ValueError("bad request"))
+    first = _start_leader(flight, "k", leader)
+    second = _start_follower(flight, "k", lambda: "unused")
+    leader.release.set()
+    first["thread"].join(2)
+    second["thread"].join(2)
+
+    assert isinstance(first["error"], ValueError)
+    assert second["error"] is first["error"]
+
+
+def test_follower_retries_when_leader_is_cancelled():
+    flight = SingleFlight("test")
+    leader = _Leader(error=hedging.HedgeCancelled())
+    first = _start_leader(flight, "k", leader)
+    second = _start_follower(flight, "k", lambda: "retried")
+    leader.release.set()
+    first["thread"].join(2)
+    second["thread"].join(2)
+
+    assert isinstance(first["error"], hedging.HedgeCancelled)
+    # leader 落败被取消时 follower 不共享取消异常，而是作为新的 leader 自己发起
+    assert second["value"] == ("retried", False)
+
+
+def test_different_keys_are_not_merged():
+    flight = SingleFlight("test")
+    leader = _Leader(result="a")
+    first = _start_leader(flight, "a", leader)
+    assert flight.do("b", lambda: "b") == ("b", False)
+    leader.release.set()
+    first["thread"].join(2)
+    assert first["value"] == ("a", False)
+
+
+def test_completed_calls_are_not_cached():
+    flight = SingleFlight("test")
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+
+
+def test_prompt_key_covers_request_parameters():
+    base = ("invoke", "prompt", "model", "https://api.example.com/v1", 0.1, ["标题"], "sk-one")
+    key = single_flight.prompt_key(*base)
+    assert single_flight.prompt_key(*base) == key
+    for index, value in enumerate(["stream", "other prompt", "other-model", "https://other.example.com/v1", 0.7, ["作者"], "sk-two"]):
+        changed = list(base)
+        changed[index] = value
+        assert single_flight.prompt_key(*changed) != key, f"参数 {index} 未计入合并键"
+
+
+def test_run_bypasses_merging_when_disabled(monkeypatch):
+    monkeypatch.setenv("PAPER_EXTRACT_SINGLE_FLIGHT", "0")
+    assert single_flight.run("invoke", "p", "m", "", 0.1, None, lambda: "direct") == ("direct", False)
@@ -0,0 +1,120 @@
+"""
+文本规范化：页眉页脚与页码的删除规则（只删除跨页重复、随页序号递增的页码）、断行连字符、参考文献 / 附录
+"""
+from services import text_normalizer
+from services.text_normalizer import NormalizeOptions
+
+
+_WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliett", "kilo", "lima"]
+
+
+def _page(index: int, footer: str = "", header: str = "") -> str:
+    # 正文各行内容互不相同（页眉页脚检测按忽略数字后的行签名比较）
+    body = [f"The {_WORDS[(index + line) % len(_WORDS)]} {_WORDS[(index * 3 + line * 5) % len(_WORDS)]} section {line}." for line in range(8)]
+    return "\n".join(([header] if header else []) + body + ([footer] if footer else []))
+
+
+def _lines(pages):
+    return [line for page in pages for line in page.split("\n")]
+
+
+def test_sequential_page_numbers_are_removed():
+    pages = [_page(i, footer=str(i + 1)) for i in range(5)]
+    cleaned, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 5
+    assert not any(line.strip().isdigit() for line in _lines(cleaned))
+
+
+def test_page_numbers_with_offset_are_removed():
+    # 正文从第 11 页开始编号（前面是封面、目录等）
+    pages = [_page(i, footer=str(i + 11)) for i in range(5)]
+    _, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 5
+
+
+def test_page_number_formats():
+    formats = [
+        lambda n: f"Page {n} of 5",
+        lambda n: f"{n} / 5",
+        lambda n: f"- {n} -",
+        lambda n: f"第 {n} 页",
+        lambda n: ["i", "ii", "iii", "iv", "v"][n - 1],
+    ]
+    for fmt in formats:
+        pages = [_page(i, footer=fmt(i + 1)) for i in range(5)]
+        cleaned, removed = text_normalizer.strip_headers_footers(pages)
+        assert removed == 5, fmt(1)
+        assert all(fmt(i + 1) not in page.split("\n") for i, page in enumerate(cleaned))
+
+
+def test_numbers_not_following_page_order_are_kept():
+    # 每页边缘都出现但不随页序号递增的数字（表格单元格、年份）不是页码
+    pages = [_page(i, footer="2019") for i in range(5)]
+    cleaned, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 0
+    assert cleaned == pages
+
+    pages = [_page(i, footer=str(n)) for i, n in enumerate([7, 3, 12, 8, 20])]
+    _, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 0
+
+
+def test_isolated_number_on_one_page_is_kept():
+    pages = [_page(i) for i in range(5)]
+    pages[2] = _page(2, footer="3")
+    _, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 0
+
+
+def test_numbers_inside_body_are_never_removed():
+    pages = []
+    for i in range(5):
+        lines = _page(i).split("\n")
+        lines.insert(4, str(i + 1))
+        pages.append("\n".join(lines))
+    _, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 0
+
+
+def test_repeated_headers_are_removed_ignoring_numbers():
+    pages = [_page(i, header=f"Journal of Testing, Vol. 12, pp. {100 + i}", footer=str(i + 1)) for i in range(5)]
+    cleaned, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 10
+    assert not any("Journal of Testing" in line for line in _lines(cleaned))
+
+
+def test_short_documents_are_left_alone():
+    pages = [_page(i, header="Running Title", footer=str(i + 1)) for i in range(text_normalizer.MIN_PAGES_FOR_HEADERS - 1)]
+    cleaned, removed = text_normalizer.strip_headers_footers(pages)
+    assert removed == 0
+    assert cleaned == pages
+
+
+def test_page_number_key_is_constant_for_real_page_numbers():
+    keys = {text_normalizer._page_number_key(f"Page {i + 3}", i) for i in range(5)}
+    assert len(keys) == 1
+    assert text_normalizer._page_number_key("iv", 1) == text_normalizer._page_number_key("v", 2)
+    assert text_normalizer._page_number_key("4", 1) != text_normalizer._page_number_key("Page 4", 1)
+
+
+def test_roman_value():
+    assert [text_normalizer._roman_value(s) for s in ["i", "iv", "ix", "xiv", "xxxix"]] == [1, 4, 9, 14, 39]
+
+
+def test_normalize_pages_dehyphenates_and_collapses_whitespace():
+    result = text_normalizer.normalize_pages(["An extrac-\ntion   method\n\n\n\nworks."])
+    assert result.text == "An extraction method\n\nworks."
+    assert result.stats["hyphens_joined"] == 1
+
+
+def test_normalize_pages_drops_references_only_when_enabled():
+    pages = ["Introduction\n" + "Body text. " * 50 + "\nReferences\n[1] A. Author. Paper. 2020."]
+    assert "[1] A. Author" in text_normalizer.normalize_pages(pages).text
+    result = text_normalizer.normalize_pages(pages, NormalizeOptions(drop_references=True))
+    assert "[1] A. Author" not in result.text
+    assert result.stats["references_chars"] > 0
+
+
+def test_disabled_normalization_returns_raw_text():
+    pages = ["a  b", "c-\nd"]
+    assert text_normalizer.normalize_pages(pages, NormalizeOptions(enabled=False)).text == "a  b\nc-\nd"